@@ -1,26 +1,20 @@
 import os
 import json
 import sys
-import re
-from dotenv import load_dotenv
-from google import genai
-from google.genai import types
-import httpx
-
-# Load environment variables
-load_dotenv(os.path.join(os.path.expanduser("~"), ".passkey", ".env"))
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-
-if not GOOGLE_API_KEY:
-    print("Error: Missing GOOGLE_API_KEY in .env file")
-    sys.exit(1)
-
-# Configure Gemini API
-try:
-    client = genai.Client(api_key=GOOGLE_API_KEY)
-except Exception as e:
-    print(f"Error configuring Gemini API: {e}")
-    sys.exit(1)
+from pathlib import Path
+from document_sessions import DocumentSessions, GeminiFileStore
+from gemini_common import get_client
+from http_download import download_pdf
+from make_abridged_pdf_v2 import abridge_pdf_bytes
+from report_extraction import analyze_pdf_bytes
+from response_cache import ResponseCache
+
+# The Gemini client (and google.genai) is created on first use by gemini_common.get_client,
+# so importing this module neither needs GOOGLE_API_KEY nor pays for the genai import.
+TEMPERATURE = 0.3
+ABRIDGE_LOG = "abridge_stats.jsonl"  # pages/bytes saved per document when abridging before upload
+response_cache = ResponseCache()
+document_sessions = DocumentSessions(GeminiFileStore())  # upload-once handles, used with upload_once=True
 
 
 def read_prompt(file_path="annuals.txt"):
@@ -33,49 +27,46 @@ def read_prompt(file_path="annuals.txt"):
         sys.exit(1)
 
 
-def analyze_text_with_gemini(url_path):
-    """Send extracted text to Gemini AI and get structured JSON data, with improved error handling."""
+def record_abridge_stats(url_path, stats, log_path=ABRIDGE_LOG):
+    """Print and append the pages/bytes saved by abridging one document to a JSONL log."""
+    print(f"Abridged {url_path}: {stats['pages_before']} -> {stats['pages_after']} pages, "
+          f"{stats['bytes_before']} -> {stats['bytes_after']} bytes"
+          + (" (fallback to full document)" if stats["fallback"] else ""))
+    with open(log_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"url": url_path, **stats}) + "\n")
+
+
+def analyze_text_with_gemini(url_path, use_cache=True, refresh=False, abridge=False, upload_once=False):
+    """
+    Send extracted text to Gemini AI and get structured JSON data, with improved error handling.
+
+    Results are cached on disk by PDF content, prompt, model and temperature.
+    Set `use_cache=False` to bypass the cache, or `refresh=True` to re-call Gemini and overwrite the entry.
+    With `abridge=True` only the pages selected by `make_abridged_pdf_v2` are sent.
+    With `upload_once=True` the PDF is uploaded once and reused by reference while iterating on the prompt.
+    """
     try:
-        doc_data = httpx.get(url_path).content
+        # streamed to a local spool file; a repeat run gets a 304 and reuses it
+        doc_path, downloaded = download_pdf(url_path)
+        print(f"{'Downloaded' if downloaded else 'Not modified, reusing'} {url_path} -> {doc_path}")
+        doc_data = Path(doc_path).read_bytes()
+        if abridge:
+            doc_data, stats = abridge_pdf_bytes(doc_data)
+            record_abridge_stats(url_path, stats)
         prompt = read_prompt()
 
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            config=types.GenerateContentConfig(temperature=0.3),
-            contents=[
-                types.Part.from_bytes(
-                    data=doc_data,
-                    mime_type='application/pdf',
-                ),
-                prompt
-            ]
-        )
-
-        print(response.usage_metadata)
-
-        match = re.search(r"\{.*}", response.text, re.DOTALL)
-        if match:
-            json_text = match.group(0)
-        else:
-            print("ERROR: Could not extract JSON from Gemini response.")
-            json_text = "{}"
-
-        try:
-            json_data = json.loads(json_text)
-            return json_data
-
-        except json.JSONDecodeError as e:
-            print(f"ERROR: JSON decoding error: {e}")
-            return {}
+        return analyze_pdf_bytes(doc_data, prompt, None, TEMPERATURE,
+                                 cache=response_cache if use_cache else None, refresh=refresh, label=url_path,
+                                 sessions=document_sessions if upload_once else None)
 
     except Exception as e:
         print(f"ERROR: Gemini processing failed: {e}")
         return {}
 
 
-def from_db_link(url_path):
+def from_db_link(url_path, abridge=False, upload_once=False):
     print(f"Processing PDF: {url_path}")
-    structured_data = analyze_text_with_gemini(url_path)
+    structured_data = analyze_text_with_gemini(url_path, abridge=abridge, upload_once=upload_once)
 
     pdf_file_name = os.path.splitext(os.path.basename(url_path))[0]
     output_file = f"{pdf_file_name}_extracted.json"
@@ -89,5 +80,13 @@ def from_db_link(url_path):
 
 
 if __name__ == "__main__":
+    try:
+        get_client()
+    except Exception as e:
+        print(f"Error configuring Gemini API: {e}")
+        sys.exit(1)
     url_path = "https://anns.sgp1.cdn.digitaloceanspaces.com/3443412.pdf"
-    from_db_link(url_path)
+    from_db_link(url_path, abridge=os.getenv("ABRIDGE_BEFORE_UPLOAD") == "1", upload_once=os.getenv("UPLOAD_ONCE") == "1")
+    print("Gemini cache: ", response_cache.stats())
+    if document_sessions.counters:
+        print("Uploads: ", dict(document_sessions.counters))
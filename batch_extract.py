@@ -0,0 +1,231 @@
+"""
+Asynchronous batch extraction over many annual reports.
+
+Fans out `generate_content` calls with bounded concurrency, a requests-per-minute /
+tokens-per-minute limiter fed by `usage_metadata`, and exponential backoff on 429/5xx.
+Results are yielded as each document finishes.
+
+Usage:
+    python batch_extract.py report1.pdf https://.../3443412.pdf ... [--concurrency 4] [--rpm 15] [--tpm 1000000]
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import sys
+import time
+
+from gemini_common import MODEL_NAME, get_client, parse_json_response
+from response_cache import ResponseCache, cache_key, usage_to_dict
+
+RETRY_CODES = {429, 500, 502, 503, 504}
+DEFAULT_TOKEN_ESTIMATE = 50000  # Tokens assumed for a request before any usage has been observed
+
+
+def error_code(error):
+    """HTTP status of an API error (`google.genai.errors.APIError.code`), or None."""
+    return getattr(error, "code", None) or getattr(error, "status_code", None)
+
+
+class RateLimiter:
+    """
+    Sliding one-minute window over requests and tokens.
+
+    `acquire` waits until one more request (with its estimated token count) fits in the
+    window and returns a reservation; `record` replaces the estimate with the real
+    `usage_metadata.total_token_count` once the response arrives.
+
+    Args:
+        requests_per_minute (int): Request cap per window, or None for no cap.
+        tokens_per_minute (int): Token cap per window, or None for no cap.
+        window (float): Window length in seconds.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, window=60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self._events = collections.deque()  # [timestamp, tokens] per request in the window
+        self._lock = asyncio.Lock()
+        self._observed_tokens = 0
+        self._observed_requests = 0
+
+    def estimate_tokens(self):
+        """Average tokens per request seen so far."""
+        if not self._observed_requests:
+            return DEFAULT_TOKEN_ESTIMATE
+        return self._observed_tokens // self._observed_requests
+
+    def _prune(self, now):
+        while self._events and self._events[0][0] <= now - self.window:
+            self._events.popleft()
+
+    async def acquire(self, estimated_tokens=None):
+        if estimated_tokens is None:
+            estimated_tokens = self.estimate_tokens()
+        while True:
+            async with self._lock:
+                now = time.monotonic()
+                self._prune(now)
+                used_tokens = sum(tokens for _, tokens in self._events)
+                requests_ok = self.requests_per_minute is None or len(self._events) < self.requests_per_minute
+                # an empty window always admits one request, even if it is larger than the cap
+                tokens_ok = (self.tokens_per_minute is None or not self._events
+                             or used_tokens + estimated_tokens <= self.tokens_per_minute)
+                if requests_ok and tokens_ok:
+                    reservation = [now, estimated_tokens]
+                    self._events.append(reservation)
+                    return reservation
+                wait = self._events[0][0] + self.window - now
+            await asyncio.sleep(max(wait, 0.01))
+
+    def record(self, reservation, total_tokens):
+        if total_tokens is None:
+            return
+        reservation[1] = total_tokens
+        self._observed_tokens += total_tokens
+        self._observed_requests += 1
+
+
+async def load_pdf(source, http_client=None):
+    """Read a local PDF, or download it when `source` is an http(s) URL."""
+    if source.startswith(("http://", "https://")):
+        response = await http_client.get(source)
+        response.raise_for_status()
+        return response.content
+    return await asyncio.to_thread(_read_bytes, source)
+
+
+def _read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def generate_with_backoff(client, contents, config, limiter, model=MODEL_NAME,
+                                max_retries=5, base_delay=2.0, max_delay=60.0):
+    """
+    Call `client.aio.models.generate_content`, retrying 429/5xx with exponential backoff and jitter.
+
+    Returns (response, attempts).
+    """
+    for attempt in range(max_retries + 1):
+        reservation = await limiter.acquire()
+        try:
+            response = await client.aio.models.generate_content(model=model, config=config, contents=contents)
+        except Exception as e:
+            reservation[1] = 0  # failed calls do not count against the token budget
+            if error_code(e) not in RETRY_CODES or attempt == max_retries:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * (0.5 + random.random() / 2)
+            print(f"Retrying after error {error_code(e)} in {delay:.1f}s (attempt {attempt + 1})")
+            await asyncio.sleep(delay)
+            continue
+
+        usage = getattr(response, "usage_metadata", None)
+        limiter.record(reservation, getattr(usage, "total_token_count", None))
+        return response, attempt + 1
+
+
+async def extract_one(source, client, prompt, semaphore, limiter, http_client=None, cache=None,
+                      model=MODEL_NAME, temperature=0.3, max_retries=5):
+    """Extract one document. Always returns a result dict; failures are reported in `error`."""
+    from google.genai import types
+
+    result = {"source": source, "data": {}, "usage_metadata": None, "attempts": 0,
+              "cached": False, "error": None, "seconds": 0.0}
+    start = time.perf_counter()
+    async with semaphore:
+        try:
+            pdf_bytes = await load_pdf(source, http_client)
+            key = cache_key(pdf_bytes, prompt, model, temperature)
+            cached = cache.get(key) if cache is not None else None
+            if cached is not None:
+                result.update(data=cached["json_data"], usage_metadata=cached["usage_metadata"], cached=True)
+            else:
+                contents = [types.Part.from_bytes(data=pdf_bytes, mime_type="application/pdf"), prompt]
+                config = types.GenerateContentConfig(temperature=temperature)
+                response, attempts = await generate_with_backoff(client, contents, config, limiter, model,
+                                                                 max_retries=max_retries)
+                json_data = parse_json_response(response.text)
+                if cache is not None and isinstance(json_data, dict) and json_data:  # a failed parse is not cached
+                    cache.put(key, response.text, json_data, response.usage_metadata)
+                result.update(data=json_data, usage_metadata=usage_to_dict(response.usage_metadata),
+                              attempts=attempts)
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+async def extract_batch(sources, client, prompt, concurrency=4, requests_per_minute=None,
+                        tokens_per_minute=None, cache=None, model=MODEL_NAME, temperature=0.3, max_retries=5):
+    """
+    Extract every source concurrently, yielding each result dict as soon as it finishes.
+
+    Args:
+        sources (list): Local PDF paths and/or http(s) URLs.
+        client: A `genai.Client`, or any object with the same `aio.models.generate_content` interface
+            (e.g. `fake_genai.FakeClient`).
+        prompt (str): Extraction prompt sent with every document.
+        concurrency (int): Maximum number of documents in flight.
+        requests_per_minute (int): Request cap, or None.
+        tokens_per_minute (int): Token cap fed by `usage_metadata`, or None.
+        cache (ResponseCache): Optional response cache.
+    """
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    async with httpx.AsyncClient(follow_redirects=True, timeout=120) as http_client:
+        tasks = [asyncio.ensure_future(extract_one(source, client, prompt, semaphore, limiter, http_client, cache,
+                                                   model, temperature, max_retries))
+                 for source in sources]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+async def main(args):
+    from job_runner import job_name
+
+    with open(args.prompt_file, "r", encoding="utf-8") as f:
+        prompt = f.read()
+    cache = None if args.no_cache else ResponseCache()
+    # named up front in source order, so sources sharing a basename get stable, distinct outputs
+    names = {}
+    for source in args.sources:
+        names.setdefault(source, job_name(source, names.values()))
+
+    failed = 0
+    async for result in extract_batch(args.sources, get_client(), prompt, args.concurrency, args.rpm, args.tpm,
+                                      cache, temperature=args.temperature):
+        if result["error"]:
+            failed += 1
+            print(f"ERROR: {result['source']}: {result['error']}")
+            continue
+
+        output_file = os.path.join(args.output_dir, f"{names[result['source']]}_extracted.json")
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(result["data"], f, indent=4, ensure_ascii=False)
+        print(f"Done {result['source']} in {result['seconds']:.1f}s (cached={result['cached']}) -> {output_file}")
+
+    print(f"Processed {len(args.sources)} documents, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract many annual reports concurrently with Gemini.")
+    parser.add_argument("sources", nargs="+", help="local PDF paths or URLs")
+    parser.add_argument("--prompt-file", default="annuals.txt")
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rpm", type=int, default=None, help="requests per minute")
+    parser.add_argument("--tpm", type=int, default=None, help="tokens per minute")
+    parser.add_argument("--temperature", type=float, default=0.3)
+    parser.add_argument("--no-cache", action="store_true", help="bypass the response cache")
+    sys.exit(asyncio.run(main(parser.parse_args())))
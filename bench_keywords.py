@@ -0,0 +1,81 @@
+"""
+Micro-benchmark: KeywordMatcher vs. the repeated `any(keyword in title.lower())` scans.
+
+Builds a large corpus of synthetic page titles, classifies every title both ways with
+the v2 keyword lists, checks that the decisions are identical and prints the timings.
+
+Usage:
+    python bench_keywords.py [number_of_titles]
+"""
+import random
+import sys
+import time
+
+from make_abridged_pdf_v2 import (build_matcher, exclude_keywords, finance_keywords,
+                                  possible_keywords, statement_keywords)
+
+FILLER_WORDS = ["the", "of", "and", "group", "company", "berhad", "annual", "report", "2023",
+                "review", "board", "performance", "statements", "notes", "profile", "revenue",
+                "property", "plant", "equipment", "cash", "flows", "income", "other", "information"]
+
+
+def synthetic_titles(count, seed=0):
+    """Random titles mixing filler words with keywords from every list."""
+    rng = random.Random(seed)
+    keywords = possible_keywords + exclude_keywords + statement_keywords + finance_keywords
+    titles = []
+    for _ in range(count):
+        words = [rng.choice(FILLER_WORDS) for _ in range(rng.randint(0, 12))]
+        for _ in range(rng.randint(0, 2)):
+            words.insert(rng.randint(0, len(words)), rng.choice(keywords))
+        titles.append(" ".join(words).title())
+    return titles
+
+
+def classify_any(title):
+    # the scans split_into_sections used before KeywordMatcher
+    if any(keyword in title.lower() for keyword in possible_keywords) and not any(keyword in title.lower() for keyword in exclude_keywords):
+        if any(keyword in title.lower() for keyword in statement_keywords):
+            return "statement"
+        return "match"
+    if any(keyword in title.lower() for keyword in exclude_keywords):
+        return "exclude"
+    return "other"
+
+
+def classify_matcher(title, matcher):
+    hits = matcher.match(title)
+    if "possible" in hits and "exclude" not in hits:
+        if "statement" in hits:
+            return "statement"
+        return "match"
+    if "exclude" in hits:
+        return "exclude"
+    return "other"
+
+
+def main(count):
+    titles = synthetic_titles(count)
+
+    start = time.perf_counter()
+    expected = [classify_any(title) for title in titles]
+    any_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matcher = build_matcher()  # compile cost is part of the run
+    actual = [classify_matcher(title, matcher) for title in titles]
+    matcher_seconds = time.perf_counter() - start
+
+    if actual != expected:
+        mismatches = sum(a != e for a, e in zip(actual, expected))
+        print(f"ERROR: {mismatches} titles classified differently")
+        sys.exit(1)
+
+    print(f"titles:          {count}")
+    print(f"any() scans:     {any_seconds:.3f}s")
+    print(f"KeywordMatcher:  {matcher_seconds:.3f}s")
+    print(f"speedup:         {any_seconds / matcher_seconds:.2f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
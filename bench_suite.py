@@ -0,0 +1,226 @@
+"""
+Benchmark suite for the abridging and post-processing stages, run on synthetic reports.
+
+Covers extract_titles_from_pdf and split_into_sections (v1 and v2), check_segments, the
+outline selection, the scored page selection, doc.select + save, calculate_percentage and
+its bulk version, and the import cost of a fresh worker process per entry module. Timings
+are the best of `--repeat` runs. Results can be saved as a baseline; later runs are compared with it and
+any stage slower than the baseline by more than `--tolerance` is reported as a regression
+(exit code 1). Timings are machine specific, so the baseline is not committed: a benchmark
+missing from the baseline (all of them on a fresh checkout) is recorded by the run that first
+measures it.
+
+Usage:
+    python bench_suite.py [--pages 50 300 1000] [--repeat 3]
+    python bench_suite.py --save-baseline          # record bench_baseline.json again
+    python bench_suite.py --baseline bench_baseline.json --tolerance 0.25
+    python bench_suite.py --startup-only           # only the worker import times
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+
+import fitz  # pymupdf is imported as fitz
+
+import bulk_percentages
+import make_abridged_pdf as v1
+import make_abridged_pdf_v2 as v2
+import page_scoring
+from page_cache import PageTextCache
+from report_extraction import calculate_percentage
+from synthetic_report import make_report
+from toc_selection import select_pages_from_toc
+
+REPORT_DIR = os.path.join(".cache", "synthetic")
+DEFAULT_BASELINE = "bench_baseline.json"
+CALC_REPORTS = 2000  # Extraction results fed to calculate_percentage
+
+# worker kind -> module it imports on startup
+WORKER_IMPORTS = {
+    "abridge": "make_abridged_pdf_v2",
+    "extract": "report_extraction",
+    "pipeline": "pipeline",
+    "job_runner": "job_runner",
+    "gemini_script": "annual_report_g_pdf",
+}
+HEAVY_MODULES = ["google.genai", "httpx", "dotenv"]  # reported when a worker import pulls them in
+
+
+def report_path(pages, seed=0):
+    """Path of a synthetic report, generated on first use."""
+    path = os.path.join(REPORT_DIR, f"report_{pages}p_seed{seed}.pdf")
+    if not os.path.exists(path):
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        print(f"Generating {path} ...")
+        make_report(pages, seed).save(path, garbage=3, deflate=True)
+    return path
+
+
+def best_of(repeat, fn):
+    """Best wall time of `repeat` runs of fn(), and the result of the last run."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def bench_report(pages, repeat):
+    path = report_path(pages)
+    results = {}
+
+    results["extract_titles_v1"], titles_v1 = best_of(repeat, lambda: v1.extract_titles_from_pdf(path))
+    results["split_into_sections_v1"], _ = best_of(repeat, lambda: v1.split_into_sections(titles_v1))
+
+    def titles_v2():
+        with PageTextCache(path) as cache:
+            return v2.extract_titles_from_pdf(path, cache)
+    results["extract_titles_v2"], titles = best_of(repeat, titles_v2)
+
+    matcher = v2.build_matcher()
+    statement_pages = [n for n, title in enumerate(titles) if "statement" in matcher.match(title)]
+
+    def check_all():
+        # cold cache: every statement page is parsed once
+        with PageTextCache(path) as cache:
+            return [v2.check_segments(n, path, cache, matcher) for n in statement_pages]
+    results["check_segments"], _ = best_of(repeat, check_all)
+
+    with PageTextCache(path) as cache:
+        v2.extract_titles_from_pdf(path, cache)
+        results["split_into_sections_v2"], page_numbers = best_of(
+            repeat, lambda: v2.split_into_sections(titles, path, cache, matcher))
+
+    with PageTextCache(path) as cache:
+        texts = [cache.text(page_num) for page_num in range(len(cache))]
+    results["score_pages"], rows = best_of(repeat, lambda: page_scoring.score_pages(texts))
+    results["select_pages_by_score"], _ = best_of(repeat, lambda: page_scoring.select_pages_by_score(rows, 40))
+
+    with fitz.open(path) as doc:
+        toc = doc.get_toc()
+    results["select_pages_from_toc"], _ = best_of(repeat, lambda: select_pages_from_toc(toc, len(titles), matcher))
+
+    def select_save():
+        with fitz.open(path) as doc:
+            doc.select(page_numbers)
+            return doc.tobytes(garbage=3, deflate=True)
+    results["select_save"], _ = best_of(repeat, select_save)
+
+    return {f"{name}[{pages}p]": seconds for name, seconds in results.items()}
+
+
+def synthetic_extractions(count, seed=0):
+    """Extraction results shaped like the Gemini output, including None revenues."""
+    rng = random.Random(seed)
+
+    def rows(key, n):
+        return [{key: f"{key} {i}", "total_revenue": rng.choice([None, 0, rng.uniform(1, 1e6)])} for i in range(n)]
+    return [{"geographical_segments": rows("segment", rng.randint(0, 6)),
+             "business_segments": rows("segment", rng.randint(0, 6)),
+             "major_customers": rows("customer name", rng.randint(0, 4))} for _ in range(count)]
+
+
+def bench_calculate_percentage(repeat):
+    data = synthetic_extractions(CALC_REPORTS)
+    seconds, _ = best_of(repeat, lambda: [calculate_percentage(item) for item in data])
+    reports = [(str(i), item) for i, item in enumerate(data)]
+    bulk_seconds, _ = best_of(repeat, lambda: bulk_percentages.process(reports))
+    return {f"calculate_percentage[{CALC_REPORTS} reports]": seconds,
+            f"bulk_percentages[{CALC_REPORTS} reports]": bulk_seconds}
+
+
+def _import_seconds(module):
+    # a fresh interpreter per measurement, so nothing is already in sys.modules; the dummy key
+    # lets scripts that check GOOGLE_API_KEY at import time get through
+    code = ("import sys, time\n"
+            "start = time.perf_counter()\n"
+            f"import {module}\n"
+            "seconds = time.perf_counter() - start\n"
+            f"print(seconds, *[name for name in {HEAVY_MODULES!r} if name in sys.modules])")
+    env = {**os.environ, "GOOGLE_API_KEY": os.environ.get("GOOGLE_API_KEY", "bench-dummy-key")}
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed: {(result.stderr or result.stdout).strip()}")
+    seconds, *heavy = result.stdout.splitlines()[-1].split()  # the last line; imports may print before it
+    return float(seconds), heavy
+
+
+def bench_startup(repeat):
+    """Import time of each worker entry module in a fresh interpreter."""
+    results = {}
+    for worker, module in WORKER_IMPORTS.items():
+        best = None
+        for _ in range(repeat):
+            seconds, heavy = _import_seconds(module)
+            best = seconds if best is None else min(best, seconds)
+        print(f"import {module}: {best:.3f}s" + (f", loads {', '.join(heavy)}" if heavy else ""))
+        results[f"startup[{worker}]"] = best
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print current vs. baseline timings; returns the names of regressed benchmarks."""
+    regressions = []
+    print(f"{'benchmark':<44}{'seconds':>10}{'baseline':>10}{'ratio':>8}")
+    for name, seconds in results.items():
+        base = baseline.get(name)
+        if base:
+            ratio = seconds / base
+            flag = "  REGRESSION" if ratio > 1 + tolerance else ""
+            if flag:
+                regressions.append(name)
+            print(f"{name:<44}{seconds:>10.4f}{base:>10.4f}{ratio:>8.2f}{flag}")
+        else:
+            print(f"{name:<44}{seconds:>10.4f}{'-':>10}{'-':>8}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the abridging stages on synthetic reports.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 300, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these timings as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging, 0.25 = 25%%")
+    parser.add_argument("--startup-only", action="store_true", help="only measure the worker import times")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    results = {}
+    if not args.startup_only:
+        for pages in args.pages:
+            results.update(bench_report(pages, args.repeat))
+        results.update(bench_calculate_percentage(args.repeat))
+    results.update(bench_startup(args.repeat))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+
+    missing = {name: seconds for name, seconds in results.items() if name not in baseline}
+    if args.save_baseline or missing:
+        baseline.update(results if args.save_baseline else missing)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}" + ("" if args.save_baseline else
+                                                     f" ({len(missing)} benchmarks without a baseline recorded)"))
+    if args.save_baseline:
+        return 0
+    if regressions:
+        print(f"{len(regressions)} regression(s) against {args.baseline}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
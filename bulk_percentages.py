@@ -0,0 +1,153 @@
+"""
+Recomputes percentages over a whole archive of extraction results at once.
+
+Loads every `*_pdf.json` of a directory, fills in the percentages with
+`report_extraction.calculate_percentage`, then writes the `*_calc.json` files and/or a single
+per-report summary table.
+
+The rules are those of `report_extraction.calculate_percentage`:
+    - a missing, null or empty list is left untouched;
+    - items with a null `total_revenue` get percentage 0 and do not count towards the total;
+    - when the total is not positive, every item gets percentage 0.
+Reports that `calculate_percentage` would fail on (a list that is not a list of objects,
+a revenue that is not a number) are reported and skipped.
+
+Usage:
+    python bulk_percentages.py [json] [--output-dir json] [--table calc_summary.csv] [--no-json]
+"""
+import argparse
+import copy
+import csv
+import glob
+import json
+import os
+import sys
+
+from report_extraction import calculate_percentage
+
+SEGMENT_LISTS = ["geographical_segments", "business_segments", "major_customers"]
+INPUT_SUFFIX = "_pdf.json"
+OUTPUT_SUFFIX = "_calc.json"
+
+
+def load_reports(json_dir):
+    """Returns [(name, data)] for every `<name>_pdf.json` in `json_dir`, sorted by name."""
+    reports = []
+    for path in sorted(glob.glob(os.path.join(json_dir, "*" + INPUT_SUFFIX))):
+        name = os.path.basename(path)[:-len(INPUT_SUFFIX)]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                reports.append((name, json.load(f)))
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"ERROR: Could not read {path}: {e}")
+    return reports
+
+
+def _is_number(value):
+    return isinstance(value, (int, float))
+
+
+def invalid_reason(data):
+    """Why `calculate_percentage` would fail on `data`, or None."""
+    if not isinstance(data, dict):
+        return "not a JSON object"
+    for key in SEGMENT_LISTS:
+        items = data.get(key)
+        if not items:
+            continue
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            return f"{key} is not a list of objects"
+        if not all(item.get("total_revenue") is None or _is_number(item["total_revenue"]) for item in items):
+            return f"{key} has a total_revenue that is not a number"
+    return None
+
+
+def summarize(data):
+    """Per-list total, item count and largest share of one report with its percentages filled in."""
+    row = {}
+    for key in SEGMENT_LISTS:
+        items = data.get(key) or []
+        revenues = [item["total_revenue"] for item in items if item.get("total_revenue") is not None]
+        row[f"{key}_total"] = sum(revenues) if items else None
+        row[f"{key}_count"] = len(items)
+        row[f"{key}_top_share"] = max([0] + [item["percentage"] for item in items]) if items else None
+    return row
+
+
+def compute(reports, write_back=True):
+    """
+    Fills in the percentages of every report in place with `calculate_percentage` (unless
+    `write_back` is False, e.g. when only the summary table is wanted).
+
+    Raises ValueError, before changing anything, when a report is not valid (see `invalid_reason`).
+
+    Returns:
+        list: One summary row per report (see `summarize`).
+    """
+    for data in reports:
+        reason = invalid_reason(data)
+        if reason:
+            raise ValueError(reason)
+    rows = []
+    for data in reports:
+        if not write_back:
+            data = copy.deepcopy(data)
+        calculate_percentage(data)
+        rows.append(summarize(data))
+    return rows
+
+
+def write_calc_json(names, reports, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    for name, data in zip(names, reports):
+        with open(os.path.join(output_dir, name + OUTPUT_SUFFIX), "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)  # Ensure UTF-8 encoding
+
+
+def write_table(names, summary, path):
+    """One CSV row per report with the totals, item counts and largest share of each segment list."""
+    columns = [f"{key}_{column}" for key in SEGMENT_LISTS for column in ("total", "count", "top_share")]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["report"] + columns)
+        for name, row in zip(names, summary):
+            writer.writerow([name] + ["" if row[column] is None else row[column] for column in columns])
+
+
+def process(reports, write_back=True):
+    """
+    Validates and computes a list of (name, data) reports (see `compute`).
+
+    Returns:
+        tuple: (names, data dicts with percentages, summary rows) of the valid reports.
+    """
+    names, valid = [], []
+    for name, data in reports:
+        reason = invalid_reason(data)
+        if reason:
+            print(f"ERROR: Skipping {name}: {reason}")
+            continue
+        names.append(name)
+        valid.append(data)
+    return names, valid, compute(valid, write_back)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute segment percentages over a directory of extractions.")
+    parser.add_argument("json_dir", nargs="?", default="json")
+    parser.add_argument("--output-dir", help="where the *_calc.json files go; defaults to json_dir")
+    parser.add_argument("--table", help="also write a per-report summary CSV")
+    parser.add_argument("--no-json", action="store_true", help="only write the summary table")
+    args = parser.parse_args(argv)
+
+    names, reports, summary = process(load_reports(args.json_dir), write_back=not args.no_json)
+    if not args.no_json:
+        write_calc_json(names, reports, args.output_dir or args.json_dir)
+    if args.table:
+        write_table(names, summary, args.table)
+    print(f"Recomputed {len(names)} reports")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
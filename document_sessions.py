@@ -0,0 +1,237 @@
+"""
+Upload-once document handles for running many prompts on the same report.
+
+`DocumentSessions` uploads a PDF once through a `FileStore`, remembers the uploaded file
+by the sha256 of the PDF bytes and passes a reference (`types.Part.from_uri`) instead of
+the PDF bytes on every later request, whatever the prompt, model or temperature. The
+registry is kept in a JSON file, so separate runs of a script reuse the same upload.
+Files that expired (Gemini keeps uploads for 48 hours) or disappeared are uploaded again
+transparently.
+
+Stores:
+    GeminiFileStore: the Gemini Files API (`client.files`).
+    Any object with the same `upload` / `get` / `delete` methods, e.g.
+    `GeminiFileStore(fake_genai.FakeClient())` to run offline.
+
+Usage:
+    python document_sessions.py list
+    python document_sessions.py cleanup      # delete every file in the registry
+"""
+import abc
+import collections
+import datetime
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+
+from gemini_common import get_client
+
+DEFAULT_REGISTRY_PATH = os.path.join(".cache", "gemini_files.json")
+EXPIRY_MARGIN_SECONDS = 15 * 60  # Re-upload files that expire this soon, so they do not expire mid-request
+PROCESSING_POLL_SECONDS = 1.0
+MAX_PROCESSING_SECONDS = 300
+STALE_FILE_CODES = {403, 404}  # Errors Gemini returns for a file reference that expired or was deleted
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class FileStore(abc.ABC):
+    """
+    Interface of a remote file store.
+
+    `upload` takes the PDF bytes or the path of a PDF file and returns a dict with name, uri,
+    mime_type and expires_at (ISO 8601, or None when the store does not expire files); `get`
+    returns the same dict, or None when the file is gone.
+    """
+
+    @abc.abstractmethod
+    def upload(self, pdf, display_name):
+        pass
+
+    @abc.abstractmethod
+    def get(self, name):
+        pass
+
+    @abc.abstractmethod
+    def delete(self, name):
+        pass
+
+
+class GeminiFileStore(FileStore):
+    """
+    The Gemini Files API.
+
+    Args:
+        client (genai.Client): Defaults to `gemini_common.get_client()`; a `fake_genai.FakeClient`
+            works as well.
+    """
+
+    def __init__(self, client=None):
+        self.client = client
+
+    def _client(self):
+        if self.client is None:
+            self.client = get_client()
+        return self.client
+
+    @staticmethod
+    def _to_dict(file):
+        expiration_time = getattr(file, "expiration_time", None)
+        return {"name": file.name, "uri": file.uri, "mime_type": file.mime_type,
+                "expires_at": expiration_time.isoformat() if expiration_time else None}
+
+    def upload(self, pdf, display_name):
+        client = self._client()
+        # a path is uploaded from disk without being loaded
+        file = client.files.upload(file=pdf if isinstance(pdf, str) else io.BytesIO(pdf),
+                                   config={"mime_type": "application/pdf", "display_name": display_name})
+        # PDFs are processed after the upload; the file cannot be used before it is ACTIVE
+        deadline = time.monotonic() + MAX_PROCESSING_SECONDS
+        while str(getattr(file, "state", "ACTIVE")).endswith("PROCESSING"):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{file.name} still processing after {MAX_PROCESSING_SECONDS}s")
+            time.sleep(PROCESSING_POLL_SECONDS)
+            file = client.files.get(name=file.name)
+        if str(getattr(file, "state", "ACTIVE")).endswith("FAILED"):
+            raise RuntimeError(f"Processing of {file.name} failed: {getattr(file, 'error', None)}")
+        return self._to_dict(file)
+
+    def get(self, name):
+        try:
+            return self._to_dict(self._client().files.get(name=name))
+        except Exception as e:
+            if getattr(e, "code", None) in STALE_FILE_CODES:
+                return None
+            raise
+
+    def delete(self, name):
+        try:
+            self._client().files.delete(name=name)
+        except Exception as e:
+            if getattr(e, "code", None) not in STALE_FILE_CODES:
+                raise
+
+
+class DocumentSessions:
+    """
+    Registry of uploaded PDFs, keyed by the sha256 of their bytes.
+
+    Counters: `uploads` (first upload of a PDF), `reuses` (request served by an existing
+    upload) and `reuploads` (upload replaced because it expired or was gone).
+
+    Args:
+        store (FileStore): Where the PDFs are uploaded; defaults to `GeminiFileStore()`.
+        registry_path (str): JSON file the handles are kept in, or None to keep them in memory only.
+        expiry_margin (float): Seconds before expiry at which a file counts as expired.
+    """
+
+    def __init__(self, store=None, registry_path=DEFAULT_REGISTRY_PATH, expiry_margin=EXPIRY_MARGIN_SECONDS):
+        self.store = store if store is not None else GeminiFileStore()
+        self.registry_path = registry_path
+        self.expiry_margin = expiry_margin
+        self.counters = collections.Counter()
+        self.files = self._load()
+
+    def _load(self):
+        if not self.registry_path or not os.path.exists(self.registry_path):
+            return {}
+        try:
+            with open(self.registry_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            print(f"File registry {self.registry_path} is corrupt, starting empty")
+            return {}
+
+    def _save(self):
+        if not self.registry_path:
+            return
+        # keep uploads other runs registered since this one started
+        self.files = {**self._load(), **self.files}
+        os.makedirs(os.path.dirname(self.registry_path) or ".", exist_ok=True)
+        tmp_path = self.registry_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.files, f, indent=4)
+        os.replace(tmp_path, self.registry_path)
+
+    def _expired(self, handle):
+        if handle["expires_at"] is None:
+            return False
+        expires_at = datetime.datetime.fromisoformat(handle["expires_at"])
+        return (expires_at - _now()).total_seconds() < self.expiry_margin
+
+    def handle(self, pdf_bytes, display_name="report.pdf"):
+        """Returns the handle of an uploaded copy of `pdf_bytes`, uploading it if needed."""
+        key = hashlib.sha256(pdf_bytes).hexdigest()
+        handle = self.files.get(key)
+        if handle is not None and not self._expired(handle):
+            self.counters["reuses"] += 1
+            return handle
+
+        if handle is not None:
+            print(f"Uploaded copy of {display_name} expired at {handle['expires_at']}, uploading again")
+            self.store.delete(handle["name"])
+            self.counters["reuploads"] += 1
+        else:
+            self.counters["uploads"] += 1
+        handle = self.store.upload(pdf_bytes, display_name)
+        handle.update(sha256=key, display_name=display_name, size=len(pdf_bytes))
+        self.files[key] = handle
+        self._save()
+        return handle
+
+    def expire(self, pdf_bytes):
+        """Marks the upload of `pdf_bytes` as expired, e.g. after a request found it gone; the next use re-uploads."""
+        handle = self.files.get(hashlib.sha256(pdf_bytes).hexdigest())
+        if handle is not None:
+            handle["expires_at"] = _now().isoformat()
+
+    def part(self, pdf_bytes, display_name="report.pdf"):
+        """The `contents` part referring to the uploaded PDF."""
+        from google.genai import types
+
+        handle = self.handle(pdf_bytes, display_name)
+        return types.Part.from_uri(file_uri=handle["uri"], mime_type=handle["mime_type"])
+
+    def generate_content(self, client, model, config, pdf_bytes, prompt, display_name="report.pdf"):
+        """
+        `client.models.generate_content` with the PDF passed by reference.
+
+        A request rejected because the file expired or was deleted remotely is sent once more
+        after a new upload.
+        """
+        try:
+            return client.models.generate_content(model=model, config=config,
+                                                  contents=[self.part(pdf_bytes, display_name), prompt])
+        except Exception as e:
+            if getattr(e, "code", None) not in STALE_FILE_CODES:
+                raise
+            print(f"Uploaded copy of {display_name} is no longer available ({e})")
+            self.expire(pdf_bytes)
+            return client.models.generate_content(model=model, config=config,
+                                                  contents=[self.part(pdf_bytes, display_name), prompt])
+
+    def cleanup(self):
+        """Deletes every registered file (of this run and of the registry file) from the store and empties the registry."""
+        names = {handle["name"] for handle in list(self._load().values()) + list(self.files.values())}
+        for name in names:
+            self.store.delete(name)
+        self.files = {}
+        if self.registry_path and os.path.exists(self.registry_path):
+            os.remove(self.registry_path)
+        return len(names)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("list", "cleanup"):
+        print(__doc__)
+        sys.exit(1)
+    sessions = DocumentSessions()
+    if sys.argv[1] == "list":
+        for handle in sessions.files.values():
+            print(f"{handle['display_name']}: {handle['name']} ({handle['size']} bytes), expires {handle['expires_at']}")
+    else:
+        print(f"Deleted {sessions.cleanup()} uploaded files")
@@ -0,0 +1,199 @@
+"""
+In-process stand-in for `genai.Client`, for running the batch tools offline.
+
+Only the parts of the client used in this repo are implemented:
+`client.models.generate_content(...)`, `client.aio.models.generate_content(...)` and
+`client.files.upload/get/delete(...)`.
+Latency and error rates are configurable so rate limiting and retries can be exercised.
+"""
+import asyncio
+import datetime
+import os
+import random
+import time
+
+PDF_BYTES_PER_TOKEN = 200  # Rough size of one input token of PDF content
+TEXT_CHARS_PER_TOKEN = 4
+
+
+class FakeAPIError(Exception):
+    """Mimics `google.genai.errors.APIError`: carries the HTTP status in `code`."""
+
+    def __init__(self, code, message=""):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class FakeUsage:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+    def model_dump(self, mode=None, exclude_none=False):
+        return {
+            "prompt_token_count": self.prompt_token_count,
+            "candidates_token_count": self.candidates_token_count,
+            "total_token_count": self.total_token_count,
+        }
+
+    def __repr__(self):
+        return f"FakeUsage({self.model_dump()})"
+
+
+class FakeResponse:
+    def __init__(self, text, usage_metadata):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+def count_prompt_tokens(contents, file_sizes=None):
+    """
+    Approximate input token count of a `contents` list (PDF parts and prompt strings).
+
+    Parts referring to an uploaded file count by the file size, looked up by URI in `file_sizes`.
+    """
+    tokens = 0
+    for part in contents:
+        if isinstance(part, str):
+            tokens += len(part) // TEXT_CHARS_PER_TOKEN
+            continue
+        inline_data = getattr(part, "inline_data", None)
+        file_data = getattr(part, "file_data", None)
+        if inline_data is not None and inline_data.data:
+            tokens += len(inline_data.data) // PDF_BYTES_PER_TOKEN
+        elif file_data is not None and file_sizes:
+            tokens += file_sizes.get(file_data.file_uri, 0) // PDF_BYTES_PER_TOKEN
+        elif getattr(part, "text", None):
+            tokens += len(part.text) // TEXT_CHARS_PER_TOKEN
+    return tokens
+
+
+class _FakeModels:
+    def __init__(self, client):
+        self._client = client
+
+    def generate_content(self, model, contents, config=None):
+        delay, error = self._client._next_outcome()
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return self._client._respond(model, contents, config)
+
+
+class _FakeAsyncModels:
+    def __init__(self, client):
+        self._client = client
+
+    async def generate_content(self, model, contents, config=None):
+        delay, error = self._client._next_outcome()
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return self._client._respond(model, contents, config)
+
+
+class _FakeAio:
+    def __init__(self, client):
+        self.models = _FakeAsyncModels(client)
+
+
+class FakeFile:
+    def __init__(self, name, uri, mime_type, size_bytes, display_name, expiration_time):
+        self.name = name
+        self.uri = uri
+        self.mime_type = mime_type
+        self.size_bytes = size_bytes
+        self.display_name = display_name
+        self.expiration_time = expiration_time
+        self.state = "ACTIVE"
+
+
+class _FakeFiles:
+    """In-memory Files API: uploads expire after `ttl` seconds, like the 48 hours of Gemini."""
+
+    def __init__(self, client, ttl):
+        self._client = client
+        self.ttl = ttl
+        self.uploads = 0
+        self._files = {}
+
+    def upload(self, file, config=None):
+        # a path is measured, not read, like the real client streams it
+        size = len(file.read()) if hasattr(file, "read") else os.path.getsize(file)
+        config = config or {}
+        mime_type = config.get("mime_type") if isinstance(config, dict) else config.mime_type
+        display_name = config.get("display_name") if isinstance(config, dict) else config.display_name
+        time.sleep(self._client.upload_seconds_per_mb * size / 1e6)
+        self.uploads += 1
+        name = f"files/fake-{self.uploads}"
+        expiration_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=self.ttl)
+        self._files[name] = FakeFile(name, f"https://fake.googleapis.com/v1beta/{name}", mime_type, size,
+                                     display_name, expiration_time)
+        return self._files[name]
+
+    def get(self, name):
+        file = self._files.get(name)
+        if file is None or file.expiration_time <= datetime.datetime.now(datetime.timezone.utc):
+            raise FakeAPIError(404, f"File {name} not found")
+        return file
+
+    def delete(self, name):
+        if self._files.pop(name, None) is None:
+            raise FakeAPIError(404, f"File {name} not found")
+
+    def sizes(self):
+        """URI -> size of the files that have not expired; a request referring to any other URI fails."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return {file.uri: file.size_bytes for file in self._files.values() if file.expiration_time > now}
+
+
+class FakeClient:
+    """
+    Fake Gemini client with configurable latency and error rate.
+
+    Args:
+        response_text (str or callable): Text of every response, or a function
+            `(model, contents, config) -> str` to build it per request.
+        latency (float): Mean seconds per call; each call takes 50%-150% of it.
+        error_rate (float): Probability that a call fails with one of `error_codes`.
+        error_codes (tuple): HTTP codes raised as `FakeAPIError`.
+        candidates_tokens (int): Output token count reported per response.
+        seed (int): Seed for the latency/error random generator.
+        file_ttl (float): Seconds an uploaded file stays available.
+        upload_seconds_per_mb (float): Simulated upload time.
+    """
+
+    def __init__(self, response_text="{}", latency=0.05, error_rate=0.0, error_codes=(429, 503),
+                 candidates_tokens=500, seed=0, file_ttl=48 * 3600, upload_seconds_per_mb=0.0):
+        self.response_text = response_text
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_codes = error_codes
+        self.candidates_tokens = candidates_tokens
+        self.calls = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self.models = _FakeModels(self)
+        self.aio = _FakeAio(self)
+        self.upload_seconds_per_mb = upload_seconds_per_mb
+        self.files = _FakeFiles(self, file_ttl)
+
+    def _next_outcome(self):
+        self.calls += 1
+        delay = self.latency * (0.5 + self._random.random())
+        if self._random.random() < self.error_rate:
+            self.errors += 1
+            code = self._random.choice(self.error_codes)
+            return delay, FakeAPIError(code, "fake error")
+        return delay, None
+
+    def _respond(self, model, contents, config):
+        file_sizes = self.files.sizes()
+        for part in contents:
+            file_data = getattr(part, "file_data", None)
+            if file_data is not None and file_data.file_uri not in file_sizes:
+                raise FakeAPIError(403, f"File {file_data.file_uri} does not exist or has expired")
+        text = self.response_text(model, contents, config) if callable(self.response_text) else self.response_text
+        usage = FakeUsage(count_prompt_tokens(contents, file_sizes), self.candidates_tokens)
+        return FakeResponse(text, usage)
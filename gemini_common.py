@@ -0,0 +1,46 @@
+import json
+import os
+import re
+
+MODEL_NAME = "gemini-2.0-flash"
+ENV_FILE = os.path.join(os.path.expanduser("~"), ".passkey", ".env")
+
+_client = None
+
+
+def get_client():
+    """
+    Return the shared Gemini client, creating it on first use.
+
+    The API key is read from GOOGLE_API_KEY (loaded from ~/.passkey/.env).
+    Raises RuntimeError when the key is missing.
+    """
+    global _client
+    if _client is None:
+        from dotenv import load_dotenv
+        from google import genai
+
+        load_dotenv(ENV_FILE)
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise RuntimeError("Missing GOOGLE_API_KEY in .env file")
+        _client = genai.Client(api_key=api_key)
+    return _client
+
+
+def parse_json_response(response_text):
+    """Extract the JSON object from a Gemini response, returning {} if there is none or it is invalid."""
+    # Extract JSON using regex to handle extra text
+    match = re.search(r"\{.*}", response_text or "", re.DOTALL)
+    if match:
+        json_text = match.group(0)
+    else:
+        print("ERROR: Could not extract JSON from Gemini response.")
+        json_text = "{}"
+
+    # Parse JSON
+    try:
+        return json.loads(json_text)
+    except json.JSONDecodeError as e:
+        print(f"ERROR: JSON decoding error: {e}")
+        return {}
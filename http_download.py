@@ -0,0 +1,119 @@
+import contextlib
+import hashlib
+import json
+import os
+
+DEFAULT_DOWNLOAD_DIR = os.path.join(".cache", "downloads")
+CHUNK_SIZE = 1024 * 1024  # Bytes written to the spool file per chunk
+PDF_HEADER = b"%PDF-"
+EOF_MARKER_WINDOW = 1024  # Bytes at the end of the file searched for the %%EOF marker
+
+_http_client = None
+
+
+def get_http_client():
+    """Return the shared, connection-pooled HTTP client, creating it on first use."""
+    global _http_client
+    if _http_client is None:
+        import httpx  # imported on first download, so workers that only read local PDFs do not load it
+
+        _http_client = httpx.Client(
+            follow_redirects=True,
+            timeout=httpx.Timeout(30.0, read=120.0),
+            limits=httpx.Limits(max_connections=16, max_keepalive_connections=8),
+        )
+    return _http_client
+
+
+def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        _http_client.close()
+        _http_client = None
+
+
+def _cache_paths(url, download_dir):
+    name = hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+    pdf_path = os.path.join(download_dir, f"{name}.pdf")
+    return pdf_path, pdf_path + ".meta.json"
+
+
+def _body_problem(head, tail, response):
+    """Why a downloaded body is not a complete PDF, or None."""
+    if not head.startswith(PDF_HEADER):
+        return f"not a PDF (starts with {head[:len(PDF_HEADER)]!r})"
+    expected = response.headers.get("content-length")
+    if expected is not None and response.num_bytes_downloaded < int(expected):
+        return f"truncated ({response.num_bytes_downloaded} of {expected} bytes)"
+    if b"%%EOF" not in tail:
+        return "truncated (no %%EOF marker at the end)"
+    return None
+
+
+def download_pdf(url, download_dir=DEFAULT_DOWNLOAD_DIR, client=None):
+    """
+    Downloads a PDF to a local spool file and returns its path.
+
+    The body is streamed to disk in chunks, so the download never holds the whole file
+    in memory. The ETag / Last-Modified of every download is kept next to the file; a
+    repeat download of the same URL sends them back and a 304 Not Modified reuses the
+    local copy instead of transferring it again.
+
+    A body that does not start with the PDF header, is shorter than its Content-Length or
+    has no %%EOF marker at the end is rejected with ValueError and nothing is kept.
+
+    Args:
+        url (str): The PDF URL.
+        download_dir (str): Directory holding the downloaded files.
+        client (httpx.Client): HTTP client to use; defaults to the shared pooled client.
+
+    Returns:
+        tuple: (local path, True if the file was transferred or False if the cached copy was reused)
+    """
+    if client is None:
+        client = get_http_client()
+    os.makedirs(download_dir, exist_ok=True)
+    pdf_path, meta_path = _cache_paths(url, download_dir)
+
+    headers = {}
+    meta = {}
+    if os.path.exists(pdf_path) and os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    with client.stream("GET", url, headers=headers) as response:
+        if response.status_code == 304 and headers:
+            return pdf_path, False
+        response.raise_for_status()
+
+        tmp_path = f"{pdf_path}.{os.getpid()}.part"  # workers fetching the same URL do not share it
+        head, tail = b"", b""
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_bytes(CHUNK_SIZE):
+                    f.write(chunk)
+                    if len(head) < len(PDF_HEADER):
+                        head += chunk[:len(PDF_HEADER)]
+                    tail = (tail + chunk)[-EOF_MARKER_WINDOW:]
+            problem = _body_problem(head, tail, response)
+            if problem:
+                raise ValueError(f"{url}: {problem}")
+        except Exception:
+            with contextlib.suppress(FileNotFoundError):  # not there when the open itself failed
+                os.remove(tmp_path)  # neither a partial nor a rejected body is kept
+            raise
+        os.replace(tmp_path, pdf_path)
+
+        meta = {
+            "url": url,
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "size": os.path.getsize(pdf_path),
+        }
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return pdf_path, True
@@ -0,0 +1,356 @@
+"""
+Resumable batch runner over a persistent SQLite job ledger.
+
+Each document (local path or URL) is one job that goes through the stages
+downloaded -> abridged -> extracted -> calculated. Every stage writes its artifact to disk
+and records it in the ledger, so a restarted run continues after the last completed stage
+instead of paying for it again. A failing stage records the error and counts an attempt;
+failed jobs are retried until `--max-attempts`. Several worker processes can share one
+ledger: a job is claimed in an immediate transaction and held by a lease, and jobs whose
+worker died are picked up again when the lease runs out, or as soon as a worker on the same
+host starts and finds the process holding the lease gone.
+
+Usage:
+    python job_runner.py add report1.pdf https://.../3443412.pdf ... [--from-file sources.txt]
+    python job_runner.py run [--workers 4] [--max-attempts 3] [--output-dir json] [--no-abridge] [--store results.db]
+    python job_runner.py status
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from http_download import download_pdf
+from make_abridged_pdf_v2 import abridge_file
+from memory_usage import PeakRSS
+from page_index import file_hash
+from report_extraction import EXTRACTION_PROMPT, analyze_pdf_bytes, with_percentages
+from response_cache import ResponseCache
+
+DEFAULT_LEDGER_PATH = "jobs.db"
+STAGES = ["downloaded", "abridged", "extracted", "calculated"]
+DEFAULT_MAX_ATTEMPTS = 3
+LEASE_SECONDS = 30 * 60  # A job held longer than this by a worker counts as abandoned
+BUSY_TIMEOUT_MS = 30000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    source TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    stage TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    outputs TEXT NOT NULL DEFAULT '{}',
+    worker TEXT,
+    lease_until REAL,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, attempts);
+"""
+
+
+def job_name(source, taken=()):
+    """File name stem of a job's outputs: the source's base name, plus a hash of the source when that is taken."""
+    name = os.path.splitext(os.path.basename(source))[0]
+    if name in taken:
+        name += "-" + hashlib.sha256(source.encode("utf-8")).hexdigest()[:8]
+    return name
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # exists, owned by another user
+    return True
+
+
+class Ledger:
+    """
+    The job table. status is pending, running, failed or done; `stage` is the last completed
+    stage and `outputs` maps each completed stage to the file it produced.
+    """
+
+    def __init__(self, path=DEFAULT_LEDGER_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        self.conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(SCHEMA)
+
+    def add(self, sources):
+        """
+        Adds new jobs; sources already in the ledger are left as they are. Returns the number added.
+
+        Two sources with the same base name (annual-report.pdf from different URLs) get distinct
+        output names, see `job_name`.
+        """
+        known = dict(self.conn.execute("SELECT source, name FROM jobs").fetchall())
+        taken = set(known.values())
+        rows = []
+        for source in dict.fromkeys(sources):
+            if source in known:
+                continue
+            name = job_name(source, taken)
+            taken.add(name)
+            rows.append((source, name, time.time()))
+        self.conn.executemany("INSERT OR IGNORE INTO jobs (source, name, updated_at) VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def reclaim(self, host):
+        """
+        Fails the running jobs leased to a process of `host` that no longer exists (a crashed
+        worker), counting an attempt, instead of waiting for their lease to run out.
+
+        Returns:
+            int: The number of jobs reclaimed.
+        """
+        reclaimed = 0
+        for source, worker in self.conn.execute("SELECT source, worker FROM jobs WHERE status = 'running' "
+                                                "AND worker LIKE ?", (host + ":%",)).fetchall():
+            pid = worker.rsplit(":", 1)[1]
+            if pid.isdigit() and _process_alive(int(pid)):
+                continue
+            reclaimed += self.conn.execute(
+                "UPDATE jobs SET status = 'failed', attempts = attempts + 1, error = ?, worker = NULL, "
+                "lease_until = NULL, updated_at = ? WHERE source = ? AND status = 'running' AND worker = ?",
+                (f"worker {worker} died", time.time(), source, worker)).rowcount
+        return reclaimed
+
+    def claim(self, worker, max_attempts=DEFAULT_MAX_ATTEMPTS, lease_seconds=LEASE_SECONDS):
+        """
+        Takes the next runnable job for `worker`, or returns None when there is none.
+
+        Runnable: pending, failed with attempts left, or running with an expired lease.
+        """
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")  # one claimer at a time across processes
+        try:
+            row = self.conn.execute(
+                "SELECT source, name, stage, attempts, outputs FROM jobs "
+                "WHERE status = 'pending' OR (status = 'failed' AND attempts < ?) "
+                "OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY attempts, updated_at LIMIT 1", (max_attempts, now)).fetchone()
+            if row is not None:
+                self.conn.execute("UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, updated_at = ? "
+                                  "WHERE source = ?", (worker, now + lease_seconds, now, row[0]))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        source, name, stage, attempts, outputs = row
+        return {"source": source, "name": name, "stage": stage, "attempts": attempts, "outputs": json.loads(outputs),
+                "worker": worker}
+
+    def advance(self, job, stage, output, lease_seconds=LEASE_SECONDS):
+        """
+        Records a completed stage and its output file, and extends the lease.
+
+        Returns:
+            bool: False, and nothing is recorded, when the job's worker no longer holds the lease
+            (it ran out and another worker claimed the job).
+        """
+        now = time.time()
+        status = "done" if stage == STAGES[-1] else "running"
+        outputs = {**job["outputs"], stage: output}
+        updated = self.conn.execute(
+            "UPDATE jobs SET stage = ?, outputs = ?, status = ?, error = NULL, lease_until = ?, updated_at = ? "
+            "WHERE source = ? AND status = 'running' AND worker = ?",
+            (stage, json.dumps(outputs), status, now + lease_seconds, now, job["source"], job["worker"])).rowcount
+        if updated:
+            job["stage"] = stage
+            job["outputs"] = outputs
+        return bool(updated)
+
+    def fail(self, job, error):
+        self.conn.execute("UPDATE jobs SET status = 'failed', attempts = attempts + 1, error = ?, worker = NULL, "
+                          "lease_until = NULL, updated_at = ? WHERE source = ? AND status = 'running' AND worker = ?",
+                          (error, time.time(), job["source"], job["worker"]))
+
+    def status(self):
+        """(status counts, [(source, attempts, error)] of the failed jobs)."""
+        counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        failed = self.conn.execute("SELECT source, attempts, error FROM jobs WHERE status = 'failed' "
+                                   "ORDER BY source").fetchall()
+        return counts, failed
+
+    def close(self):
+        self.conn.close()
+
+
+class Stages:
+    """
+    The work of one job, one method per stage. Each returns the path of the file it wrote.
+
+    Args:
+        output_dir (str): Where the abridged PDF and the JSON files go.
+        abridge (bool): Abridge before extraction; without it the abridged stage reuses the PDF.
+        client (genai.Client): Defaults to `gemini_common.get_client()`.
+        cache (ResponseCache): Gemini response cache, so a retried extraction of the same PDF is free.
+        store (ResultStore): Optional result store the calculated results are upserted into.
+    """
+
+    def __init__(self, output_dir="json", abridge=True, client=None, cache=None, prompt=EXTRACTION_PROMPT,
+                 temperature=0.5, store=None):
+        self.output_dir = output_dir
+        self.abridge = abridge
+        self.client = client
+        self.cache = cache
+        self.prompt = prompt
+        self.temperature = temperature
+        self.store = store
+
+    def _path(self, job, suffix):
+        os.makedirs(self.output_dir, exist_ok=True)
+        return os.path.join(self.output_dir, job["name"] + suffix)
+
+    def downloaded(self, job):
+        if job["source"].startswith(("http://", "https://")):
+            path, _ = download_pdf(job["source"])
+            return path
+        if not os.path.exists(job["source"]):
+            raise FileNotFoundError(f"PDF file '{job['source']}' not found")
+        return job["source"]
+
+    def abridged(self, job):
+        pdf_path = job["outputs"]["downloaded"]
+        if not self.abridge:
+            return pdf_path
+        # from disk, a window of pages at a time: parallel workers never hold a whole report
+        path, _ = abridge_file(pdf_path, self._path(job, "_abridged.pdf"))
+        return path
+
+    def extracted(self, job):
+        data = analyze_pdf_bytes(Path(job["outputs"]["abridged"]).read_bytes(), self.prompt, self.client,
+                                 self.temperature, cache=self.cache, label=job["source"])
+        if not data:
+            # analyze_pdf_bytes prints the cause and returns {} on any failure
+            raise RuntimeError("Gemini extraction returned no data")
+        output_file = self._path(job, "_pdf.json")
+        _write_atomic(output_file, json.dumps(data, indent=4, ensure_ascii=False).encode("utf-8"))
+        return output_file
+
+    def calculated(self, job):
+        with open(job["outputs"]["extracted"], "r", encoding="utf-8") as f:
+            data = json.load(f)
+        output_file = self._path(job, "_calc.json")
+        _write_atomic(output_file, json.dumps(with_percentages(data), indent=4, ensure_ascii=False).encode("utf-8"))
+        if self.store is not None:
+            doc_hash = file_hash(job["outputs"]["downloaded"])
+            self.store.upsert_report(doc_hash, job["name"], data, source=job["source"])
+        return output_file
+
+
+def _write_atomic(path, data):
+    """Writes a file so that a crash never leaves a half-written artifact behind."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def run_job(ledger, stages, job):
+    """Runs the stages a job has not completed yet. Returns True when the job is done."""
+    done = STAGES.index(job["stage"]) + 1 if job["stage"] else 0
+    for stage in STAGES[done:]:
+        try:
+            output = getattr(stages, stage)(job)
+        except Exception as e:
+            print(f"ERROR: {job['source']}: {stage} failed (attempt {job['attempts'] + 1}): {e}")
+            ledger.fail(job, f"{stage}: {type(e).__name__}: {e}")
+            return False
+        if not ledger.advance(job, stage, output):
+            print(f"WARNING: {job['source']}: lease lost to another worker after {stage}, leaving the job to it")
+            return False
+    return True
+
+
+def run_worker(ledger_path=DEFAULT_LEDGER_PATH, stages=None, max_attempts=DEFAULT_MAX_ATTEMPTS, worker=None):
+    """Claims and runs jobs until none is left. Returns (jobs done, jobs failed)."""
+    if stages is None:
+        stages = Stages(cache=ResponseCache())
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    ledger = Ledger(ledger_path)
+    done = failed = 0
+    try:
+        reclaimed = ledger.reclaim(worker.rsplit(":", 1)[0])
+        if reclaimed:
+            print(f"[{worker}] reclaimed {reclaimed} jobs of crashed workers")
+        while True:
+            job = ledger.claim(worker, max_attempts)
+            if job is None:
+                return done, failed
+            print(f"[{worker}] {job['source']} (after {job['stage'] or 'nothing'})")
+            with PeakRSS() as peak:
+                ok = run_job(ledger, stages, job)
+            print(f"[{worker}] {job['source']}: {'done' if ok else 'failed'}, peak RSS {peak.mb} MB")
+            if ok:
+                done += 1
+            else:
+                failed += 1
+    finally:
+        ledger.close()
+
+
+def _worker_process(ledger_path, stage_options, store_path, max_attempts):
+    from result_store import ResultStore
+
+    store = ResultStore(store_path) if store_path else None
+    run_worker(ledger_path, Stages(cache=ResponseCache(), store=store, **stage_options), max_attempts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resumable batch extraction over a job ledger.")
+    parser.add_argument("--ledger", default=DEFAULT_LEDGER_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    add_parser = commands.add_parser("add", help="add PDF paths or URLs")
+    add_parser.add_argument("sources", nargs="*")
+    add_parser.add_argument("--from-file", help="file with one path or URL per line")
+    run_parser = commands.add_parser("run", help="process the ledger until no job is left")
+    run_parser.add_argument("--workers", type=int, default=1, help="worker processes sharing the ledger")
+    run_parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    run_parser.add_argument("--output-dir", default="json")
+    run_parser.add_argument("--no-abridge", action="store_true")
+    run_parser.add_argument("--store", help="also upsert results into this SQLite result store")
+    commands.add_parser("status", help="job counts and failures")
+    args = parser.parse_args(argv)
+
+    if args.command == "add":
+        sources = list(args.sources)
+        if args.from_file:
+            with open(args.from_file, "r", encoding="utf-8") as f:
+                sources += [line.strip() for line in f if line.strip()]
+        ledger = Ledger(args.ledger)
+        print(f"Added {ledger.add(sources)} of {len(sources)} jobs")
+        ledger.close()
+    elif args.command == "run":
+        stage_options = {"output_dir": args.output_dir, "abridge": not args.no_abridge}
+        processes = [multiprocessing.Process(target=_worker_process,
+                                             args=(args.ledger, stage_options, args.store, args.max_attempts))
+                     for _ in range(args.workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    ledger = Ledger(args.ledger)
+    counts, failed = ledger.status()
+    ledger.close()
+    print(", ".join(f"{status}: {count}" for status, count in sorted(counts.items())) or "No jobs")
+    for source, attempts, error in failed:
+        print(f"  failed after {attempts} attempts: {source}: {error}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+import re
+
+
+def _trie_pattern(keywords):
+    # Build a regex that shares common prefixes, e.g. ["share", "shareholders"] -> "share(?:holders)?"
+    # At a given position the greedy optional groups always return the longest keyword.
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[""] = True  # end of a keyword
+
+    def build(node):
+        alternatives = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch != ""]
+        if not alternatives:
+            return ""
+        body = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+        return "(?:" + body + ")?" if "" in node else body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    Finds every keyword category present in a text in a single compiled-regex pass.
+
+    Matching is case-insensitive substring matching, the same as
+    `any(keyword in text.lower() for keyword in keywords)`, but done once for all
+    keyword lists instead of once per list.
+
+    Args:
+        categories (dict): Category name -> list of keywords, e.g. {"exclude": exclude_keywords}.
+
+    Example:
+        matcher = KeywordMatcher({"possible": possible_keywords, "exclude": exclude_keywords})
+        hits = matcher.match(title)  # e.g. {"possible"}
+    """
+
+    def __init__(self, categories):
+        keyword_categories = {}
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                keyword_categories.setdefault(keyword.lower(), set()).add(category)
+
+        # The regex reports the longest keyword starting at each position; every shorter
+        # keyword that also matches there is a prefix of it, so its categories are implied.
+        self._hits = {}
+        for keyword in keyword_categories:
+            hits = set()
+            for other, other_categories in keyword_categories.items():
+                if keyword.startswith(other):
+                    hits |= other_categories
+            self._hits[keyword] = frozenset(hits)
+
+        # lookahead so overlapping keywords (e.g. "share buy back" / "buy-back") are all seen
+        self._pattern = re.compile("(?=(" + _trie_pattern(keyword_categories) + "))")
+
+    def match(self, text):
+        """Return the set of categories with at least one keyword in `text`."""
+        hits = set()
+        for found in self._pattern.finditer(text.lower()):
+            hits |= self._hits[found.group(1)]
+        return hits
@@ -0,0 +1,476 @@
+"""
+Local table extraction: the sections that are plain tables are read with PyMuPDF, not Gemini.
+
+The pages `split_into_sections` keeps are routed to the sections as in sharded extraction
+(`sharded_extraction.route_pages`), and the tables PyMuPDF finds on them (`Page.find_tables`)
+are parsed into business_segments, geographical_segments, corporate_structure and
+top_30_shareholders. A section is taken from its table only when the table passes the
+confidence checks:
+    - segments: the segment revenues (and eliminations) add up to the table's total within
+      TOTAL_TOLERANCE, and a percentage column, if any, sums to 100 within PERCENT_TOLERANCE;
+    - corporate structure: at least MIN_COMPANIES companies, every ownership between 0 and 100;
+    - shareholders: at least MIN_SHAREHOLDERS rows numbered 1, 2, ... in descending order of
+      shares, whose shares and percentages imply the same issued share count within
+      SHARE_TOLERANCE, and which add up to a total row if there is one.
+Every other section, and every section whose table fails a check, goes to Gemini as in
+sharded extraction, with only those sections in the sub-prompts.
+
+Counters (module level, for the whole run): tabular sections resolved locally and sent to the model.
+
+Usage:
+    python local_tables.py report_abridged.pdf [-o local.json]
+"""
+import argparse
+import asyncio
+import collections
+import json
+import re
+import statistics
+import sys
+import time
+
+import fitz  # pymupdf is imported as fitz
+
+from gemini_common import MODEL_NAME
+from report_extraction import EXTRACTION_PROMPT
+from sharded_extraction import SHARDS, collect_results, extract_shards, merge_shards, route_pages, shard_pdfs
+
+LOCAL_SECTIONS = ["business_segments", "geographical_segments", "corporate_structure", "top_30_shareholders"]
+TOTAL_TOLERANCE = 0.005  # Segment revenues may differ from the total by rounding, as a share of the total
+PERCENT_TOLERANCE = 0.5  # Percentage points a percentage column may miss 100 by
+SHARE_TOLERANCE = 0.02  # Spread of the issued share counts implied by the top-30 rows, around their median
+MIN_IMPLIED_PERCENT = 0.5  # Rows below this percentage are too rounded to imply a share count
+MIN_SEGMENTS = 2
+MIN_COMPANIES = 2
+MIN_SHAREHOLDERS = 20  # Fewer rows usually means the list continues on a page that was not kept
+CAPTION_HEIGHT = 30  # Points above a table searched for its caption ("Geographical information")
+
+TOTAL_LABELS = ("total", "consolidated", "group")
+ADJUSTMENT_LABELS = ("elimination", "inter-segment", "intersegment", "adjustment")
+GEOGRAPHICAL_KEYWORDS = ("geographical", "geographic", "country", "countries", "region", "location")
+NOMINEE_KEYWORDS = ("nominee", "trustee")
+DASHES = ("-", "–", "—")
+
+counters = collections.Counter()
+
+_NUMBER = re.compile(r"^\(?-?(\d{1,3}(,\d{3})+|\d+)?(\.\d+)?\)?$")
+_UPDATE_DATE = re.compile(r"\bas at\s+(\d{1,2}\s+[A-Za-z]+\s+\d{4})", re.IGNORECASE)
+_ISSUED_SHARES = re.compile(r"(?:number of )?issued shares\D{0,40}?([\d,]{5,})", re.IGNORECASE)
+_TREASURY_SHARES = re.compile(r"treasury shares\D{0,40}?([\d,]{3,})", re.IGNORECASE)
+
+
+def parse_number(cell):
+    """A table cell as a number: "1,234" -> 1234.0, "(1,234)" -> -1234.0, "12.5%" -> 12.5, "-" -> 0.0, else None."""
+    text = cell.replace("%", "").replace(" ", "").strip()
+    if text in DASHES:
+        return 0.0
+    if not text or not any(char.isdigit() for char in text) or not _NUMBER.match(text):
+        return None
+    value = float(text.strip("()").replace(",", ""))
+    return -value if text.startswith("(") else value
+
+
+def flat(cell):
+    """A cell on one line, lower case, for matching."""
+    return " ".join(cell.split()).lower().replace("’", "'")
+
+
+def unit_scale(text):
+    """Factor from the amounts of a header to RM'000: "RM'000" 1, "RM'mil" 1000, plain "RM" 0.001."""
+    text = flat(text)
+    if "'000" in text or "000's" in text:
+        return 1
+    if "mil" in text or "'m" in text:
+        return 1000
+    if re.search(r"\brm\b", text):
+        return 0.001
+    return 1  # the prompt's rule: amounts without a unit are already in thousands
+
+
+def page_tables(page):
+    """
+    The tables PyMuPDF finds on a page, each split into blocks at the header rows inside it.
+
+    Returns:
+        list: (caption, rows) per block; cells are strings with their lines stripped.
+    """
+    blocks = []
+    if not page.get_cdrawings():
+        return blocks  # tables are found from their ruling lines: no drawings, no table, without the slow search
+    for table in page.find_tables().tables:
+        rows = [["\n".join(line.strip() for line in (cell or "").splitlines() if line.strip()) for cell in row]
+                for row in table.extract()]
+        caption = page.get_text("text", clip=fitz.Rect(0, table.bbox[1] - CAPTION_HEIGHT,
+                                                       page.rect.width, table.bbox[1]))
+        # two tables drawn one under the other come back as one: a row without numbers
+        # followed by a row with numbers starts the next one
+        start = 0
+        for i in range(1, len(rows) - 1):
+            if not _has_number(rows[i]) and _has_number(rows[i + 1]) and rows[i][0]:
+                blocks.append((caption, rows[start:i]))
+                caption, start = "", i
+        blocks.append((caption, rows[start:]))
+    return [(caption, rows) for caption, rows in blocks if len(rows) > 1]
+
+
+def _has_number(row):
+    return any(parse_number(cell) is not None for cell in row[1:])
+
+
+def _column(header, include, exclude=(), start=0):
+    """Index of the first header cell (from `start`) holding one of `include` and none of `exclude`, or None."""
+    for i, cell in enumerate(header[start:], start):
+        if any(word in cell for word in include) and not any(word in cell for word in exclude):
+            return i
+    return None
+
+
+def _revenue_column(header):
+    exclude = ("external", "inter", "intra")
+    column = _column(header, ("total revenue",), exclude, 1)
+    return column if column is not None else _column(header, ("revenue",), exclude, 1)
+
+
+def parse_segment_table(caption, rows):
+    """
+    Reads a segment table laid out with one row per segment, or one column per segment.
+
+    Returns:
+        tuple: (kind, segments, reason): kind "business_segments" or "geographical_segments" (None
+        when the table has no revenue), the section value and None when the checks pass, or a
+        reason why they fail.
+    """
+    header = [flat(cell) for cell in rows[0]]
+    column = _revenue_column(header)
+    if column is None:
+        rows = [list(row) for row in zip(*rows)]  # one column per segment: a revenue row instead
+        header = [flat(cell) for cell in rows[0]]
+        column = _revenue_column(header)
+        if column is None:
+            return None, None, "no revenue column"
+    kind = "geographical_segments" if any(word in flat(caption) + " " + " ".join(header)
+                                          for word in GEOGRAPHICAL_KEYWORDS) else "business_segments"
+    percent_column = _column(header, ("%", "percentage"), ("rm", "revenue"), 1)
+    scale = unit_scale(header[column] + " " + caption)
+
+    segments, adjustments, total, percentages = [], 0.0, None, []
+    for row in rows[1:]:
+        label, cell = " ".join(row[0].split()), row[column].strip()
+        if not label or not cell:
+            continue
+        value = parse_number(cell)
+        if value is None:
+            return kind, None, f"unreadable revenue {cell!r} for {label}"
+        if any(word in label.lower() for word in ADJUSTMENT_LABELS):
+            adjustments += value * scale
+        elif label.lower().startswith(TOTAL_LABELS):
+            total = value * scale if total is None else total
+        elif not (kind == "geographical_segments" and cell in DASHES):  # the prompt ignores "-" regions
+            segments.append({"segment": label, "total_revenue": value * scale})
+            if percent_column is not None:
+                percentages.append(parse_number(row[percent_column]) or 0.0)
+
+    if len(segments) < MIN_SEGMENTS:
+        return kind, None, f"{len(segments)} segments"
+    if total is None:
+        return kind, None, "no total row"
+    segment_sum = sum(segment["total_revenue"] for segment in segments)
+    if abs(segment_sum + adjustments - total) > TOTAL_TOLERANCE * abs(total):
+        return kind, None, f"segments add up to {segment_sum + adjustments:,.0f}, total is {total:,.0f}"
+    if percentages and abs(sum(percentages) - 100) > PERCENT_TOLERANCE:
+        return kind, None, f"percentages add up to {sum(percentages):.1f}"
+    for segment in segments:
+        segment["percentage"] = round(segment["total_revenue"] / segment_sum * 100, 2) if segment_sum > 0 else 0
+        if kind == "business_segments":
+            segment["currency_unit"] = "RM'000"
+    return kind, segments, None
+
+
+def extract_segments(tables):
+    """
+    The first segment table of each kind that passes the checks.
+
+    Returns:
+        tuple: ({section: segments}, {section: reason of the first failed table, or "no table"})
+    """
+    found, reasons = {}, {}
+    for caption, rows in tables:
+        if len(found) == 2:
+            break  # `tables` may be lazy: the pages after both tables are not parsed
+        kind, segments, reason = parse_segment_table(caption, rows)
+        if kind is None or kind in found:
+            continue
+        if reason is None:
+            found[kind] = segments
+            reasons.pop(kind, None)
+        else:
+            reasons.setdefault(kind, reason)
+    for kind in ("business_segments", "geographical_segments"):
+        if kind not in found:
+            reasons.setdefault(kind, "no table")
+    return found, reasons
+
+
+def extract_corporate_structure(tables):
+    """
+    Subsidiaries (own >= 50%), associates (< 50%) and companies without an ownership, from every
+    table with a company name and an ownership column.
+
+    Returns:
+        tuple: (corporate_structure value, None) or (None, reason)
+    """
+    structure = {"subsidiaries": [], "associates": [], "unknown_ownership": []}
+    seen = set()
+    for _, rows in tables:
+        header = [flat(cell) for cell in rows[0]]
+        name_column = _column(header, ("name", "company", "subsidiar", "associate"))
+        interest_column = _column(header, ("interest", "ownership", "equity", "held", "%"), (), 1)
+        if name_column is None or interest_column is None:
+            continue
+        activity_column = _column(header, ("activit",))
+        for row in rows[1:]:
+            name = " ".join(row[name_column].split())
+            activities = " ".join(row[activity_column].split()) if activity_column is not None else ""
+            cell = row[interest_column].strip()
+            if not name or name.lower() in seen or not (cell or activities):  # sub-headings, repeated names
+                continue
+            seen.add(name.lower())
+            ownership = parse_number(cell) if cell not in DASHES else None
+            if cell and cell not in DASHES and ownership is None:
+                return None, f"unreadable ownership {cell!r} for {name}"
+            if ownership is not None and not 0 < ownership <= 100:
+                return None, f"ownership {ownership} for {name}"
+            company = {"name": name, "principal_activities": activities or None}
+            if ownership is None:
+                structure["unknown_ownership"].append(company)
+            else:
+                company["ownership_percentage"] = ownership
+                structure["subsidiaries" if ownership >= 50 else "associates"].append(company)
+    companies = sum(len(companies) for companies in structure.values())
+    if companies < MIN_COMPANIES:
+        return None, "no table" if not seen else f"{companies} companies"
+    return structure, None
+
+
+def split_holder(name):
+    """(nominee or trustee, represented shareholder) of a top-30 name cell."""
+    lines = [" ".join(line.split()) for line in name.splitlines() if line.strip()]
+    text = " ".join(lines)
+    if not any(word in text.lower() for word in NOMINEE_KEYWORDS):
+        return None, text
+    match = re.search(r"\bfor\s+(.+)$", text, re.IGNORECASE)
+    if len(lines) > 1 and any(word in lines[0].lower() for word in NOMINEE_KEYWORDS):
+        nominee = lines[0]  # "Pledged Securities Account for ..." and the like go on the next lines
+    else:
+        nominee = text[:match.start()].strip() if match else text
+    if match:
+        return nominee, match.group(1).strip()
+    return nominee, " ".join(lines[1:]) or None
+
+
+def shareholder_lists(tables):
+    """
+    Groups the tables with a name, a shares and a percentage column into shareholder lists; a
+    table without that header right after one (with as many columns) is taken as its continuation.
+
+    Returns:
+        list: (columns, rows, total row or None) per list; columns are the indexes of the row
+        number (or None), name, shares and percentage columns.
+    """
+    lists = []
+    width = None
+    for _, table in tables:
+        header = [flat(cell) for cell in table[0]]
+        name_column = _column(header, ("name",))
+        shares_column = _column(header, ("share", "holding"), ("%", "percent", "name"), 1)
+        percent_column = _column(header, ("%", "percent"), (), 1)
+        if None not in (name_column, shares_column, percent_column):
+            number_column = 0 if name_column != 0 and header[0].startswith("no") else None
+            lists.append(((number_column, name_column, shares_column, percent_column), [], None))
+            width = len(header)
+            table = table[1:]
+        elif not lists or len(header) != width:
+            width = None
+            continue
+        columns, rows, total_row = lists[-1]
+        for row in table:
+            if row[columns[1]].lower().startswith("total"):
+                total_row = row
+            elif parse_number(row[columns[2]]) is not None:
+                rows.append(row)
+        lists[-1] = (columns, rows, total_row)
+    return lists
+
+
+def check_shareholders(columns, rows, total_row):
+    """
+    Reads and checks one shareholder list (see `shareholder_lists`).
+
+    Returns:
+        tuple: (shareholder dicts of the top 30, None) or (None, reason)
+    """
+    number_column, name_column, shares_column, percent_column = columns
+    holders = []
+    for row in rows[:30]:
+        percentage = parse_number(row[percent_column])
+        if percentage is None:
+            return None, f"unreadable percentage {row[percent_column]!r}"
+        nominee, represented = split_holder(row[name_column])
+        holders.append({"nominee/trustee": nominee, "represented shareholder": represented,
+                        "shares": parse_number(row[shares_column]), "percentage": percentage})
+
+    if len(holders) < MIN_SHAREHOLDERS:
+        return None, f"{len(holders)} shareholders"
+    if number_column is not None and ([parse_number(row[number_column]) for row in rows[:30]]
+                                      != list(range(1, len(holders) + 1))):
+        return None, "rows are not numbered 1 to n"
+    if any(later["shares"] > earlier["shares"] for earlier, later in zip(holders, holders[1:])):
+        return None, "shares are not in descending order"
+    implied = [holder["shares"] * 100 / holder["percentage"] for holder in holders
+               if holder["percentage"] >= MIN_IMPLIED_PERCENT]
+    if implied:
+        median = statistics.median(implied)
+        if any(abs(value - median) > SHARE_TOLERANCE * median for value in implied):
+            return None, "shares and percentages imply different issued share counts"
+    if total_row is not None and len(rows) <= 30:
+        total_shares = parse_number(total_row[shares_column])
+        shares = sum(holder["shares"] for holder in holders)
+        if total_shares is not None and abs(total_shares - shares) > 1:
+            return None, f"shares add up to {shares:,.0f}, total row is {total_shares:,.0f}"
+    return holders, None
+
+
+def extract_shareholders(tables, text=""):
+    """
+    The first shareholder list that passes the checks. The update date, total and treasury
+    shares are read from `text`, the text of the same pages.
+
+    Returns:
+        tuple: (top_30_shareholders value, None) or (None, reason of the first failed list)
+    """
+    first_reason = "no table"
+    for i, (columns, rows, total_row) in enumerate(shareholder_lists(tables)):
+        holders, reason = check_shareholders(columns, rows, total_row)
+        if reason is None:
+            date = _UPDATE_DATE.search(text)
+            return {"shareholdings_update_date": date.group(1) if date else None,
+                    "total_shares": _text_number(_ISSUED_SHARES, text),
+                    "treasury_shares": _text_number(_TREASURY_SHARES, text), "shareholders": holders}, None
+        if i == 0:
+            first_reason = reason
+    return None, first_reason
+
+
+def _text_number(pattern, text):
+    match = pattern.search(text)
+    return parse_number(match.group(1)) if match else None
+
+
+def extract_local(doc, routes=None):
+    """
+    Resolves the tabular sections of an open (abridged) document from its tables.
+
+    Args:
+        routes (dict): shard -> page numbers, from `sharded_extraction.route_pages`.
+
+    Returns:
+        tuple: ({section: value} for the sections that passed their checks,
+        {section: reason} for the other LOCAL_SECTIONS)
+    """
+    if routes is None:
+        routes = route_pages(doc)
+    parsed = {}  # page number -> tables; shards share pages, and find_tables is the slow part
+
+    def tables(shard):
+        for page_num in routes.get(shard, []):
+            if page_num not in parsed:
+                parsed[page_num] = page_tables(doc[page_num])
+            yield from parsed[page_num]
+
+    found, reasons = extract_segments(tables("segments"))
+    structure, reason = extract_corporate_structure(tables("corporate_structure"))
+    if reason is None:
+        found["corporate_structure"] = structure
+    else:
+        reasons["corporate_structure"] = reason
+    shareholder_text = "\n".join(doc[page_num].get_text() for page_num in routes.get("shareholders", []))
+    shareholders, reason = extract_shareholders(tables("shareholders"), shareholder_text)
+    if reason is None:
+        found["top_30_shareholders"] = shareholders
+    else:
+        reasons["top_30_shareholders"] = reason
+    return found, reasons
+
+
+def analyze_pdf_local(pdf_bytes, prompt=EXTRACTION_PROMPT, client=None, temperature=0.5, model=MODEL_NAME,
+                      cache=None, refresh=False, label="PDF", stats=None, sessions=None):
+    """
+    Version of `sharded_extraction.analyze_pdf_sharded` that sends only the sections the
+    tables did not resolve, with the same arguments.
+
+    `stats` gets the sharded stats plus the local extraction time (`local_seconds`), the
+    sections resolved locally (`local_sections`), the reasons the other tabular sections
+    went to the model (`local_reasons`) and `local_candidates`, the number of tabular sections.
+    """
+    if stats is None:
+        stats = {}
+    stats.update(cache="off" if cache is None else "miss", gemini_seconds=0.0, parse_seconds=0.0,
+                 local_seconds=0.0, local_sections=[], local_reasons={}, local_candidates=len(LOCAL_SECTIONS))
+    try:
+        start = time.perf_counter()
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            routes = route_pages(doc)
+            stats["routing_seconds"] = time.perf_counter() - start
+            start = time.perf_counter()
+            try:
+                local, reasons = extract_local(doc, routes)
+            except Exception as e:
+                print(f"WARNING: local table extraction failed for {label}: {e}")
+                local, reasons = {}, {section: f"error: {e}" for section in LOCAL_SECTIONS}
+            stats["local_seconds"] = time.perf_counter() - start
+        stats.update(local_sections=list(local), local_reasons=reasons)
+        counters["local_sections"] += len(local)
+        counters["model_sections"] += len(reasons)
+        print(f"Resolved locally for {label}: {', '.join(local) or 'none'}"
+              + "".join(f"\n  {section} -> model: {reason}" for section, reason in reasons.items()))
+
+        # a shard whose sections were all resolved is not called
+        remaining = {shard: [section for section in sections if section not in local]
+                     for shard, (sections, _) in SHARDS.items()}
+        remaining = {shard: sections for shard, sections in remaining.items() if sections}
+        pdfs = shard_pdfs(pdf_bytes, {shard: routes[shard] for shard in remaining})
+        start = time.perf_counter()
+        results = asyncio.run(extract_shards(pdfs, prompt, client, temperature, model, cache, refresh,
+                                             sessions=sessions, sections=remaining))
+        stats["gemini_seconds"] = time.perf_counter() - start
+    except Exception as e:
+        print(f"ERROR: Gemini processing failed: {e}")
+        return {}
+
+    collect_results(results, stats, label)
+    data = merge_shards(results)
+    data.update(local)
+    return data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read the tabular sections of an annual report without the model.")
+    parser.add_argument("pdf")
+    parser.add_argument("-o", "--output", help="write the sections resolved locally as JSON")
+    args = parser.parse_args(argv)
+
+    with fitz.open(args.pdf) as doc:
+        start = time.perf_counter()
+        local, reasons = extract_local(doc)
+        seconds = time.perf_counter() - start
+    for section in LOCAL_SECTIONS:
+        print(f"{section:<24}" + ("local" if section in local else f"model: {reasons[section]}"))
+    print(f"Resolved {len(local)} of {len(LOCAL_SECTIONS)} tabular sections locally in {seconds:.2f}s")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(local, f, indent=4, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
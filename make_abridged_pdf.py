@@ -1,20 +1,35 @@
 import fitz  # pymupdf is imported as fitz
+import logging
 import os
+import time
+from keyword_matcher import KeywordMatcher
+from page_cache import title_from_text
+from parallel_titles import default_workers, page_texts
+from toc_selection import select_pages_from_toc
 
-possible_keywords = [ "executive", "director" ,"senior management", "corporate structure", "corporate profile"
+logger = logging.getLogger(__name__)
+
+possible_keywords = [ "executive", "director" ,"senior management", "corporate structure", "corporate profile",
                     "chairman statement", "chairman", 
                     #"discussion and analysis", "discussion", "analysis", "management" 
                     "financial statements" , "notes to financial statements", "notes to the financial statements",
-                    "subsidiary", "subsidiaries", "associate", "associates", "business segment" , "geographical segments"
+                    "subsidiary", "subsidiaries", "associate", "associates", "business segment" , "geographical segments",
                     "corporate info" , "vision and mission", "vision" , "mission" , 
                     "analysis of shareholdings" , "shareholders" , "shareholding" , "share", "account" , 
                     "salary" , "remuneration"]
 
-exclude_keywords = ["sustainability report", "sustainability", "risk management", "share buy back" , "audit committee", "compliance"
-                    "governance" , "internal control" , "general meeting" , "General Meetings" , "buy-back" , "mesyuarat", "audit" , "auditor"
+exclude_keywords = ["sustainability report", "sustainability", "risk management", "share buy back" , "audit committee", "compliance",
+                    "governance" , "internal control" , "general meeting" , "General Meetings" , "buy-back" , "mesyuarat", "audit" , "auditor",
                     "management discussion and analysis"]
 
-def extract_titles_from_pdf(pdf_path):
+NUM_TITLE_LINES = 5  # Number of lines (after the header) considered for the title
+
+
+def build_matcher():
+    """Compile the keyword lists once into a matcher that reports "possible" / "exclude" hits per title."""
+    return KeywordMatcher({"possible": possible_keywords, "exclude": exclude_keywords})
+
+def extract_titles_from_pdf(pdf_path, workers=1, pool=None):
     """
     Extracts potential titles from each page of a PDF file.
 
@@ -23,8 +38,13 @@ def extract_titles_from_pdf(pdf_path):
         - First few lines of text (potentially the title)
         -  The lines are not too short or too long.
 
+    Pages are read below the header band (see `page_cache.clipped_text`). With `workers` > 1
+    the page range is split across a process pool; the titles come back in page order.
+
     Args:
         pdf_path (str): The path to the PDF file.
+        workers (int): Number of worker processes. 1 (default) scans serially.
+        pool (ProcessPoolExecutor): Optional pool shared across the documents of a batch.
 
     Returns:
         list: A list of strings, where each string is a potential title for a page.
@@ -32,34 +52,12 @@ def extract_titles_from_pdf(pdf_path):
     """
 
     try:
-        doc = fitz.open(pdf_path)  # Open the PDF using fitz
-        num_pages = len(doc)
         titles = []
 
-        for page_num in range(num_pages):
-            page = doc[page_num]
-
+        for text in page_texts(pdf_path, workers, pool):
             # Heuristic: Take the first few lines as the potential title, excluding the header
-            rect = page.rect  # Get the page rectangle
-            header_height = 45  # Define the height of the header to be removed
-            cropped_rect = fitz.Rect(rect.x0, rect.y0 + header_height, rect.x1, rect.y1)  # Define the crop box
-            text = page.get_text("text", clip=cropped_rect)  # Extract text using the crop box
-            lines = text.splitlines()  # Split the text into lines
-
-            potential_title = ""
-            # Heuristic: Take the first few lines as the potential title
-            num_title_lines = min(5, len(lines))  # Consider up to 6 lines
-
-            for i in range(num_title_lines):
-                line = lines[i].strip()  # Remove leading/trailing whitespace
-
-                if len(line) > 5 and len(line) < 100 : # Basic length checks
-                    potential_title += line + " "
-
-            potential_title = potential_title.strip() #Remove extra space
-            titles.append(potential_title)
+            titles.append(title_from_text(text, NUM_TITLE_LINES))
 
-        doc.close()
         return titles
 
     except FileNotFoundError:
@@ -71,34 +69,37 @@ def extract_titles_from_pdf(pdf_path):
     
 
 #from page titles, split into sections
-def split_into_sections(page_titles):
+def split_into_sections(page_titles, matcher=None):
+    if matcher is None:
+        matcher = build_matcher()
     list_of_pages = []
     next_page_flag = False ## next_page flag
     count = 0
     if page_titles:
         page_num = 0
         for page_num, title in enumerate(page_titles):
-            # print("Page:" , page_num , " -   ", title)  # debug
-            if any(keyword in title.lower() for keyword in possible_keywords) and not any(keyword in title.lower() for keyword in exclude_keywords):
-                print("Match:" , page_num , " -   ", title)  # debug
+            logger.debug("Page: %s - %s", page_num, title)
+            hits = matcher.match(title)  # every keyword category in the title, in one pass
+            if "possible" in hits and "exclude" not in hits:
+                logger.debug("Match: %s - %s", page_num, title)
                 next_page_flag = True  ## possible next page is useful
                 count = 0 ## reset next page counter
                 list_of_pages.append(page_num)
                 continue
 
-            if any(keyword in title.lower() for keyword in exclude_keywords):
-                print("No Match, IF : " , page_num , " - ", title) # debug
+            if "exclude" in hits:
+                logger.debug("No Match, IF : %s - %s", page_num, title)
                 next_page_flag = False
                 continue
 
             if next_page_flag and count < 2:
-                print("Match:" , page_num , " -   ", title) # debug
+                logger.debug("Match: %s - %s", page_num, title)
                 list_of_pages.append(page_num)
                 count =  count + 1
                 continue
 
             else:
-                print("No Match ELSE: " , page_num , " - ", title) # debug
+                logger.debug("No Match ELSE: %s - %s", page_num, title)
                 count = 0
                 next_page_flag = False
                 continue
@@ -106,25 +107,47 @@ def split_into_sections(page_titles):
             
     return list_of_pages
 
-def get_tableofcontents(filename):
+def get_tableofcontents(filename, doc=None):
 
-    file  = fitz.open(filename)
+    file  = doc if doc is not None else fitz.open(filename)
     toc = file.get_toc()
-    print("Table of Contents : ", toc)
+    logger.debug("Table of Contents : %s", toc)
+    return toc
+
+
+def select_pages(pdf_file_path, doc, workers=1, pool=None, matcher=None):
+    """
+    Picks the pages to keep, from the PDF outline when it is usable, otherwise from the title scan.
+
+    Returns:
+        tuple: (sorted page numbers, "toc" or "scan")
+    """
+    if matcher is None:
+        matcher = build_matcher()
+    start = time.perf_counter()
+
+    toc = get_tableofcontents(pdf_file_path, doc)
+    page_numbers = select_pages_from_toc(toc, len(doc), matcher)
+    path = "toc"
+    if page_numbers is None:
+        page_titles = extract_titles_from_pdf(pdf_file_path, workers=workers, pool=pool)
+        page_numbers = split_into_sections(page_titles, matcher)
+        path = "scan"
+
+    logger.info("Selected %d pages via %s in %.3fs", len(page_numbers), path, time.perf_counter() - start)
+    return page_numbers, path
 
 # Example usage:
 if __name__ == '__main__':
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(message)s")
     pdf_file_path =  os.path.join("pdf", "qes.pdf")  # Replace with your PDF file path
-    page_titles = extract_titles_from_pdf(pdf_file_path)
-    page_numbers = split_into_sections(page_titles)
-    get_tableofcontents(pdf_file_path)
-
-   # make new pdf from the page numbers in sections
-    with open(pdf_file_path, 'rb') as pdf_file:
-        doc = fitz.open(pdf_file_path)  # Open the PDF using fitz
-        new_pdf_name = pdf_file_path.split('.')[0] + '_abridged.pdf'
-        doc.select(page_numbers)
-        doc.save(new_pdf_name)
+
+    # make new pdf from the page numbers in sections
+    doc = fitz.open(pdf_file_path)  # Open the PDF using fitz
+    page_numbers, selection = select_pages(pdf_file_path, doc, workers=default_workers())
+    new_pdf_name = pdf_file_path.split('.')[0] + '_abridged.pdf'
+    doc.select(page_numbers)
+    doc.save(new_pdf_name)
         
     print(pdf_file_path)
     print("Length of abridged pdf: ", len(page_numbers))
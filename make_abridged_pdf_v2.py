@@ -1,7 +1,17 @@
 import fitz  # pymupdf is imported as fitz
+import logging
 import os
+import sys
+import time
+from keyword_matcher import KeywordMatcher
+from page_cache import PageTextCache, title_from_text
+from page_index import load_page_index
+from parallel_titles import WINDOW_PAGES, default_workers, page_texts
+from toc_selection import select_pages_from_toc
 
-possible_keywords = ["management" , "executive", "director" ,"senior management", "corporate structure", "corporate", "corporate profile"
+logger = logging.getLogger(__name__)
+
+possible_keywords = ["management" , "executive", "director" ,"senior management", "corporate structure", "corporate", "corporate profile",
                     "chairman statement", "chairman", "discussion and analysis", "discussion", "analysis",
                     "financial statements" , "notes to financial statements", "notes to the financial statements",
                     "corporate info" , "vision and mission", "vision" , "mission" , 
@@ -11,39 +21,38 @@ possible_keywords = ["management" , "executive", "director" ,"senior management"
 statement_keywords = ["financial statements" , "notes to financial statements", "notes to the financial statements"]
 finance_keywords = ["segment" , "geographical" , "business", "salary" , "remuneration" , "subsidiary" ,"subsidiaries", "associate" , "associates"]
 
-exclude_keywords = ["sustainability report", "sustainability", "risk management", "share buy back" , "audit committee", "compliance"
+exclude_keywords = ["sustainability report", "sustainability", "risk management", "share buy back" , "audit committee", "compliance",
                     "governance" , "internal control" , "general meeting" , "General Meetings" , "buy-back"]
 
-def extract_titles_from_pdf(pdf_path):
-    try:
-        doc = fitz.open(pdf_path)  # Open the PDF using fitz
-        num_pages = len(doc)
-        titles = []
-
-        for page_num in range(num_pages):
-            page = doc[page_num]
-
-            # Heuristic: Take the first few lines as the potential title, excluding the header
-            rect = page.rect  # Get the page rectangle
-            header_height = 45  # Define the height of the header to be removed
-            cropped_rect = fitz.Rect(rect.x0, rect.y0 + header_height, rect.x1, rect.y1)  # Define the crop box
-            text = page.get_text("text", clip=cropped_rect)  # Extract text using the crop box
-            lines = text.splitlines()  # Split the text into lines
+NUM_TITLE_LINES = 4  # Number of lines (after the header) considered for the title
+MIN_ABRIDGED_PAGES = 5  # Fewer selected pages than this means the selection failed; keep the full document
 
-            potential_title = ""
-            # Heuristic: Take the first few lines as the potential title
-            num_title_lines = min(4, len(lines))  # Consider up to 6 lines
 
-            for i in range(num_title_lines):
-                line = lines[i].strip()  # Remove leading/trailing whitespace
+def build_matcher():
+    """Compile all keyword lists once into a matcher that reports every category hit by a text."""
+    return KeywordMatcher({"possible": possible_keywords, "exclude": exclude_keywords,
+                           "statement": statement_keywords, "finance": finance_keywords})
 
-                if len(line) > 5 and len(line) < 100 : # Basic length checks
-                    potential_title += line + " "
+def extract_titles_from_pdf(pdf_path, cache=None, workers=1, pool=None):
+    """
+    Extracts potential titles from each page of a PDF file in a single pass.
 
-            potential_title = potential_title.strip() #Remove extra space
-            titles.append(potential_title)
+    When a `PageTextCache` is given, the clipped text of every page is kept in it
+    so later stages (`check_segments`) do not parse the page again.
+    With `workers` > 1 the pages are scanned by a process pool (see `parallel_titles.page_texts`).
+    """
+    own_cache = cache is None
+    try:
+        if own_cache:
+            cache = PageTextCache(pdf_path)  # Open the PDF using fitz
+        if workers > 1 and cache.pdf_path is not None:
+            cache.fill(page_texts(cache.pdf_path, workers, pool, num_pages=len(cache)))
+        titles = []
 
-        doc.close()
+        for page_num in range(len(cache)):
+            # Heuristic: Take the first few lines as the potential title, excluding the header
+            text = cache.text(page_num)
+            titles.append(title_from_text(text, NUM_TITLE_LINES))
         return titles
 
     except FileNotFoundError:
@@ -52,40 +61,44 @@ def extract_titles_from_pdf(pdf_path):
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
         return []
+    finally:
+        if own_cache and cache is not None:
+            cache.close()
     
     
-def check_segments(page_num, pdf_file_path):
-    doc = fitz.open(pdf_file_path)
-    page = doc[page_num]
-
-    # Heuristic: Take the first few lines as the potential title, excluding the header
-    rect = page.rect  # Get the page rectangle
-    header_height = 45  # Define the height of the header to be removed
-    cropped_rect = fitz.Rect(rect.x0, rect.y0 + header_height, rect.x1, rect.y1)  # Define the crop box
-    text = page.get_text("text", clip=cropped_rect)  # Extract text using the crop box
-    lines = text.splitlines()  # Split the text into lines
+def check_segments(page_num, pdf_file_path, cache=None, matcher=None):
+    if cache is None:
+        with PageTextCache(pdf_file_path) as page_cache:
+            return check_segments(page_num, pdf_file_path, page_cache, matcher)
+    if matcher is None:
+        matcher = build_matcher()
 
-    for line in lines:
-        if any(keyword in line.lower() for keyword in finance_keywords):
-            return True
-    else: return False
+    # keywords never span lines, so matching the whole text equals checking line by line
+    return "finance" in matcher.match(cache.text(page_num))
 
 
 #from page titles, split into sections
-def split_into_sections(page_titles , pdf_file_path):
+def split_into_sections(page_titles , pdf_file_path, cache=None, matcher=None, index=None):
+    if matcher is None:
+        matcher = build_matcher()
     list_of_pages = []
     next_page_flag = False ## next_page flag
     count = 0
     if page_titles:
         page_num = 0
         for page_num, title in enumerate(page_titles):
-            # print("Page:" , page_num , " -   ", title)  # debug
-            if any(keyword in title.lower() for keyword in possible_keywords) and not any(keyword in title.lower() for keyword in exclude_keywords):
-                if any(keyword in title.lower() for keyword in statement_keywords):
-                    if check_segments(page_num , pdf_file_path) == False:
-                        print("No Match SEGMENT:" , page_num , " -   ", title)  # debug
+            logger.debug("Page: %s - %s", page_num, title)
+            hits = matcher.match(title)  # every keyword category in the title, in one pass
+            if "possible" in hits and "exclude" not in hits:
+                if "statement" in hits:
+                    if index is not None:
+                        segment_found = index.has_finance(page_num)  # precomputed, no page parsing
+                    else:
+                        segment_found = check_segments(page_num , pdf_file_path, cache, matcher)
+                    if segment_found == False:
+                        logger.debug("No Match SEGMENT: %s - %s", page_num, title)
                         continue
-                print("Match:" , page_num , " -   ", title)  # debug
+                logger.debug("Match: %s - %s", page_num, title)
                 next_page_flag = True  ## possible next page is useful
                 count = 0 ## reset next page counter
                 list_of_pages.append(page_num)
@@ -94,46 +107,267 @@ def split_into_sections(page_titles , pdf_file_path):
 
             if title == "":
                 if next_page_flag and count < 3:
-                    print("Match:" , page_num , " -   ", title) # debug
+                    logger.debug("Match: %s - %s", page_num, title)
                     list_of_pages.append(page_num)
                     count =  count + 1
                     continue
                 else:
-                    print("No Match : " , page_num , " - ", title) # debug
+                    logger.debug("No Match : %s - %s", page_num, title)
                     count = 0
                     next_page_flag = False
                     continue
 
-            if any(keyword in title.lower() for keyword in exclude_keywords):
-                print("No Match, IF : " , page_num , " - ", title) # debug
+            if "exclude" in hits:
+                logger.debug("No Match, IF : %s - %s", page_num, title)
                 next_page_flag = False
                 continue
 
             else:
-                print("No Match, ELSE : " , page_num , " - ", title) # debug
+                logger.debug("No Match, ELSE : %s - %s", page_num, title)
 
             
     return list_of_pages
 
-def get_tableofcontents(filename):
+def select_pages(pdf_file_path, cache, workers=1, pool=None, matcher=None, timings=None):
+    """
+    Picks the pages to keep, from the PDF outline when it is usable, otherwise from the title scan.
+
+    The outline path (`toc_selection.select_pages_from_toc`) reads no page text at all;
+    the scan path runs `extract_titles_from_pdf` + `split_into_sections`.
+    If a `timings` dict is given, the seconds spent in title extraction and in the rest of
+    the selection are stored in it.
+
+    Returns:
+        tuple: (sorted page numbers, "toc" or "scan")
+    """
+    if matcher is None:
+        matcher = build_matcher()
+    start = time.perf_counter()
+    titles_seconds = 0.0
+
+    toc = get_tableofcontents(pdf_file_path, cache.doc)
+    page_numbers = select_pages_from_toc(toc, len(cache), matcher)
+    path = "toc"
+    if page_numbers is None:
+        titles_start = time.perf_counter()
+        page_titles = extract_titles_from_pdf(pdf_file_path, cache, workers=workers, pool=pool)
+        titles_seconds = time.perf_counter() - titles_start
+        page_numbers = split_into_sections(page_titles, pdf_file_path, cache, matcher)
+        path = "scan"
+
+    seconds = time.perf_counter() - start
+    if timings is not None:
+        timings.update(title_extraction=titles_seconds, section_selection=seconds - titles_seconds)
+    logger.info("Selected %d pages via %s in %.3fs", len(page_numbers), path, seconds)
+    return page_numbers, path
+
+
+def select_pages_from_index(index, matcher=None):
+    """
+    Same selection as `select_pages`, run entirely from a `page_index.PageIndex`.
+
+    No page of the PDF is parsed, so re-abridging after a keyword change is fast.
+
+    Returns:
+        tuple: (sorted page numbers, "toc" or "scan")
+    """
+    if matcher is None:
+        matcher = build_matcher()
+    start = time.perf_counter()
+
+    page_numbers = select_pages_from_toc(index.toc, len(index), matcher)
+    path = "toc"
+    if page_numbers is None:
+        page_numbers = split_into_sections(index.titles(NUM_TITLE_LINES), None, matcher=matcher, index=index)
+        path = "scan"
+
+    logger.info("Selected %d pages via %s (index) in %.3fs", len(page_numbers), path, time.perf_counter() - start)
+    return page_numbers, path
+
+
+def select_pages_scored(pdf_file_path, cache, max_pages=None, max_tokens=None, workers=1, pool=None, timings=None,
+                        scores=None):
+    """
+    Picks the pages to keep by relevance score within a page and/or token budget (see `page_scoring`).
+
+    `timings` gets the same keys as in `select_pages`; the per-page score report rows are
+    appended to `scores` when it is given.
+
+    Returns:
+        tuple: (sorted page numbers, "scored")
+    """
+    from page_scoring import score_pages, select_pages_by_score
+
+    start = time.perf_counter()
+    if workers > 1 and cache.pdf_path is not None:
+        cache.fill(page_texts(cache.pdf_path, workers, pool, num_pages=len(cache)))
+    texts = [cache.text(page_num) for page_num in range(len(cache))]
+    titles_seconds = time.perf_counter() - start
+    rows = score_pages(texts)
+    page_numbers = select_pages_by_score(rows, max_pages, max_tokens)
+    if scores is not None:
+        scores.extend(rows)
+
+    seconds = time.perf_counter() - start
+    if timings is not None:
+        timings.update(title_extraction=titles_seconds, section_selection=seconds - titles_seconds)
+    logger.info("Selected %d pages by score in %.3fs", len(page_numbers), seconds)
+    return page_numbers, "scored"
+
+
+def abridge_document(doc, pdf_file_path=None, min_pages=MIN_ABRIDGED_PAGES, workers=1, pool=None, timings=None,
+                     max_pages=None, max_tokens=None, scores=None):
+    """
+    Abridges an open document in place (`doc.select`) to the pages picked by `select_pages`,
+    or by `select_pages_scored` when a page or token budget is given.
 
-    file  = fitz.open(filename)
+    When fewer than `min_pages` pages are selected the document is left unchanged; with a
+    budget a small selection is deliberate, and only an empty one keeps the full document.
+    `pdf_file_path` is only needed for parallel page scanning (`workers` > 1).
+    `timings` is passed on to the selection, and so is `scores` (the per-page score report
+    rows of a scored selection).
+
+    Returns:
+        tuple: (page numbers kept, "toc", "scan" or "scored", True if the full document was kept)
+    """
+    num_pages = len(doc)
+    cache = PageTextCache(pdf_file_path, doc=doc)
+    if max_pages is not None or max_tokens is not None:
+        page_numbers, selection = select_pages_scored(pdf_file_path, cache, max_pages, max_tokens, workers, pool,
+                                                      timings=timings, scores=scores)
+        min_pages = 1  # a budget that only fits a few pages is deliberate
+    else:
+        page_numbers, selection = select_pages(pdf_file_path, cache, workers, pool, timings=timings)
+    if len(page_numbers) < min_pages or len(page_numbers) == num_pages:
+        return list(range(num_pages)), selection, True
+
+    doc.select(page_numbers)
+    return page_numbers, selection, False
+
+
+def abridge_pdf_bytes(pdf_bytes, min_pages=MIN_ABRIDGED_PAGES):
+    """
+    Abridges a PDF held in memory to the pages picked by `select_pages`.
+
+    Nothing is written to disk. When fewer than `min_pages` pages are selected the
+    full document is returned unchanged.
+
+    Args:
+        pdf_bytes (bytes): The full PDF.
+        min_pages (int): Minimum selection size before falling back to the full document.
+
+    Returns:
+        tuple: (PDF bytes to use, stats dict with pages/bytes before and after and a `fallback` flag)
+    """
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        num_pages = len(doc)
+        page_numbers, selection, fallback = abridge_document(doc, min_pages=min_pages)
+        stats = {"pages_before": num_pages, "pages_after": len(page_numbers),
+                 "bytes_before": len(pdf_bytes), "bytes_after": len(pdf_bytes),
+                 "selection": selection, "fallback": fallback}
+        if fallback:
+            return pdf_bytes, stats
+
+        # garbage drops objects only the removed pages used; no_new_id keeps the bytes (and cache key) stable
+        abridged = doc.tobytes(garbage=3, deflate=True, no_new_id=True)
+    finally:
+        doc.close()
+
+    stats["bytes_after"] = len(abridged)
+    return abridged, stats
+
+
+def page_runs(page_numbers):
+    """Groups sorted page numbers into (first, last) runs of consecutive pages."""
+    runs = []
+    for page_num in page_numbers:
+        if runs and page_num == runs[-1][1] + 1:
+            runs[-1][1] = page_num
+        else:
+            runs.append([page_num, page_num])
+    return [tuple(run) for run in runs]
+
+
+def write_pages(pdf_path, page_numbers, output_path):
+    """
+    Writes the given pages of a PDF on disk to a new PDF file.
+
+    The pages are copied run by run into a fresh document (`insert_pdf`) instead of
+    rewriting the full one with `doc.select`, and the result is saved straight to disk.
+    """
+    tmp_path = output_path + ".tmp"
+    with fitz.open(pdf_path) as doc, fitz.open() as abridged:
+        runs = page_runs(page_numbers)
+        for i, (first, last) in enumerate(runs):
+            # final=False keeps the graft map, so objects shared by the runs (fonts) are copied once
+            abridged.insert_pdf(doc, from_page=first, to_page=last, final=i == len(runs) - 1)
+            fitz.TOOLS.store_shrink(100)
+        abridged.save(tmp_path, garbage=3, deflate=True, no_new_id=True)
+    os.replace(tmp_path, output_path)
+
+
+def abridge_file(pdf_path, output_path, min_pages=MIN_ABRIDGED_PAGES, window=WINDOW_PAGES):
+    """
+    Memory-bounded abridging of a PDF on disk; the PDF is never loaded into memory as a whole.
+
+    The pages are scanned `window` at a time into the page index (`load_page_index`), the
+    selection runs on the index (`select_pages_from_index`) and the selected pages are written
+    to `output_path` with `write_pages`. When fewer than `min_pages` pages are selected
+    nothing is written and the full document is used.
+
+    Returns:
+        tuple: (path of the PDF to use, stats dict as returned by `abridge_pdf_bytes`)
+    """
+    index = load_page_index(pdf_path, finance_keywords, window=window)
+    page_numbers, selection = select_pages_from_index(index)
+    num_pages = len(index)
+    fallback = len(page_numbers) < min_pages or len(page_numbers) == num_pages
+    stats = {"pages_before": num_pages, "pages_after": num_pages if fallback else len(page_numbers),
+             "bytes_before": os.path.getsize(pdf_path), "bytes_after": os.path.getsize(pdf_path),
+             "selection": selection, "fallback": fallback}
+    if fallback:
+        return pdf_path, stats
+
+    write_pages(pdf_path, page_numbers, output_path)
+    stats["bytes_after"] = os.path.getsize(output_path)
+    return output_path, stats
+
+
+def get_tableofcontents(filename, doc=None):
+
+    file  = doc if doc is not None else fitz.open(filename)
     toc = file.get_toc()
-    print("Table of Contents : ", toc)
+    logger.debug("Table of Contents : %s", toc)
+    return toc
 
 # Example usage:
+#   python make_abridged_pdf_v2.py [report.pdf ...]
+# Page text is read from the per-PDF index in .cache/page_index (built on first run),
+# so re-running after a keyword change does not parse any page again.
+# COMPACT_IMAGES=downsample|strip compacts the images of the output (see pdf_compaction);
+# IMAGE_ONLY=drop also drops image-only pages.
 if __name__ == '__main__':
-    pdf_file_path =  os.path.join("pdf", "rohas-annual.pdf")  # Replace with your PDF file path
-    page_titles = extract_titles_from_pdf(pdf_file_path)
-    page_numbers = split_into_sections(page_titles, pdf_file_path)
-    get_tableofcontents(pdf_file_path)
-
-   # make new pdf from the page numbers in sections
-    with open(pdf_file_path, 'rb') as pdf_file:
-        doc = fitz.open(pdf_file_path)  # Open the PDF using fitz
-        new_pdf_name = pdf_file_path.split('.')[0] + '_abridged_v2.pdf'
-        doc.select(page_numbers)
-        doc.save(new_pdf_name)
-        
-    print(pdf_file_path)
-    print("Length of abridged pdf: ", len(page_numbers))
+    from pdf_compaction import compact_document
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(message)s")
+    compact_mode = os.getenv("COMPACT_IMAGES")
+    pdf_file_paths = sys.argv[1:] or [os.path.join("pdf", "rohas-annual.pdf")]  # Replace with your PDF file path
+
+    for pdf_file_path in pdf_file_paths:
+        index = load_page_index(pdf_file_path, finance_keywords, workers=default_workers())
+        page_numbers, selection = select_pages_from_index(index)
+
+        # make new pdf from the page numbers in sections
+        with fitz.open(pdf_file_path) as doc:
+            new_pdf_name = pdf_file_path.split('.')[0] + '_abridged_v2.pdf'
+            doc.select(page_numbers)
+            if compact_mode:
+                compact_document(doc, compact_mode, os.getenv("IMAGE_ONLY", "mark"))
+            start = time.perf_counter()
+            doc.save(new_pdf_name, garbage=3, deflate=True)
+            save_seconds = time.perf_counter() - start
+
+        print(pdf_file_path)
+        print("Length of abridged pdf: ", len(page_numbers))
+        print(f"Size: {os.path.getsize(pdf_file_path)} -> {os.path.getsize(new_pdf_name)} bytes, saved in {save_seconds:.2f}s")
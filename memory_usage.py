@@ -0,0 +1,68 @@
+"""
+Peak resident memory (RSS) of the current process, per document.
+
+On Linux the peak (VmHWM) can be reset through /proc/self/clear_refs, so the peak of one
+document is measured even in a long-running worker:
+
+    with PeakRSS() as peak:
+        process(pdf_path)
+    print(peak.mb)
+
+Elsewhere the process-lifetime peak from `resource.getrusage` is reported instead
+(`PeakRSS.per_document` is then False).
+"""
+import re
+import sys
+
+_STATUS_PATH = "/proc/self/status"
+_CLEAR_REFS_PATH = "/proc/self/clear_refs"
+
+
+def reset_peak_rss():
+    """Resets the peak RSS of this process to the current RSS. Returns False where that is not supported."""
+    try:
+        with open(_CLEAR_REFS_PATH, "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Peak RSS of this process in MB (since the last `reset_peak_rss`, where supported)."""
+    try:
+        with open(_STATUS_PATH, "r") as f:
+            match = re.search(r"^VmHWM:\s+(\d+) kB", f.read(), re.MULTILINE)
+        if match:
+            return int(match.group(1)) / 1024
+    except OSError:
+        pass
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, kB on Linux
+
+
+class PeakRSS:
+    """
+    Measures the peak RSS of a block.
+
+    Args:
+        limit_mb (float): Optional cap; `over_limit` is True when the peak went above it.
+    """
+
+    def __init__(self, limit_mb=None):
+        self.limit_mb = limit_mb
+        self.mb = None
+        self.per_document = False
+
+    @property
+    def over_limit(self):
+        return self.limit_mb is not None and self.mb is not None and self.mb > self.limit_mb
+
+    def __enter__(self):
+        self.per_document = reset_peak_rss()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.mb = round(peak_rss_mb(), 1)
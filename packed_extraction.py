@@ -0,0 +1,273 @@
+"""
+Packed extraction: several abridged reports in one Gemini request, with one copy of the prompt.
+
+The extraction prompt (several KB of instructions and an example structure) is re-sent with
+every single-document call, and for small abridged reports it is a large share of the input
+tokens. Here the reports are grouped, in order, into packs that stay within an input token
+budget (`max_tokens`, estimated per page, see `page_scoring.estimate_tokens`) and within
+PACK_OUTPUT_TOKENS of expected output, because the answers for every report of a pack
+come back in one response. A pack is one request: each PDF preceded by its label
+(report_1, report_2, ...), then the prompt once, asking for one JSON object with a member
+per label (schema-constrained with `structured_extraction.response_schema`).
+
+The response is split per label and every report is validated section by section
+(`structured_extraction.invalid_sections`). A report that is missing from the response
+(a truncated answer) or has an invalid section is extracted again on its own with
+`structured_extraction.analyze_pdf_structured`. A pack of one report goes there directly.
+
+Usage:
+    python packed_extraction.py report1.pdf report2.pdf ... [--prompt-file annuals.txt] [--no-abridge]
+                                [--max-tokens 120000] [--output-dir json] [--no-cache]
+                                [--telemetry telemetry.jsonl]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import fitz  # pymupdf is imported as fitz
+
+from batch_extract import RateLimiter, generate_with_backoff
+from gemini_common import MODEL_NAME, get_client
+from page_cache import clipped_text
+from page_scoring import TEXT_CHARS_PER_TOKEN, estimate_tokens
+from report_extraction import EXTRACTION_PROMPT, with_percentages
+from response_cache import ResponseCache, cache_key, usage_to_dict
+from structured_extraction import analyze_pdf_structured, invalid_sections, response_schema, salvage_sections
+from telemetry import DEFAULT_TELEMETRY_PATH, NullSink, TelemetrySink, token_fields
+
+PACK_INPUT_TOKENS = 120000  # Default input budget of one packed request, prompt included
+PACK_OUTPUT_TOKENS = 8192  # Output cap of one Gemini 2.0 Flash response, shared by the reports of a pack
+OUTPUT_TOKENS_PER_REPORT = 2500  # Expected JSON output of one report; caps a pack at 3 reports
+PACKED_CACHE_TAG = "packed\n"  # Prefix of the cache keys of results that came from a pack
+
+
+def report_tokens(pdf_bytes):
+    """Estimated Gemini input tokens of one PDF."""
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return sum(estimate_tokens(clipped_text(page)) for page in doc)
+
+
+def make_packs(tokens, prompt_tokens=0, max_tokens=PACK_INPUT_TOKENS,
+               max_reports=PACK_OUTPUT_TOKENS // OUTPUT_TOKENS_PER_REPORT):
+    """
+    Groups reports, in order, into packs within the token budget.
+
+    Args:
+        tokens (list): (name, estimated input tokens) per report.
+        prompt_tokens (int): Tokens of the one copy of the prompt every pack carries.
+
+    Returns:
+        list: Lists of names. A report over the budget on its own gets a pack of its own.
+    """
+    packs, pack, used = [], [], prompt_tokens
+    for name, count in tokens:
+        if pack and (used + count > max_tokens or len(pack) >= max_reports):
+            packs.append(pack)
+            pack, used = [], prompt_tokens
+        pack.append(name)
+        used += count
+    if pack:
+        packs.append(pack)
+    return packs
+
+
+def pack_prompt(prompt, labels):
+    return (f"The {len(labels)} PDF documents above are separate annual reports, each preceded by its label "
+            f"({', '.join(labels)}). Apply the instructions below to each report on its own and never combine "
+            "information from different reports. Return ONE JSON object with one member per label, whose value is "
+            "the extraction for that report.\n\n" + prompt)
+
+
+def pack_schema(labels):
+    schema = response_schema()
+    return {"type": "OBJECT", "properties": {label: schema for label in labels}, "required": list(labels)}
+
+
+async def extract_pack(client, names, reports, prompt, limiter, model, temperature):
+    """
+    Runs one packed request. Always returns a result dict; failures are reported in `error`.
+
+    Returns:
+        dict: names, labels, data (name -> raw report data, only for the labels in the
+        response), usage_metadata, bytes_in, response_bytes, seconds, attempts and error.
+    """
+    from google.genai import types
+
+    labels = [f"report_{i + 1}" for i in range(len(names))]
+    result = {"names": names, "labels": labels, "data": {}, "usage_metadata": None,
+              "bytes_in": sum(len(reports[name]) for name in names), "response_bytes": 0, "seconds": 0.0,
+              "attempts": 0, "error": None}
+    start = time.perf_counter()
+    try:
+        contents = []
+        for label, name in zip(labels, names):
+            contents += [f"Document {label}:", types.Part.from_bytes(data=reports[name], mime_type="application/pdf")]
+        contents.append(pack_prompt(prompt, labels))
+        config = types.GenerateContentConfig(temperature=temperature, response_mime_type="application/json",
+                                             response_schema=pack_schema(labels))
+        response, result["attempts"] = await generate_with_backoff(client, contents, config, limiter, model)
+        # a truncated answer still gives the reports that were complete
+        packed = salvage_sections(response.text)
+        result.update(data={name: packed[label] for label, name in zip(labels, names) if label in packed},
+                      usage_metadata=usage_to_dict(response.usage_metadata),
+                      response_bytes=len((response.text or "").encode("utf-8")))
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        result["seconds"] = time.perf_counter() - start
+    return result
+
+
+async def extract_packs(packs, reports, prompt, client, model, temperature, requests_per_minute=None,
+                        tokens_per_minute=None):
+    """Runs the packed requests concurrently; one result dict per pack (see `extract_pack`)."""
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    return await asyncio.gather(*(extract_pack(client, names, reports, prompt, limiter, model, temperature)
+                                  for names in packs))
+
+
+def analyze_reports_packed(reports, prompt=EXTRACTION_PROMPT, client=None, temperature=0.5, model=MODEL_NAME,
+                           cache=None, refresh=False, max_tokens=PACK_INPUT_TOKENS, stats=None,
+                           requests_per_minute=None, tokens_per_minute=None):
+    """
+    Extracts many (abridged) reports with packed requests.
+
+    Args:
+        reports (dict): name -> PDF bytes, in the order to pack them.
+        max_tokens (int): Input token budget of one request.
+        Others: see `report_extraction.analyze_pdf_bytes`.
+
+    Returns:
+        dict: name -> extraction ({} when even the single-document call failed).
+
+    `stats` gets `packs` (the result dicts of `extract_pack` with their prompt_tokens_saved), the
+    reports extracted again on their own with the reason (`fallbacks`), the cache hits
+    (`cached`), the estimated prompt tokens not re-sent (`prompt_tokens_saved`) and the
+    summed `usage_metadata` of the packed calls.
+    """
+    if stats is None:
+        stats = {}
+    stats.update(packs=[], fallbacks={}, cached=[], prompt_tokens_saved=0, usage_metadata={})
+    if client is None:
+        client = get_client()
+    schema_text = json.dumps(response_schema(), sort_keys=True)
+    keys = {name: cache_key(pdf_bytes, PACKED_CACHE_TAG + prompt + schema_text, model, temperature)
+            for name, pdf_bytes in reports.items()}
+
+    results = {}
+    for name in reports:
+        cached = cache.get(keys[name]) if cache is not None and not refresh else None
+        if cached is not None:
+            results[name] = cached["json_data"]
+            stats["cached"].append(name)
+
+    prompt_tokens = len(prompt) // TEXT_CHARS_PER_TOKEN
+    pending = [(name, report_tokens(pdf_bytes)) for name, pdf_bytes in reports.items() if name not in results]
+    packs = make_packs(pending, prompt_tokens, max_tokens)
+    for names in packs:
+        if len(names) == 1:
+            stats["fallbacks"][names[0]] = "alone in its pack"
+    packed = [names for names in packs if len(names) > 1]
+    if packed:
+        print(f"Packing {sum(map(len, packed))} reports into {len(packed)} requests")
+        for pack in asyncio.run(extract_packs(packed, reports, prompt, client, model, temperature,
+                                              requests_per_minute, tokens_per_minute)):
+            stats["packs"].append(pack)
+            pack["prompt_tokens_saved"] = 0 if pack["error"] else (len(pack["names"]) - 1) * prompt_tokens
+            stats["prompt_tokens_saved"] += pack["prompt_tokens_saved"]
+            if pack["error"]:
+                print(f"ERROR: packed request for {', '.join(pack['names'])} failed: {pack['error']}")
+            for key, value in (pack["usage_metadata"] or {}).items():
+                if isinstance(value, int):
+                    stats["usage_metadata"][key] = stats["usage_metadata"].get(key, 0) + value
+            for name in pack["names"]:
+                if name not in pack["data"]:
+                    stats["fallbacks"][name] = pack["error"] or "missing from the response"
+                    continue
+                invalid = invalid_sections(pack["data"][name]) if isinstance(pack["data"][name], dict) else {
+                    "$": ["not an object"]}
+                if invalid:
+                    section, errors = next(iter(invalid.items()))
+                    stats["fallbacks"][name] = f"invalid {section} ({errors[0]})"
+                    continue
+                results[name] = pack["data"][name]
+                if cache is not None:
+                    cache.put(keys[name], json.dumps(results[name], ensure_ascii=False), results[name])
+
+    for name, reason in stats["fallbacks"].items():
+        print(f"Extracting {name} on its own: {reason}")
+        results[name] = analyze_pdf_structured(reports[name], prompt, client, temperature, model, cache=cache,
+                                               refresh=refresh, label=name)
+    return {name: results[name] for name in reports}
+
+
+def main(argv=None):
+    from http_download import download_pdf
+    from job_runner import job_name
+    from make_abridged_pdf_v2 import abridge_pdf_bytes
+    from pipeline import write_outputs
+
+    parser = argparse.ArgumentParser(description="Extract several annual reports per Gemini request.")
+    parser.add_argument("sources", nargs="+", help="local PDF paths or URLs")
+    parser.add_argument("--prompt-file", help="defaults to the built-in extraction prompt")
+    parser.add_argument("--no-abridge", action="store_true", help="send the full PDFs")
+    parser.add_argument("--max-tokens", type=int, default=PACK_INPUT_TOKENS, help="input token budget per request")
+    parser.add_argument("--output-dir", default="json")
+    parser.add_argument("--temperature", type=float, default=0.5)
+    parser.add_argument("--no-cache", action="store_true", help="bypass the response cache")
+    parser.add_argument("--rpm", type=int, default=None, help="requests per minute")
+    parser.add_argument("--tpm", type=int, default=None, help="tokens per minute")
+    parser.add_argument("--telemetry", default=DEFAULT_TELEMETRY_PATH, help="JSONL file for per-pack records")
+    args = parser.parse_args(argv)
+
+    prompt = EXTRACTION_PROMPT
+    if args.prompt_file:
+        with open(args.prompt_file, "r", encoding="utf-8") as f:
+            prompt = f.read()
+    try:
+        client = get_client()
+    except Exception as e:
+        print(f"Error configuring Gemini API: {e}")
+        return 1
+
+    if len(set(args.sources)) < len(args.sources):
+        print("ERROR: the same source is given more than once")
+        return 1
+
+    reports = {}
+    for source in args.sources:
+        # named after the source, not the download cache path; a hash suffix keeps equal basenames apart
+        name = job_name(source, reports)
+        path = download_pdf(source)[0] if source.startswith(("http://", "https://")) else source
+        with open(path, "rb") as f:
+            pdf_bytes = f.read()
+        if not args.no_abridge:
+            pdf_bytes, abridge_stats = abridge_pdf_bytes(pdf_bytes)
+            print(f"Abridged {source}: {abridge_stats['pages_before']} -> {abridge_stats['pages_after']} pages")
+        reports[name] = pdf_bytes
+
+    stats = {}
+    results = analyze_reports_packed(reports, prompt, client, args.temperature,
+                                     cache=None if args.no_cache else ResponseCache(), max_tokens=args.max_tokens,
+                                     stats=stats, requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+    telemetry = TelemetrySink(args.telemetry) if args.telemetry else NullSink()
+    for pack in stats["packs"]:
+        telemetry.emit(",".join(pack["names"]), "gemini_pack", pack["seconds"], reports=len(pack["names"]),
+                       bytes_in=pack["bytes_in"], bytes_out=pack["response_bytes"], error=pack["error"],
+                       fallbacks=sum(1 for name in pack["names"] if name in stats["fallbacks"]),
+                       prompt_tokens_saved=pack["prompt_tokens_saved"],
+                       **token_fields(pack["usage_metadata"]))
+
+    for name, data in results.items():
+        written = write_outputs({"name": name, "data": data, "calc_data": with_percentages(data)},
+                                ("pdf_json", "calc"), args.output_dir)
+        print(f"{name}: wrote {', '.join(written)}")
+    print(f"{len(reports)} reports, {len(stats['packs'])} packed requests, {len(stats['fallbacks'])} single "
+          f"calls, {len(stats['cached'])} cached, ~{stats['prompt_tokens_saved']} prompt tokens not re-sent")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+import fitz  # pymupdf is imported as fitz
+
+HEADER_HEIGHT = 45  # Height of the page header that is cropped off before reading text
+
+
+def clipped_text(page, header_height=HEADER_HEIGHT):
+    """Return the text of a page with the header band cropped off."""
+    rect = page.rect  # Get the page rectangle
+    cropped_rect = fitz.Rect(rect.x0, rect.y0 + header_height, rect.x1, rect.y1)  # Define the crop box
+    return page.get_text("text", clip=cropped_rect)  # Extract text using the crop box
+
+
+def title_from_text(text, num_title_lines):
+    """
+    Builds the potential title of a page from its clipped text.
+
+    Heuristic: take the first few lines and keep the ones that are not too short or too long.
+    """
+    potential_title = ""
+    for line in text.splitlines()[:num_title_lines]:
+        line = line.strip()  # Remove leading/trailing whitespace
+
+        if len(line) > 5 and len(line) < 100 : # Basic length checks
+            potential_title += line + " "
+
+    return potential_title.strip() #Remove extra space
+
+
+class PageTextCache:
+    """
+    Clipped page text of one open PDF, parsed at most once per page.
+
+    The open document is shared by every stage that needs it (title extraction,
+    segment checks, `doc.select`), so the file is opened and each page is parsed once.
+
+    Args:
+        pdf_path (str): The path to the PDF file. Ignored when `doc` is given.
+        doc (fitz.Document): An already open document to wrap.
+    """
+
+    def __init__(self, pdf_path=None, doc=None):
+        self.pdf_path = pdf_path
+        self.doc = doc if doc is not None else fitz.open(pdf_path)
+        self._texts = {}
+
+    def __len__(self):
+        return len(self.doc)
+
+    def text(self, page_num):
+        """Return the clipped text of a page, reading it from the document on first use."""
+        if page_num not in self._texts:
+            self._texts[page_num] = clipped_text(self.doc[page_num])
+        return self._texts[page_num]
+
+    def fill(self, texts):
+        """Store clipped text read elsewhere (e.g. by worker processes), indexed by page number."""
+        self._texts.update(enumerate(texts))
+
+    def close(self):
+        self._texts.clear()
+        self.doc.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
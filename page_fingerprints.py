@@ -0,0 +1,327 @@
+"""
+Incremental extraction across years from page fingerprints.
+
+Large parts of a company's annual report barely change from one year to the next (corporate
+structure, subsidiaries, land). Every page the extraction routes to a section is
+fingerprinted from its normalised text (lower case, whitespace collapsed, years and page
+numbers removed):
+    - text: hash of the whole normalised text;
+    - numbers: hash of the numbers on the page, in order;
+    - sketch: the SKETCH_SIZE smallest hashes of its SHINGLE_WORDS-word shingles (bottom-k
+      MinHash), which estimates the word overlap of two pages.
+A page is unchanged from a page of the previous year when its text is identical, or nearly
+unchanged when it has the same numbers and at least NEAR_DUPLICATE of the same wording, so
+a reworded paragraph still matches but a changed amount or ownership never does.
+
+The fingerprints are kept per company and year in a SQLite index, with the extraction of
+each report. When every page of a section (a shard of `sharded_extraction`) matches a page
+of the same section in the company's previous report, and vice versa, that section is
+taken from the previous extraction. Only the pages of the other sections are sent, as
+sharded sub-requests. The pages and estimated input tokens that were not sent are reported.
+
+Usage:
+    python page_fingerprints.py compare last_year_abridged.pdf this_year_abridged.pdf
+    python page_fingerprints.py reports [--db fingerprints.db]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+import time
+
+import fitz  # pymupdf is imported as fitz
+
+from gemini_common import MODEL_NAME
+from page_cache import clipped_text
+from page_scoring import estimate_tokens
+from report_extraction import EXTRACTION_PROMPT
+from result_store import guess_year
+from sharded_extraction import SHARDS, collect_results, extract_shards, merge_shards, route_pages, shard_pdfs
+
+DEFAULT_FINGERPRINT_DB = "fingerprints.db"
+SHINGLE_WORDS = 5
+SKETCH_SIZE = 64  # Shingle hashes kept per page
+NEAR_DUPLICATE = 0.8  # Estimated share of shingles in common for a page with the same numbers to count as unchanged
+MIN_SHARED_PAGES = 3  # Identical pages needed to recognise the company of an unlabelled report
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    doc_hash TEXT PRIMARY KEY,
+    name TEXT,
+    company TEXT NOT NULL,
+    year INTEGER,
+    stored_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_company_year ON reports (company, year);
+
+CREATE TABLE IF NOT EXISTS pages (
+    doc_hash TEXT NOT NULL REFERENCES reports (doc_hash) ON DELETE CASCADE,
+    shard TEXT NOT NULL,
+    page_num INTEGER NOT NULL,
+    text_hash TEXT NOT NULL,
+    numbers_hash TEXT NOT NULL,
+    sketch TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_doc ON pages (doc_hash);
+CREATE INDEX IF NOT EXISTS pages_text_hash ON pages (text_hash);
+"""
+
+_YEAR = re.compile(r"(?<!\d)(19|20)\d\d(?!\d)")
+_NUMBER = re.compile(r"\d[\d,.]*")
+
+
+def normalize_page(text):
+    """Page text without what changes every year regardless of content: case, spacing, years, page numbers."""
+    lines = [" ".join(line.split()).lower() for line in text.splitlines() if line.strip()]
+    while lines and lines[-1].isdigit():  # the page number in the footer
+        lines.pop()
+    while lines and lines[0].isdigit():
+        lines.pop(0)
+    return _YEAR.sub("yyyy", "\n".join(lines))
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def page_fingerprint(text):
+    """Fingerprint of one page's clipped text: {"text": hash, "numbers": hash, "sketch": [ints]}."""
+    text = normalize_page(text)
+    words = _NUMBER.sub(" ", text).split()
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = sorted(int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+                    for shingle in shingles)
+    return {"text": _digest(text), "numbers": _digest(" ".join(_NUMBER.findall(text))),
+            "sketch": hashes[:SKETCH_SIZE]}
+
+
+def similarity(a, b):
+    """Estimated share of shingles two fingerprinted pages have in common (bottom-k MinHash)."""
+    if a["text"] == b["text"]:
+        return 1.0
+    first, second = set(a["sketch"]), set(b["sketch"])
+    union = sorted(first | second)[:SKETCH_SIZE]
+    if not union:
+        return 1.0
+    return sum(1 for value in union if value in first and value in second) / len(union)
+
+
+def unchanged(a, b):
+    """True when page `a` is the same as page `b` or only reworded (same numbers, NEAR_DUPLICATE wording)."""
+    return a["text"] == b["text"] or (a["numbers"] == b["numbers"] and similarity(a, b) >= NEAR_DUPLICATE)
+
+
+def document_fingerprints(doc, routes):
+    """shard -> fingerprints of its routed pages, in page order."""
+    fingerprints = {}
+    for shard, pages in routes.items():
+        fingerprints[shard] = [page_fingerprint(clipped_text(doc[page_num])) for page_num in pages]
+    return fingerprints
+
+
+def unchanged_shards(current, previous):
+    """
+    The shards whose pages all match a page of the same shard of the previous report, and the other way round.
+
+    Args:
+        current, previous (dict): shard -> fingerprints, see `document_fingerprints`.
+    """
+    same = []
+    for shard, pages in current.items():
+        before = previous.get(shard)
+        if not pages or not before:
+            continue
+        if (all(any(unchanged(page, old) for old in before) for page in pages)
+                and all(any(unchanged(page, old) for page in pages) for old in before)):
+            same.append(shard)
+    return same
+
+
+class FingerprintIndex:
+    """
+    SQLite index of the page fingerprints and extraction of every report, per company and year.
+
+    Args:
+        db_path (str): Database file, created on first use. ":memory:" for a throwaway index.
+    """
+
+    def __init__(self, db_path=DEFAULT_FINGERPRINT_DB):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(SCHEMA)
+
+    def add_report(self, doc_hash, company, year, name, fingerprints, data):
+        """Stores (or replaces) one report: its fingerprints (shard -> list) and its extraction."""
+        with self.conn:
+            self.conn.execute("DELETE FROM reports WHERE doc_hash = ?", (doc_hash,))
+            self.conn.execute("INSERT INTO reports VALUES (?, ?, ?, ?, ?, ?)",
+                              (doc_hash, name, company, year, time.time(), json.dumps(data, ensure_ascii=False)))
+            self.conn.executemany("INSERT INTO pages VALUES (?, ?, ?, ?, ?, ?)", [
+                (doc_hash, shard, i, page["text"], page["numbers"], json.dumps(page["sketch"]))
+                for shard, pages in fingerprints.items() for i, page in enumerate(pages)])
+
+    def find_company(self, fingerprints, doc_hash=None):
+        """The company of the stored report sharing the most identical pages (at least MIN_SHARED_PAGES), or None."""
+        text_hashes = sorted({page["text"] for pages in fingerprints.values() for page in pages})
+        if not text_hashes:
+            return None
+        placeholders = ", ".join("?" * len(text_hashes))
+        row = self.conn.execute(
+            "SELECT r.company, COUNT(DISTINCT p.text_hash) AS shared FROM pages p "
+            f"JOIN reports r ON r.doc_hash = p.doc_hash WHERE p.text_hash IN ({placeholders}) AND r.doc_hash != ? "
+            "GROUP BY r.company ORDER BY shared DESC LIMIT 1", text_hashes + [doc_hash]).fetchone()
+        return row[0] if row and row[1] >= MIN_SHARED_PAGES else None
+
+    def previous_report(self, company, year=None, doc_hash=None):
+        """
+        The company's latest report of a known year before `year`; the one stored last when
+        `year` is unknown.
+
+        Returns:
+            dict: doc_hash, name, year, data and fingerprints (shard -> list), or None.
+        """
+        if year is None:
+            row = self.conn.execute(
+                "SELECT doc_hash, name, year, data FROM reports WHERE company = ? AND doc_hash != ? "
+                "ORDER BY stored_at DESC LIMIT 1", (company, doc_hash)).fetchone()
+        else:
+            row = self.conn.execute(
+                "SELECT doc_hash, name, year, data FROM reports WHERE company = ? AND doc_hash != ? AND year < ? "
+                "ORDER BY year DESC, stored_at DESC LIMIT 1", (company, doc_hash, year)).fetchone()
+        if row is None:
+            return None
+        fingerprints = {}
+        for shard, text_hash, numbers_hash, sketch in self.conn.execute(
+                "SELECT shard, text_hash, numbers_hash, sketch FROM pages WHERE doc_hash = ? ORDER BY shard, page_num",
+                (row[0],)):
+            fingerprints.setdefault(shard, []).append(
+                {"text": text_hash, "numbers": numbers_hash, "sketch": json.loads(sketch)})
+        return {"doc_hash": row[0], "name": row[1], "year": row[2], "data": json.loads(row[3]),
+                "fingerprints": fingerprints}
+
+    def reports(self):
+        """(company, year, name, doc_hash, page count) of every stored report."""
+        return self.conn.execute(
+            "SELECT r.company, r.year, r.name, r.doc_hash, COUNT(p.doc_hash) FROM reports r "
+            "LEFT JOIN pages p ON p.doc_hash = r.doc_hash GROUP BY r.doc_hash ORDER BY r.company, r.year").fetchall()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def analyze_pdf_incremental(pdf_bytes, prompt=EXTRACTION_PROMPT, client=None, temperature=0.5, model=MODEL_NAME,
+                            cache=None, refresh=False, label="PDF", stats=None, sessions=None, index=None,
+                            company=None, year=None):
+    """
+    Version of `sharded_extraction.analyze_pdf_sharded` that reuses the sections of the
+    company's previous report whose pages did not change, with the same arguments plus:
+
+    Args:
+        index (FingerprintIndex): Fingerprints and extractions of the earlier reports. The
+            result is added to it when every sub-request returned all of its sections.
+        company (str): Company of the report; recognised from its pages when None, else the label.
+        year (int): Filing year; guessed from the label when None. The report is compared with
+            the latest earlier year and stored under this year; when it stays unknown, it is
+            compared with the company's report stored last and stored without a year.
+
+    `stats` gets the sharded stats plus the previous report (`reused_from`), the reused
+    sections (`reused_sections`) and the pages and estimated input tokens that were not sent
+    (`pages_saved`, `tokens_saved`).
+    """
+    if stats is None:
+        stats = {}
+    stats.update(cache="off" if cache is None else "miss", gemini_seconds=0.0, parse_seconds=0.0, reused_from=None,
+                 reused_sections=[], pages_saved=0, tokens_saved=0)
+    if index is None:
+        index = FingerprintIndex()
+    doc_hash = hashlib.sha256(pdf_bytes).hexdigest()
+    try:
+        start = time.perf_counter()
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            routes = route_pages(doc)
+            fingerprints = document_fingerprints(doc, routes)
+            tokens = {page_num: estimate_tokens(clipped_text(doc[page_num]))
+                      for pages in routes.values() for page_num in pages}
+        stats["routing_seconds"] = time.perf_counter() - start
+
+        company = company or index.find_company(fingerprints, doc_hash) or label
+        if year is None:
+            year = guess_year(label, {})
+        if year is None:
+            print(f"{label}: filing year unknown, comparing with the company's report stored last")
+        previous = index.previous_report(company, year, doc_hash)
+        reused = unchanged_shards(fingerprints, previous["fingerprints"]) if previous else []
+        # a section missing or null in the earlier extraction (a failed run) is extracted again
+        reused = [shard for shard in reused
+                  if all(previous["data"].get(section) is not None for section in SHARDS[shard][0])]
+        if previous:
+            stats.update(reused_from=previous["name"],
+                         reused_sections=[section for shard in reused for section in SHARDS[shard][0]],
+                         pages_saved=sum(len(routes[shard]) for shard in reused),
+                         tokens_saved=sum(tokens[page_num] for shard in reused for page_num in routes[shard]))
+            print(f"{label}: reusing {', '.join(stats['reused_sections']) or 'nothing'} from {previous['name']}, "
+                  f"{stats['pages_saved']} pages and ~{stats['tokens_saved']} tokens not sent")
+
+        pdfs = shard_pdfs(pdf_bytes, {shard: pages for shard, pages in routes.items() if shard not in reused})
+        start = time.perf_counter()
+        results = asyncio.run(extract_shards(pdfs, prompt, client, temperature, model, cache, refresh,
+                                             sessions=sessions)) if pdfs else []
+        stats["gemini_seconds"] = time.perf_counter() - start
+    except Exception as e:
+        print(f"ERROR: Gemini processing failed: {e}")
+        return {}
+
+    collect_results(results, stats, label)
+    data = merge_shards(results)
+    for section in stats["reused_sections"]:
+        data[section] = previous["data"][section]
+    # an empty or unparsed shard response must not become the base of next year's reuse
+    if all(not result["error"] and all(section in result["data"] for section in result["sections"])
+           for result in results):
+        index.add_report(doc_hash, company, year, label, fingerprints, data)
+    return data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the page fingerprints of annual reports across years.")
+    parser.add_argument("--db", default=DEFAULT_FINGERPRINT_DB)
+    commands = parser.add_subparsers(dest="command", required=True)
+    compare_parser = commands.add_parser("compare", help="sections of a report unchanged from an earlier one")
+    compare_parser.add_argument("previous_pdf")
+    compare_parser.add_argument("pdf")
+    commands.add_parser("reports", help="list the reports in the index")
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        fingerprints = []
+        for path in (args.previous_pdf, args.pdf):
+            with fitz.open(path) as doc:
+                fingerprints.append(document_fingerprints(doc, route_pages(doc)))
+        previous, current = fingerprints
+        same = unchanged_shards(current, previous)
+        for shard, pages in current.items():
+            matched = sum(1 for page in pages if any(unchanged(page, old) for old in previous.get(shard, [])))
+            print(f"{shard:<20}{'unchanged' if shard in same else 'changed':<11}"
+                  f"{matched}/{len(pages)} pages match, {len(previous.get(shard, []))} before")
+        return 0
+
+    with FingerprintIndex(args.db) as index:
+        for company, year, name, doc_hash, pages in index.reports():
+            print(f"{company:<30}{year or '-':<6}{name:<30}{doc_hash[:12]}  {pages} pages")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+
+import fitz  # pymupdf is imported as fitz
+
+from keyword_matcher import KeywordMatcher
+from page_cache import HEADER_HEIGHT, title_from_text
+from parallel_titles import iter_page_texts, page_texts
+
+INDEX_VERSION = 1  # Bump when the extraction heuristics change in a way the fields below do not capture
+INDEX_TITLE_LINES = 5  # Lines kept per page; covers both abridgers (5 in v1, 4 in v2)
+DEFAULT_INDEX_DIR = os.path.join(".cache", "page_index")
+
+
+def file_hash(pdf_path):
+    """sha256 of the file content, read in chunks."""
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def index_heuristics(finance_keywords):
+    """Everything the stored fields depend on. An index built with other values is rebuilt."""
+    return {
+        "version": INDEX_VERSION,
+        "header_height": HEADER_HEIGHT,
+        "title_lines": INDEX_TITLE_LINES,
+        "finance_keywords": sorted(keyword.lower() for keyword in finance_keywords),
+    }
+
+
+class PageIndex:
+    """
+    Everything the section selection needs from one PDF, without opening it.
+
+    Holds per page the first INDEX_TITLE_LINES lines of clipped text, the finance keywords
+    found anywhere in the clipped text (used by `check_segments`) and the page size,
+    plus the document outline.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.pages = data["pages"]
+        self.toc = data["toc"]
+
+    def __len__(self):
+        return len(self.pages)
+
+    def titles(self, num_title_lines):
+        """Page titles as `extract_titles_from_pdf` would build them with `num_title_lines` lines."""
+        return [title_from_text("\n".join(page["title_lines"]), num_title_lines) for page in self.pages]
+
+    def has_finance(self, page_num):
+        return bool(self.pages[page_num]["finance_hits"])
+
+
+def build_index(pdf_path, finance_keywords, workers=1, pool=None, window=None):
+    """
+    Parses every page of a PDF once and returns the index data.
+
+    With a `window` the pages are scanned serially, `window` pages at a time (see
+    `parallel_titles.iter_page_texts`), and only the index fields of each page are kept.
+    """
+    finance_matcher = KeywordMatcher({keyword: [keyword] for keyword in finance_keywords})
+
+    with fitz.open(pdf_path) as doc:
+        toc = doc.get_toc()
+        sizes = [(page.rect.width, page.rect.height) for page in doc]
+
+    texts = iter_page_texts(pdf_path, window) if window else page_texts(pdf_path, workers, pool, num_pages=len(sizes))
+    pages = []
+    for text, (width, height) in zip(texts, sizes):
+        pages.append({
+            "title_lines": text.splitlines()[:INDEX_TITLE_LINES],
+            "finance_hits": sorted(finance_matcher.match(text)),
+            "width": width,
+            "height": height,
+        })
+
+    return {"heuristics": index_heuristics(finance_keywords), "toc": toc, "pages": pages}
+
+
+def load_page_index(pdf_path, finance_keywords, index_dir=DEFAULT_INDEX_DIR, rebuild=False, workers=1, pool=None,
+                    window=None):
+    """
+    Returns the PageIndex of a PDF, building and storing it on first use.
+
+    The index is stored as `<index_dir>/<sha256 of the file>.json`, so it follows the
+    content rather than the file name. It is rebuilt automatically when it was made with
+    different heuristics (INDEX_VERSION, header height, title lines, finance keywords).
+    `window` builds it with a memory-bounded scan (see `build_index`).
+    """
+    key = file_hash(pdf_path)
+    index_path = os.path.join(index_dir, f"{key}.json")
+    heuristics = index_heuristics(finance_keywords)
+
+    if not rebuild and os.path.exists(index_path):
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("heuristics") == heuristics:
+                return PageIndex(data)
+            print(f"Page index of {pdf_path} is out of date, rebuilding")
+        except json.JSONDecodeError:
+            print(f"Page index of {pdf_path} is corrupt, rebuilding")
+
+    data = build_index(pdf_path, finance_keywords, workers, pool, window)
+    data["file_hash"] = key
+    os.makedirs(index_dir, exist_ok=True)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"  # workers indexing the same content do not share it
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, index_path)
+    return PageIndex(data)
@@ -0,0 +1,233 @@
+"""
+Scored, budgeted page selection.
+
+Instead of a yes/no keyword hit per page title, every page gets a relevance score per
+target section (directors, segments, subsidiaries, shareholders, land) from
+    - keywords in its heading (TITLE_WEIGHT per distinct keyword),
+    - keywords in its body (BODY_WEIGHT per distinct keyword, at most BODY_CAP),
+    - its table density (TABLE_WEIGHT times the share of numeric lines, for tabular targets),
+    - closeness to a high-scoring page (a section continues on the next pages),
+and pages with an excluded heading (sustainability, governance, ...) score 0. Given a page
+and/or token budget, the best page of every target is taken first, then the remaining
+pages by score until the budget is spent. Every page gets a report row saying why it was
+kept or not.
+
+Usage:
+    python page_scoring.py report.pdf [--max-pages 40] [--max-tokens 60000] [--csv report_scores.csv]
+"""
+import argparse
+import csv
+import re
+import sys
+
+from keyword_matcher import KeywordMatcher
+from page_cache import PageTextCache, title_from_text
+
+# target -> (heading keywords, body keywords)
+TARGETS = {
+    "directors": (["directors' profile", "profile of directors", "board of directors", "key senior management",
+                   "senior management", "directors' remuneration", "remuneration of directors"],
+                  ["executive director", "director", "appointed", "remuneration", "salary", "salaries", "bonus",
+                   "fees", "qualification"]),
+    "segments": (["segment information", "operating segments", "segmental", "segment"],
+                 ["segment", "geographical", "business segment", "revenue", "external customers", "major customer",
+                  "single customer"]),
+    "subsidiaries": (["investment in subsidiaries", "subsidiaries", "investment in associates", "associates",
+                      "corporate structure", "group structure"],
+                     ["subsidiary", "subsidiaries", "associate", "joint venture", "sdn. bhd.", "sdn bhd",
+                      "effective interest", "principal activities", "country of incorporation"]),
+    "shareholders": (["analysis of shareholdings", "thirty largest shareholders", "30 largest shareholders",
+                      "substantial shareholders", "shareholdings"],
+                     ["name of shareholders", "no. of shares", "nominees", "substantial shareholder",
+                      "issued shares", "shareholders"]),
+    "land": (["list of properties", "properties of the group", "landed properties", "top 10 properties"],
+             ["land", "hectare", "acre", "sq ft", "square feet", "freehold", "leasehold", "tenure",
+              "net book value", "net carrying amount"]),
+}
+TABLE_TARGETS = {"segments", "subsidiaries", "shareholders", "land", "directors"}  # usually presented as tables
+EXCLUDE_KEYWORDS = ["sustainability", "risk management", "share buy back", "buy-back", "audit committee",
+                    "compliance", "governance", "internal control", "general meeting"]
+
+HEADING_LINES = 2  # Lines of a page matched against the heading keywords
+TITLE_WEIGHT = 3.0
+BODY_WEIGHT = 1.0
+BODY_CAP = 4  # Distinct body keywords counted per target; long notes mention everything
+TABLE_WEIGHT = 2.0
+FOLLOW_PAGES = 3  # Pages after a high-scoring page that inherit part of its score
+FOLLOW_DECAY = 0.6  # Share of the score inherited per page of distance
+PRECEDE_DECAY = 0.3  # Share inherited by the page just before (tables that start on the previous page)
+MIN_SCORE = 2.0  # Pages scoring less than this are never kept
+PAGE_IMAGE_TOKENS = 258  # Gemini input tokens per PDF page, besides its text
+TEXT_CHARS_PER_TOKEN = 4
+
+_NUMERIC_LINE = re.compile(r"^[\s\d.,%()\-]*\d[\s\d.,%()\-]*$")
+
+
+def build_matchers():
+    """(heading matcher, body matcher, exclude matcher); the categories are (target, keyword) pairs."""
+    heading = KeywordMatcher({(target, keyword): [keyword]
+                              for target, (keywords, _) in TARGETS.items() for keyword in keywords})
+    body = KeywordMatcher({(target, keyword): [keyword]
+                           for target, (_, keywords) in TARGETS.items() for keyword in keywords})
+    return heading, body, KeywordMatcher({"exclude": EXCLUDE_KEYWORDS})
+
+
+def table_density(text):
+    """Share of the non-empty lines of a page that are numbers (amounts, percentages, counts)."""
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return 0.0
+    return sum(1 for line in lines if _NUMERIC_LINE.match(line)) / len(lines)
+
+
+def estimate_tokens(text):
+    """Approximate Gemini input tokens of one PDF page."""
+    return PAGE_IMAGE_TOKENS + len(text) // TEXT_CHARS_PER_TOKEN
+
+
+def _by_target(hits):
+    keywords = {target: [] for target in TARGETS}
+    for target, keyword in hits:
+        keywords[target].append(keyword)
+    return {target: sorted(found) for target, found in keywords.items()}
+
+
+def score_pages(texts, matchers=None):
+    """
+    Scores every page for every target.
+
+    Args:
+        texts (list): Clipped text of every page (see `page_cache.PageTextCache`).
+
+    Returns:
+        list: One row per page: page, scores (target -> score), value (best score), target
+        (best target), tokens (estimated), density and reasons (list of strings).
+    """
+    heading_matcher, body_matcher, exclude_matcher = matchers or build_matchers()
+    rows = []
+    for page_num, text in enumerate(texts):
+        heading = title_from_text(text, HEADING_LINES)
+        row = {"page": page_num, "scores": dict.fromkeys(TARGETS, 0.0), "value": 0.0, "target": None,
+               "tokens": estimate_tokens(text), "density": round(table_density(text), 2), "reasons": [],
+               "excluded": "exclude" in exclude_matcher.match(heading)}
+        rows.append(row)
+        if row["excluded"]:
+            row["reasons"].append(f"excluded heading: {heading[:60]}")
+            continue
+        title_hits = _by_target(heading_matcher.match(heading))
+        body_hits = _by_target(body_matcher.match(text))
+        for target in TARGETS:
+            score = TITLE_WEIGHT * len(title_hits[target]) + BODY_WEIGHT * min(len(body_hits[target]), BODY_CAP)
+            if score and target in TABLE_TARGETS:
+                score += TABLE_WEIGHT * row["density"]
+            row["scores"][target] = score
+            if title_hits[target]:
+                row["reasons"].append(f"{target} heading: {', '.join(title_hits[target])}")
+            if body_hits[target]:
+                row["reasons"].append(f"{target} body: {', '.join(body_hits[target][:BODY_CAP])}")
+
+    # closeness: the pages after a strong page (and the one before it) inherit part of its score
+    raw = [dict(row["scores"]) for row in rows]
+    for page_num, row in enumerate(rows):
+        if row["excluded"]:
+            continue
+        for target in TARGETS:
+            inherited = [(raw[page_num - k][target] * FOLLOW_DECAY ** k, page_num - k)
+                         for k in range(1, FOLLOW_PAGES + 1) if page_num - k >= 0]
+            if page_num + 1 < len(rows):
+                inherited.append((raw[page_num + 1][target] * PRECEDE_DECAY, page_num + 1))
+            best, source = max(inherited, default=(0.0, None))
+            if best > row["scores"][target]:
+                row["scores"][target] = best
+                row["reasons"].append(f"{target} near page {source + 1}")
+
+    for row in rows:
+        row["scores"] = {target: round(score, 2) for target, score in row["scores"].items()}
+        row["target"] = max(row["scores"], key=row["scores"].get)
+        row["value"] = row["scores"][row["target"]]
+    return rows
+
+
+def select_pages_by_score(rows, max_pages=None, max_tokens=None, min_score=MIN_SCORE):
+    """
+    Picks pages within the budget and marks them in the rows (`kept`, `why`).
+
+    Every target's pages (those it scores highest on, at least `min_score`) are ranked by
+    score, and the targets take turns: the best page of each target, then the second best
+    of each, and so on. A tight budget therefore covers every section instead of spending
+    itself on the longest one.
+
+    Returns:
+        list: Sorted 0-based page numbers.
+    """
+    for row in rows:
+        row.update(kept=False, why="")
+    ranked = {target: sorted((row for row in rows if row["target"] == target and row["value"] >= min_score),
+                             key=lambda row: (-row["value"], row["page"]))
+              for target in TARGETS}
+    order = []
+    for rank in range(max(map(len, ranked.values()), default=0)):
+        for target, target_rows in ranked.items():
+            if rank < len(target_rows):
+                order.append(target_rows[rank])
+                if rank == 0:
+                    target_rows[0]["why"] = f"best {target} page"
+
+    kept, pages, tokens = set(), 0, 0
+    for row in order:
+        if max_pages is not None and pages >= max_pages:
+            row["why"] = "over page budget"
+            continue
+        if max_tokens is not None and tokens + row["tokens"] > max_tokens:
+            row["why"] = "over token budget"
+            continue
+        row["kept"] = True
+        row["why"] = row["why"] or f"{row['target']} score {row['value']}"
+        kept.add(row["page"])
+        pages += 1
+        tokens += row["tokens"]
+    for row in rows:
+        if not row["kept"] and not row["why"]:
+            row["why"] = f"score {row['value']} below {min_score}"
+    return sorted(kept)
+
+
+def write_score_report(rows, path):
+    """One CSV row per page (1-based page numbers): kept, why, value, best target, tokens, per-target scores, reasons."""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["page", "kept", "why", "value", "target", "tokens", "table_density"] + list(TARGETS)
+                        + ["reasons"])
+        for row in rows:
+            writer.writerow([row["page"] + 1, int(row.get("kept", False)), row.get("why", ""), row["value"],
+                             row["target"], row["tokens"], row["density"]]
+                            + [row["scores"][target] for target in TARGETS] + ["; ".join(row["reasons"])])
+
+
+def score_document(cache, max_pages=None, max_tokens=None):
+    """Scores and selects the pages of an open document. Returns (page numbers, report rows)."""
+    rows = score_pages([cache.text(page_num) for page_num in range(len(cache))])
+    return select_pages_by_score(rows, max_pages, max_tokens), rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score the pages of an annual report and select them within a budget.")
+    parser.add_argument("pdf")
+    parser.add_argument("--max-pages", type=int)
+    parser.add_argument("--max-tokens", type=int)
+    parser.add_argument("--csv", help="write the per-page score report here")
+    args = parser.parse_args(argv)
+
+    with PageTextCache(args.pdf) as cache:
+        pages, rows = score_document(cache, args.max_pages, args.max_tokens)
+    for row in rows:
+        if row["kept"]:
+            print(f"page {row['page'] + 1:>4}  {row['value']:>5.1f}  {row['target']:<13} {row['why']}")
+    print(f"Kept {len(pages)} of {len(rows)} pages, ~{sum(rows[page]['tokens'] for page in pages)} tokens")
+    if args.csv:
+        write_score_report(rows, args.csv)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
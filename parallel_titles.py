@@ -0,0 +1,103 @@
+import os
+
+import fitz  # pymupdf is imported as fitz
+
+from page_cache import clipped_text
+
+PARALLEL_MIN_PAGES = 64  # Below this page count a serial scan is faster than starting workers
+MIN_CHUNK_PAGES = 8  # Smallest page range handed to one worker
+CHUNKS_PER_WORKER = 4  # More chunks than workers so slow (image heavy) ranges balance out
+WINDOW_PAGES = 32  # Pages parsed between two flushes of the MuPDF resource store in windowed scans
+
+
+def default_workers():
+    """Worker count from the ABRIDGE_WORKERS environment variable (1 = serial)."""
+    return max(1, int(os.getenv("ABRIDGE_WORKERS", "1")))
+
+
+def make_pool(workers=None):
+    """
+    Creates a process pool for page scanning.
+
+    Reuse the same pool for every document of a batch, e.g.:
+
+        with make_pool(8) as pool:
+            for path in paths:
+                extract_titles_from_pdf(path, workers=8, pool=pool)
+    """
+    from concurrent.futures import ProcessPoolExecutor  # pulls in multiprocessing; serial scans never need it
+
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+
+
+def _scan_range(pdf_path, start, stop):
+    # runs in a worker process: each worker opens its own fitz handle
+    doc = fitz.open(pdf_path)
+    try:
+        return [clipped_text(doc[page_num]) for page_num in range(start, stop)]
+    finally:
+        doc.close()
+
+
+def iter_page_texts(pdf_path, window=WINDOW_PAGES):
+    """
+    Yields the clipped text of every page of a PDF, in page order, holding one window of pages at a time.
+
+    After each `window` pages the MuPDF resource store (decoded images, fonts) is emptied, so
+    memory stays flat on long image-heavy reports instead of growing with the page count.
+    """
+    with fitz.open(pdf_path) as doc:
+        for start in range(0, len(doc), window):
+            for page_num in range(start, min(start + window, len(doc))):
+                yield clipped_text(doc[page_num])
+            fitz.TOOLS.store_shrink(100)
+
+
+def page_ranges(num_pages, workers):
+    """Splits `range(num_pages)` into contiguous (start, stop) chunks for the workers."""
+    num_chunks = max(1, min(workers * CHUNKS_PER_WORKER, num_pages // MIN_CHUNK_PAGES))
+    size, extra = divmod(num_pages, num_chunks)
+    ranges = []
+    start = 0
+    for i in range(num_chunks):
+        stop = start + size + (1 if i < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def page_texts(pdf_path, workers=1, pool=None, num_pages=None, min_pages=PARALLEL_MIN_PAGES):
+    """
+    Returns the clipped text of every page of a PDF, in page order.
+
+    The page range is split across a process pool when `workers` > 1 and the document
+    has at least `min_pages` pages; otherwise the pages are scanned serially.
+    The result is identical in both modes.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+        workers (int): Number of worker processes. 1 means serial.
+        pool (ProcessPoolExecutor): Pool shared across documents; a temporary one is created if None.
+        num_pages (int): Page count, if already known by the caller.
+        min_pages (int): Documents shorter than this are always scanned serially.
+    """
+    if num_pages is None:
+        with fitz.open(pdf_path) as doc:
+            num_pages = len(doc)
+
+    if workers <= 1 or num_pages < min_pages:
+        return _scan_range(pdf_path, 0, num_pages)
+
+    own_pool = pool is None
+    if own_pool:
+        pool = make_pool(workers)
+    try:
+        futures = [pool.submit(_scan_range, pdf_path, start, stop)
+                   for start, stop in page_ranges(num_pages, workers)]
+        texts = []
+        for future in futures:  # futures are in page order
+            texts.extend(future.result())
+        return texts
+    finally:
+        if own_pool:
+            pool.shutdown()
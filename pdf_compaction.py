@@ -0,0 +1,126 @@
+"""
+Compaction of abridged PDFs: smaller images and no blind image-only pages.
+
+Runs after page selection, on the abridged document:
+    - "downsample": every image above DPI_THRESHOLD is recompressed to DPI_TARGET as JPEG
+      (JPEG_QUALITY);
+    - "strip": images on text pages (at least TEXT_PAGE_CHARS characters of clipped text, where
+      the value is in the text and tables) are removed, the others are downsampled.
+Image-only pages (less than MIN_TEXT_CHARS characters of clipped text, at least one image),
+which the lookahead of `split_into_sections` admits without looking at them, are either
+dropped ("drop") or kept and listed in the stats ("mark"). The result is saved with garbage
+collection and stream compression.
+
+Usage:
+    python pdf_compaction.py report_abridged.pdf [--mode downsample|strip] [--image-only drop|mark] [-o out.pdf]
+"""
+import argparse
+import sys
+import time
+
+import fitz  # pymupdf is imported as fitz
+
+from page_cache import clipped_text
+
+COMPACT_MODES = ("downsample", "strip")
+IMAGE_ONLY_ACTIONS = ("drop", "mark")
+DPI_THRESHOLD = 120  # Images with a higher resolution on the page are downsampled
+DPI_TARGET = 96
+JPEG_QUALITY = 60
+MIN_TEXT_CHARS = 20  # Less clipped text than this (and an image) makes an image-only page
+TEXT_PAGE_CHARS = 400  # Pages with this much text keep their value without their images in "strip" mode
+
+
+def page_images(doc):
+    """page number -> xrefs of the images the page shows."""
+    return {page_num: {image[0] for image in doc[page_num].get_images(full=True)} for page_num in range(len(doc))}
+
+
+def compact_document(doc, mode="downsample", image_only="mark"):
+    """
+    Compacts an open document in place.
+
+    Returns:
+        dict: images_removed, image_only_pages (0-based, in the document as passed) and
+        pages_dropped (the same pages when they were dropped, else []).
+    """
+    if mode not in COMPACT_MODES:
+        raise ValueError(f"Unknown compaction mode {mode!r}, expected one of {COMPACT_MODES}")
+    if image_only not in IMAGE_ONLY_ACTIONS:
+        raise ValueError(f"Unknown image-only action {image_only!r}, expected one of {IMAGE_ONLY_ACTIONS}")
+
+    text_lengths = [len(clipped_text(page).strip()) for page in doc]
+    images = page_images(doc)
+    image_only_pages = [page_num for page_num, length in enumerate(text_lengths)
+                        if length < MIN_TEXT_CHARS and images[page_num]]
+    stats = {"images_removed": 0, "image_only_pages": image_only_pages, "pages_dropped": []}
+
+    if mode == "strip":
+        text_pages = {page_num for page_num, length in enumerate(text_lengths) if length >= TEXT_PAGE_CHARS}
+        # an image shared with a page that is not a text page (a chart, a logo on a cover) stays
+        kept = set().union(*(xrefs for page_num, xrefs in images.items() if page_num not in text_pages))
+        for page_num in sorted(text_pages):
+            for xref in images[page_num] - kept:
+                doc[page_num].delete_image(xref)
+                kept.add(xref)  # delete_image blanks the image everywhere, once is enough
+                stats["images_removed"] += 1
+
+    if image_only == "drop" and image_only_pages and len(image_only_pages) < len(doc):
+        dropped = set(image_only_pages)
+        doc.select([page_num for page_num in range(len(doc)) if page_num not in dropped])
+        stats["pages_dropped"] = image_only_pages
+
+    doc.rewrite_images(dpi_threshold=DPI_THRESHOLD, dpi_target=DPI_TARGET, quality=JPEG_QUALITY, bitonal=False)
+    return stats
+
+
+def compact_pdf_bytes(pdf_bytes, mode="downsample", image_only="mark"):
+    """
+    Compacts a PDF held in memory (see `compact_document`).
+
+    Returns:
+        tuple: (compacted PDF bytes, stats dict of `compact_document` plus pages_before,
+        pages_after, bytes_before, bytes_after, compact_seconds and save_seconds)
+    """
+    start = time.perf_counter()
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        pages_before = len(doc)
+        stats = compact_document(doc, mode, image_only)
+        compacted = time.perf_counter()
+        # no_new_id keeps the bytes (and so the response cache key) stable across runs
+        output = doc.tobytes(garbage=3, deflate=True, deflate_images=True, deflate_fonts=True, no_new_id=True)
+        stats.update(pages_before=pages_before, pages_after=len(doc))
+    stats.update(bytes_before=len(pdf_bytes), bytes_after=len(output), compact_seconds=compacted - start,
+                 save_seconds=time.perf_counter() - compacted)
+    return output, stats
+
+
+def describe(stats):
+    """One-line summary of compaction stats."""
+    return (f"{stats['bytes_before']} -> {stats['bytes_after']} bytes, {stats['pages_before']} -> "
+            f"{stats['pages_after']} pages, {stats['images_removed']} images removed, "
+            f"{len(stats['image_only_pages'])} image-only pages, saved in {stats['save_seconds']:.2f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Downsample or strip the images of an abridged PDF.")
+    parser.add_argument("pdf")
+    parser.add_argument("--mode", default="downsample", choices=COMPACT_MODES)
+    parser.add_argument("--image-only", default="mark", choices=IMAGE_ONLY_ACTIONS)
+    parser.add_argument("-o", "--output", help="defaults to <pdf>_compact.pdf")
+    args = parser.parse_args(argv)
+
+    with open(args.pdf, "rb") as f:
+        output, stats = compact_pdf_bytes(f.read(), args.mode, args.image_only)
+    output_path = args.output or args.pdf.rsplit(".", 1)[0] + "_compact.pdf"
+    with open(output_path, "wb") as f:
+        f.write(output)
+    print(f"{args.pdf}: {describe(stats)} -> {output_path}")
+    if stats["image_only_pages"]:
+        print(f"Image-only pages: {', '.join(str(page_num + 1) for page_num in stats['image_only_pages'])}"
+              + (" (dropped)" if stats["pages_dropped"] else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
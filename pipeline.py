@@ -0,0 +1,379 @@
+"""
+End-to-end annual report pipeline that keeps everything in memory.
+
+The report is opened once as a `fitz.Document`, abridged in place, serialised with
+`doc.tobytes()` and sent to Gemini; the parsed result and its percentages are passed on as
+dicts. Only the artifacts asked for are written to disk. With `--memory-bounded` the report
+is instead abridged from disk a window of pages at a time into a spool file, and the
+monolithic extraction uploads that file from disk, so neither the report nor the abridged
+PDF is loaded (the other extraction modes, compaction and incremental runs read the abridged
+PDF into memory); the peak RSS of every document is recorded either way.
+
+Usage:
+    python pipeline.py pdf/kgb-annual.pdf [more.pdf or URL ...] [--outputs calc pdf_json abridged]
+                       [--output-dir json] [--no-abridge] [--no-cache] [--upload-once] [--store results.db]
+                       [--extraction monolithic|structured|sharded|local_tables]
+                       [--memory-bounded] [--memory-limit-mb 1024]
+                       [--max-pages 40] [--max-tokens 60000] [--outputs ... scores]
+                       [--compact downsample|strip] [--image-only drop|mark]
+                       [--incremental fingerprints.db] [--company NAME] [--year 2023]
+                       [--telemetry telemetry.jsonl]
+
+Per-stage timings, sizes and token counts go to the telemetry JSONL; summarise them with
+`python telemetry.py summary`.
+"""
+import argparse
+import contextlib
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+
+import fitz  # pymupdf is imported as fitz
+
+from document_sessions import DocumentSessions
+from http_download import download_pdf
+from local_tables import analyze_pdf_local
+from make_abridged_pdf_v2 import abridge_document, abridge_file
+from memory_usage import peak_rss_mb, reset_peak_rss
+from page_fingerprints import DEFAULT_FINGERPRINT_DB, FingerprintIndex, analyze_pdf_incremental
+from page_scoring import write_score_report
+from pdf_compaction import COMPACT_MODES, IMAGE_ONLY_ACTIONS, compact_pdf_bytes, describe
+from page_index import file_hash
+from parallel_titles import default_workers, make_pool
+from report_extraction import EXTRACTION_PROMPT, analyze_pdf_bytes, analyze_pdf_file, with_percentages
+from response_cache import ResponseCache
+from result_store import DEFAULT_DB_PATH, ResultStore
+from sharded_extraction import analyze_pdf_sharded
+from structured_extraction import analyze_pdf_structured
+from telemetry import DEFAULT_TELEMETRY_PATH, NullSink, TelemetrySink, token_fields
+
+SPOOL_DIR = os.path.join(".cache", "spool")  # Abridged PDFs of the memory-bounded mode, until they are sent
+
+# artifact name -> file suffix, matching the names the scripts have always written
+OUTPUT_SUFFIXES = {"abridged": "_abridged.pdf", "pdf_json": "_pdf.json", "calc": "_calc.json",
+                   "scores": "_scores.csv"}
+
+# extraction mode -> function with the `analyze_pdf_bytes` signature
+EXTRACTION_MODES = {
+    "monolithic": analyze_pdf_bytes,
+    "structured": analyze_pdf_structured,
+    "sharded": analyze_pdf_sharded,
+    "local_tables": analyze_pdf_local,
+}
+
+
+def open_document(source):
+    """Returns (fitz.Document, file path or None) for a path, PDF bytes or an open document."""
+    if isinstance(source, fitz.Document):
+        return source, None
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=bytes(source), filetype="pdf"), None
+    return fitz.open(source), source
+
+
+def write_outputs(result, outputs, output_dir):
+    """Write the requested artifacts of one pipeline result and return their paths."""
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    for kind in outputs:
+        output_file = os.path.join(output_dir, result["name"] + OUTPUT_SUFFIXES[kind])
+        if kind == "abridged":
+            if "pdf_bytes" not in result:
+                shutil.copyfile(result["pdf_path"], output_file)  # memory-bounded: still on disk
+                written.append(output_file)
+                continue
+            with open(output_file, "wb") as f:
+                f.write(result["pdf_bytes"])
+        elif kind == "scores":
+            if not result.get("scores"):
+                continue  # only a scored selection has a score report
+            write_score_report(result["scores"], output_file)
+        else:
+            data = result["data"] if kind == "pdf_json" else result["calc_data"]
+            with open(output_file, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=4, ensure_ascii=False)  # Ensure UTF-8 encoding
+        written.append(output_file)
+    return written
+
+
+def abridge_in_memory(source, name, abridge, workers, pool, telemetry, max_pages=None, max_tokens=None):
+    """
+    Opens the report, abridges it in place and serialises it (the default mode).
+
+    Returns:
+        tuple: (partial result dict with name, pages_before, pages_after, selection, pdf_bytes and
+        the score report rows of a budgeted selection, sha256 of the source PDF or None for an open document)
+    """
+    doc, pdf_path = open_document(source)
+    if pdf_path:
+        doc_hash = file_hash(pdf_path)
+    elif isinstance(source, (bytes, bytearray)):
+        doc_hash = hashlib.sha256(source).hexdigest()
+    else:
+        doc_hash = None
+    if name is None:
+        name = os.path.splitext(os.path.basename(pdf_path))[0] if pdf_path else "report"
+    result = {"name": name, "pages_before": len(doc), "selection": None, "scores": []}
+
+    try:
+        if abridge:
+            timings = {}
+            page_numbers, result["selection"], _ = abridge_document(doc, pdf_path, workers=workers, pool=pool,
+                                                                    timings=timings, max_pages=max_pages,
+                                                                    max_tokens=max_tokens, scores=result["scores"])
+            telemetry.emit(name, "title_extraction", timings["title_extraction"], pages_in=result["pages_before"],
+                           selection=result["selection"])
+            telemetry.emit(name, "section_selection", timings["section_selection"],
+                           pages_before=result["pages_before"], pages_after=len(doc), selection=result["selection"])
+        result["pages_after"] = len(doc)
+
+        with telemetry.stage(name, "pdf_save", pages_in=len(doc)) as record:
+            if not abridge and isinstance(source, (bytes, bytearray)):
+                result["pdf_bytes"] = bytes(source)
+            else:
+                result["pdf_bytes"] = doc.tobytes(garbage=3, deflate=True, no_new_id=True)
+            record["bytes_out"] = len(result["pdf_bytes"])
+    finally:
+        if doc is not source:
+            doc.close()
+
+    return result, doc_hash
+
+
+def abridge_on_disk(pdf_path, name, abridge, telemetry, spool_dir=SPOOL_DIR):
+    """
+    Memory-bounded mode: abridges a PDF on disk with `abridge_file` (windowed page scan,
+    selected pages copied into a fresh document) into a spool file. Nothing is loaded: the
+    result has `pdf_path` (the spool file, or the report itself without abridging) instead of
+    `pdf_bytes`, and `spooled` tells whether `pdf_path` is a spool file to remove after use.
+
+    Returns:
+        tuple: as `abridge_in_memory`.
+    """
+    if not isinstance(pdf_path, str):
+        raise ValueError("The memory-bounded mode needs a PDF path or URL")
+    if name is None:
+        name = os.path.splitext(os.path.basename(pdf_path))[0]
+    doc_hash = file_hash(pdf_path)
+    result = {"name": name, "selection": None}
+
+    send_path = pdf_path
+    if abridge:
+        os.makedirs(spool_dir, exist_ok=True)
+        spool_path = os.path.join(spool_dir, f"{doc_hash}.{os.getpid()}.pdf")
+        with telemetry.stage(name, "abridge_file", bytes_in=os.path.getsize(pdf_path)) as record:
+            send_path, stats = abridge_file(pdf_path, spool_path)
+            result["selection"] = stats["selection"]
+            record.update(pages_before=stats["pages_before"], pages_after=stats["pages_after"],
+                          bytes_out=stats["bytes_after"], selection=stats["selection"])
+        result.update(pages_before=stats["pages_before"], pages_after=stats["pages_after"])
+    else:
+        with fitz.open(pdf_path) as doc:
+            result["pages_before"] = result["pages_after"] = len(doc)
+
+    result.update(pdf_path=send_path, spooled=send_path != pdf_path)
+    return result, doc_hash
+
+
+def run_pipeline(source, name=None, abridge=True, outputs=("calc",), output_dir="json", client=None,
+                 cache=None, prompt=EXTRACTION_PROMPT, temperature=0.5, workers=1, pool=None, telemetry=None,
+                 extraction="monolithic", sessions=None, store=None, memory_bounded=False, memory_limit_mb=None,
+                 max_pages=None, max_tokens=None, compact=None, image_only="mark", fingerprints=None, company=None,
+                 year=None):
+    """
+    Abridge, extract and calculate one annual report without intermediate files.
+
+    Args:
+        source: PDF path or http(s) URL, PDF bytes, or an open `fitz.Document` (abridged in place).
+        name (str): Base name of the output files; defaults to the PDF file name.
+        abridge (bool): Select the relevant pages before sending the PDF to Gemini.
+        outputs (tuple): Artifacts to write: any of "abridged", "pdf_json", "calc", "scores" (per-page score
+            report of a budgeted selection). Empty writes nothing.
+        output_dir (str): Directory for the artifacts.
+        client (genai.Client): Defaults to `gemini_common.get_client()`.
+        cache (ResponseCache): Optional Gemini response cache.
+        workers, pool: Parallel page scanning, see `parallel_titles.page_texts`.
+        telemetry (TelemetrySink): Receives one record per stage; defaults to no telemetry.
+        extraction (str): "monolithic" (one call with the full prompt), "structured" (schema-constrained
+            JSON with section repair), "sharded" (concurrent per-section calls) or "local_tables" (sharded,
+            with the tabular sections read from the PDF tables when they pass their checks), see EXTRACTION_MODES.
+        sessions (DocumentSessions): Upload each PDF sent to Gemini once and reuse the upload.
+        store (ResultStore): Also upsert the result into the SQLite result store, keyed by the
+            sha256 of the source PDF (of the PDF sent, when the source is an open document).
+        memory_bounded (bool): Abridge from disk without loading the full report (see `abridge_on_disk`);
+            needs a path or URL. `workers` and `pool` are not used in this mode. The monolithic
+            extraction then uploads the PDF from disk (`report_extraction.analyze_pdf_file`) and the
+            result has no pdf_bytes.
+        memory_limit_mb (float): Peak RSS the document should stay under; a document that goes
+            above it is reported.
+        max_pages, max_tokens (int): Page and/or token budget; with either, pages are selected by
+            relevance score (`page_scoring`) instead of the keyword rules.
+        compact (str): Compact the PDF before sending it: "downsample" or "strip" its images
+            (see `pdf_compaction`). None sends it as selected.
+        image_only (str): With `compact`, "drop" image-only pages or just "mark" them in the result.
+        fingerprints (FingerprintIndex): Reuse the sections whose pages did not change since the
+            company's previous report (see `page_fingerprints`); the changed sections are extracted
+            with sharded sub-requests and `extraction` is not used.
+        company (str): Company of the report, for `fingerprints`; recognised from its pages when None.
+        year (int): Filing year of the report, for `fingerprints`; guessed from the name when None.
+
+    Returns:
+        dict: name, pages_before, pages_after, selection, pdf_bytes, data, calc_data, the written paths
+        the peak RSS of the process while the document was processed (peak_rss_mb) and, with `compact`,
+        the compaction stats (compaction).
+    """
+    for kind in outputs:
+        if kind not in OUTPUT_SUFFIXES:
+            raise ValueError(f"Unknown output {kind!r}, expected one of {sorted(OUTPUT_SUFFIXES)}")
+    if extraction not in EXTRACTION_MODES:
+        raise ValueError(f"Unknown extraction mode {extraction!r}, expected one of {sorted(EXTRACTION_MODES)}")
+    if telemetry is None:
+        telemetry = NullSink()
+    if compact is not None and compact not in COMPACT_MODES:
+        raise ValueError(f"Unknown compaction mode {compact!r}, expected one of {COMPACT_MODES}")
+    if memory_bounded and (max_pages is not None or max_tokens is not None):
+        raise ValueError("Page and token budgets are not supported in the memory-bounded mode")
+
+    source_label = source if isinstance(source, str) else None  # path or URL, kept in the result store
+    if isinstance(source, str) and source.startswith(("http://", "https://")):
+        url = source
+        if name is None:
+            name = os.path.splitext(os.path.basename(url))[0]
+        with telemetry.stage(name, "download") as record:
+            source, downloaded = download_pdf(url)
+            record.update(bytes_out=os.path.getsize(source), cache="miss" if downloaded else "hit")
+
+    reset_peak_rss()
+    if memory_bounded:
+        result, doc_hash = abridge_on_disk(source, name, abridge, telemetry)
+    else:
+        result, doc_hash = abridge_in_memory(source, name, abridge, workers, pool, telemetry, max_pages, max_tokens)
+    name = result["name"]
+    try:
+        from_disk = "pdf_path" in result and extraction == "monolithic" and not (compact or fingerprints or sessions)
+        if "pdf_path" in result and not from_disk:
+            with open(result["pdf_path"], "rb") as f:  # the other modes work on the PDF in memory
+                result["pdf_bytes"] = f.read()
+        payload_bytes = os.path.getsize(result["pdf_path"]) if from_disk else len(result["pdf_bytes"])
+
+        if compact:
+            with telemetry.stage(name, "compaction", bytes_in=len(result["pdf_bytes"]), mode=compact) as record:
+                result["pdf_bytes"], result["compaction"] = compact_pdf_bytes(result["pdf_bytes"], compact, image_only)
+                record.update(bytes_out=len(result["pdf_bytes"]), save_seconds=result["compaction"]["save_seconds"],
+                              image_only_pages=len(result["compaction"]["image_only_pages"]),
+                              pages_dropped=len(result["compaction"]["pages_dropped"]))
+            result["pages_after"] = result["compaction"]["pages_after"]
+            payload_bytes = len(result["pdf_bytes"])
+
+        gemini_stats = {}
+        analyze = EXTRACTION_MODES[extraction]
+        if fingerprints is not None:
+            analyze = functools.partial(analyze_pdf_incremental, index=fingerprints, company=company, year=year)
+        if from_disk:
+            result["data"] = analyze_pdf_file(result["pdf_path"], prompt, client, temperature, cache=cache, label=name,
+                                              stats=gemini_stats)
+        else:
+            result["data"] = analyze(result["pdf_bytes"], prompt, client, temperature, cache=cache, label=name,
+                                     stats=gemini_stats, sessions=sessions)
+        telemetry.emit(name, "gemini_call", gemini_stats["gemini_seconds"], bytes_in=payload_bytes,
+                       bytes_out=gemini_stats.get("response_bytes"), pages_in=result["pages_after"],
+                       cache=gemini_stats["cache"], repairs=gemini_stats.get("repairs"),
+                       full_retries=gemini_stats.get("full_retries"),
+                       **token_fields(gemini_stats.get("usage_metadata")))
+        if "routing_seconds" in gemini_stats:
+            telemetry.emit(name, "section_routing", gemini_stats["routing_seconds"], pages_in=result["pages_after"])
+        if "reused_sections" in gemini_stats:
+            telemetry.emit(name, "incremental", 0.0, pages_in=result["pages_after"],
+                           reused_from=gemini_stats["reused_from"], reused=gemini_stats["reused_sections"],
+                           pages_saved=gemini_stats["pages_saved"], tokens_saved=gemini_stats["tokens_saved"])
+        if "local_candidates" in gemini_stats:
+            telemetry.emit(name, "local_tables", gemini_stats["local_seconds"], pages_in=result["pages_after"],
+                           sections_local=len(gemini_stats["local_sections"]),
+                           sections_tabular=gemini_stats["local_candidates"], local=gemini_stats["local_sections"])
+        for shard in gemini_stats.get("shards", []):
+            telemetry.emit(name, "gemini_section", shard["seconds"], section=shard["shard"], bytes_in=shard["bytes_in"],
+                           pages_in=shard["pages_in"], cache=shard["cache"], error=shard["error"],
+                           **token_fields(shard["usage_metadata"]))
+        telemetry.emit(name, "json_parse", gemini_stats["parse_seconds"], bytes_in=gemini_stats.get("response_bytes"))
+
+        with telemetry.stage(name, "percentage_calc"):
+            result["calc_data"] = with_percentages(result["data"])
+        result["written"] = write_outputs(result, outputs, output_dir)
+        result["doc_hash"] = doc_hash or hashlib.sha256(result["pdf_bytes"]).hexdigest()
+        if store is not None and result["data"]:
+            with telemetry.stage(name, "store_upsert"):
+                store.upsert_report(result["doc_hash"], name, result["data"], source=source_label)
+
+        result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+        telemetry.emit(name, "memory", 0.0, peak_rss_mb=result["peak_rss_mb"], limit_mb=memory_limit_mb,
+                       memory_bounded=memory_bounded)
+        if memory_limit_mb is not None and result["peak_rss_mb"] > memory_limit_mb:
+            print(f"WARNING: {name} peaked at {result['peak_rss_mb']} MB RSS, above the {memory_limit_mb} MB limit")
+        return result
+    finally:
+        if result.get("spooled"):
+            os.remove(result["pdf_path"])  # the spooled abridged PDF of the memory-bounded mode
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Abridge, extract and calculate annual reports in one pass.")
+    parser.add_argument("pdfs", nargs="+", help="annual report PDF files")
+    parser.add_argument("--outputs", nargs="*", default=["calc"], choices=sorted(OUTPUT_SUFFIXES))
+    parser.add_argument("--output-dir", default="json")
+    parser.add_argument("--no-abridge", action="store_true", help="send the full PDF")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the Gemini response cache")
+    parser.add_argument("--extraction", default="monolithic", choices=sorted(EXTRACTION_MODES))
+    parser.add_argument("--upload-once", action="store_true",
+                        help="upload each PDF once and reuse it across runs (Gemini Files API)")
+    parser.add_argument("--store", nargs="?", const=DEFAULT_DB_PATH,
+                        help=f"also upsert results into a SQLite result store (default {DEFAULT_DB_PATH})")
+    parser.add_argument("--max-pages", type=int, help="page budget; selects pages by relevance score")
+    parser.add_argument("--max-tokens", type=int, help="input token budget; selects pages by relevance score")
+    parser.add_argument("--compact", choices=COMPACT_MODES, help="downsample or strip images before sending")
+    parser.add_argument("--image-only", default="mark", choices=IMAGE_ONLY_ACTIONS,
+                        help="with --compact: drop image-only pages or only mark them")
+    parser.add_argument("--incremental", nargs="?", const=DEFAULT_FINGERPRINT_DB,
+                        help="reuse the sections unchanged since the company's previous report, from this "
+                             f"fingerprint index (default {DEFAULT_FINGERPRINT_DB})")
+    parser.add_argument("--company",
+                        help="with --incremental: company of the reports; recognised from the pages if unset")
+    parser.add_argument("--year", type=int,
+                        help="with --incremental: filing year of the report; guessed from the file name if unset")
+    parser.add_argument("--memory-bounded", action="store_true",
+                        help="abridge from disk in page windows instead of loading the whole report")
+    parser.add_argument("--memory-limit-mb", type=float, help="report documents whose peak RSS goes above this")
+    parser.add_argument("--telemetry", default=DEFAULT_TELEMETRY_PATH, help="JSONL file for per-stage records")
+    parser.add_argument("--log-level", default="INFO", help="DEBUG shows the per-page selection decisions")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level, format="%(message)s")
+
+    cache = None if args.no_cache else ResponseCache()
+    telemetry = TelemetrySink(args.telemetry)
+    sessions = DocumentSessions() if args.upload_once else None
+    store = ResultStore(args.store) if args.store else None
+    fingerprints = FingerprintIndex(args.incremental) if args.incremental else None
+    workers = default_workers()
+    # one pool for the whole batch; serial scans never start one
+    with make_pool(workers) if workers > 1 else contextlib.nullcontext() as pool:
+        for pdf_path in args.pdfs:
+            print(f"Processing PDF: {pdf_path}")
+            result = run_pipeline(pdf_path, abridge=not args.no_abridge, outputs=args.outputs,
+                                  output_dir=args.output_dir, cache=cache, workers=workers, pool=pool,
+                                  telemetry=telemetry, extraction=args.extraction,
+                                  sessions=sessions, store=store, memory_bounded=args.memory_bounded,
+                                  memory_limit_mb=args.memory_limit_mb, max_pages=args.max_pages,
+                                  max_tokens=args.max_tokens, compact=args.compact, image_only=args.image_only,
+                                  fingerprints=fingerprints, company=args.company, year=args.year)
+            print(f"{pdf_path}: {result['pages_before']} -> {result['pages_after']} pages, "
+                  f"peak RSS {result['peak_rss_mb']} MB, wrote {', '.join(result['written']) or 'nothing'}")
+            if "compaction" in result:
+                print(f"  compacted: {describe(result['compaction'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+import copy
+import time
+
+from gemini_common import MODEL_NAME, get_client, parse_json_response
+from response_cache import cache_key, file_cache_key, usage_to_dict
+
+# Extraction prompt used with the abridged annual reports (see annual_report_g_pdf-izzudin.py)
+EXTRACTION_PROMPT = """
+   You are an expert in financial analysis and annual reports. Your ABSOLUTE TOP PRIORITY is to extract specific information from the provided text and output the response in a STRICTLY VALID JSON format. If information is not found, leave the corresponding field empty or null.
+
+EXTRACT THE FOLLOWING INFORMATION:
+
+1. **Executive Directors**: (title, name, age, and total remuneration (salary, bonuses, other compensation, if available)).
+    *   If age is not explicitly stated, do not include it.
+    *   For salary, if there are multiple sources of remuneration (e.g., from the company and a group entity), sum all applicable amounts and report the total remuneration. Specify the currency.
+    *   If total remuneration is not available or cannot be reliably calculated, set the `total_remuneration` to `null`.
+
+2. **Geographical Segments/Geographical Information**: (name, total revenue, and percentage of total revenue).
+    *   Extract data ONLY from the "Geographical Segments" or "Geographical Information" section within the "Notes To The Financial Statements."
+    *   Extract the revenue from external customers by geographical location from the annual report. This information is typically located in the notes to the financial statements, often under a section titled "Segment Reporting," "Operating Segments," or "Geographical Segments."
+    *   The revenue should be broken down by geographical regions, and the values are expected to be in RM'000
+    *   Revenue from external customers by geographical location of customers
+    *   Extract directly from table rows if the data is presented in a table format.
+    *   **CRITICAL:** If a table with geographical segments information is absent in the "Notes To The Financial Statements", set the entire "Geographical Segments" value to `null`. Do NOT use information from other sections of the report.
+    *   Ignore rows or segments marked with "-". If a segment is ignored, do not include the corresponding key-value pair.
+
+3. **Business Segments**: (name, total revenue, and percentage of total revenue).
+    *   From the "Segment Information" table in the "Notes to the Financial Statements" section, extract the total revenue for each business segment. List each business segment along with its corresponding external revenue
+    *   Get the total revenue per business segment as well
+    *   The values are expected to be in RM'000 , note the currency used in the currency_unit
+    *   **CRITICAL:** You MUST find a section titled "Business Segments," "Business Information," or "Segment Information" in the "Notes To The Financial Statements" section of the annual report.
+    *   **AVOID**: Do NOT use numbers from *Review of Performance* or *Review of Financial Performance*.
+    *   Treat "-" as 0 (zero). If a business segment has zero revenue, represent the revenue as `0` (a number) and the percentage as `0.0` (a number).
+
+4.  **Major Customers**: (name, total revenue, year and percentage). "-" in the table means no revenue available for that year. Count as null. If the revenue for the current year is not available or not present in the table, also count as null.
+
+
+5. **Corporate Structure**: (information from *INVESTMENT IN SUBSIDIARIES*, *SUBSIDIARIES, ASSOCIATES AND JOINT VENTURES*, *SUBSIDIARIES*, or related sections)
+    *   **Subsidiaries (ownership >= 50%)**: Extract name, principal activities, and ownership percentage (as a number from 1 to 100).
+    *   **Associates (ownership < 50%)**: Extract name, principal activities, and ownership percentage (as a number from 1 to 100).
+    *   **Subsidiaries/Associates (Unknown ownership)**: Extract name and principal activities.
+
+6. **Land Areas**: (in square feet - MUST be a number). If not found, set to `null`.
+
+7. **Top 30 Shareholders**:
+    *   **Date of shareholdings update**
+    *   **Total number of shares** (total number of shares issued by the company)
+    *   **Treasury shares (if applicable)**
+    *   Distinguish between the nominee entities and the individuals or entities they represent. For each entry, list:
+        *   The nominee (if applicable, e.g., "BI Nominees (Tempatan) Sdn Bhd").
+        *   The represented shareholder (if applicable, e.g., "Rajesh A/L Jaikishan" in "Kenanga Nominees (Tempatan) Sdn Bhd for Rajesh A/L Jaikishan").
+        *   The number of shares.
+        *   If the shareholder is an individual or entity without a nominee, indicate that there is no nominee. Provide the total shares and percentage at the end.
+    *   Represent the percentage as numbers from 1 to 100, ie : 2.27% -> 2.27
+    *   Check the next page of the report as well for continuation of shareholder list
+
+OUTPUT REQUIREMENTS (MUST BE FOLLOWED EXACTLY):
+
+*   THE OUTPUT MUST BE A VALID JSON OBJECT.  THIS IS YOUR TOP PRIORITY.
+*   Use clear and descriptive keys for each extracted field.
+*   IF A SPECIFIC PIECE OF INFORMATION IS NOT FOUND IN THE TEXT, SET THE CORRESPONDING VALUE TO `null`. DO NOT MAKE UP INFORMATION.
+*   Ensure that numerical values are represented as NUMBERS (e.g., 1234567.89), NOT STRINGS ("1234567.89"). Percentages should be numbers (e.g., 25.0 for 25%).
+*   Arrays should be used to represent lists of items (e.g., a list of Executive Directors).
+*   Include ALL the fields/keys from the example structure (provided below, or in previous turns), even if the value is `null`. This maintains a consistent JSON structure.
+        {
+        "executive_directors": [
+            {
+            "title": "Chief Executive Officer",
+            "name": "Alice Johnson",
+            "age": 55,
+            "remuneration": {
+                "salary": 1200000,
+                "directorFees": 30000,
+                "meetingAllowance": 2500,
+                "otherEmoluments": 230623
+                },
+            "total remuneration" : 1463123
+            "remuneration_currency_unit":"RM"
+            },
+    
+        ],
+        "geographical_segments": [
+            {
+            "segment": "Malaysia",
+            "total_revenue": 500000000.00,
+            "percentage": 0.60
+            },
+            {
+            "segment": "Thailand",
+            "total_revenue": 250000000.00,
+            "percentage": 0.30
+            },
+            {
+            "segment": "China",
+            "total_revenue": 83333333.33,
+            "percentage": 0.10
+            }
+        ],
+        "business_segments": [
+            {
+            "segment": "Software",
+            "total_revenue" : 4500000.00
+            "currency_unit" : "RM'000",
+            "percentage": 0.48
+            },
+            {
+            "segment": "Manufacturing",
+            "total_revenue": 350000000.00,
+            "currency_unit" : "RM'000",
+            "percentage": 0.42
+            },
+            {
+            "segment": "Services",
+            "total_revenue": 2234500.00,
+            "currency_unit" : "RM'000",
+            "percentage": 0.10
+            }
+        ],
+        "major_customers": [
+            {
+            "customer name": "Customer 2",
+            "segment" : "construction"
+            "total_revenue": 0,
+            "currency_unit" : "RM'000"
+            "percentage": 0,
+            },
+            {
+            "customer name": "Customer C",
+            "segment" : "construction"
+            "total_revenue": 75000000.00,
+            "currency_unit" : "RM'000"
+            "percentage": 0.09,
+            }
+        ],
+        "corporate_structure": {
+            "subsidiaries": [
+            {
+                "name": "Alpha Ltd",
+                "principal_activities": "Software Development",
+                "ownership_percentage": 0.80
+            },
+            {
+                "name": "Gamma Corp",
+                "principal_activities": "Hardware Manufacturing",
+                "ownership_percentage": 1.00
+            }
+            ],
+            "associates": [
+            {
+                "name": "Delta Inc",
+                "principal_activities": "Research and Development",
+                "ownership_percentage": 0.30
+            }
+            ],
+            "unknown_ownership": [
+            {
+                "name": "Epsilon Group",
+                "principal_activities": "Marketing and Sales"
+            }
+            ]
+        },
+        "land_areas": [
+            {"land" : Tanah ABC
+            "area"  :1230
+            "unit"  : "hectares"/"sq ft"}
+        ],
+        "top_30_shareholders": {
+            "shareholdings_update_date": "DAY-MONTH-YEAR",
+            "total_shares": 10000000.00,
+            "treasury_shares": 500000.00,
+            "shareholders": [
+            {
+                "nominee/trustee": BI Nominees (Tempatan) Sdn Bhd
+                "represented shareholder": Rajesh A/L Jaikishan
+                "shares": 45,730,000
+                "percentage": 6.20%
+            },
+            ]
+        }
+    }
+    """
+
+
+def analyze_pdf_bytes(pdf_bytes, prompt=EXTRACTION_PROMPT, client=None, temperature=0.5, model=MODEL_NAME,
+                      cache=None, refresh=False, label="PDF", stats=None, sessions=None):
+    """
+    Send a PDF held in memory to Gemini AI and get structured JSON data.
+
+    A cached result (see `response_cache.ResponseCache`) skips both the PDF upload and the
+    Gemini call. Errors are printed and give {}.
+
+    Args:
+        pdf_bytes (bytes): The PDF to send.
+        prompt (str): Extraction prompt.
+        client (genai.Client): Defaults to `gemini_common.get_client()`.
+        cache (ResponseCache): Optional response cache.
+        refresh (bool): Re-call Gemini even when the result is cached, and overwrite the entry.
+        label (str): Name of the document in log messages.
+        stats (dict): If given, filled with cache status ("hit", "miss" or "off"), usage metadata,
+            response size and the seconds spent in the Gemini call and in JSON parsing.
+        sessions (DocumentSessions): Upload the PDF once and pass it by reference instead of
+            sending the bytes with every request (see `document_sessions`).
+    """
+    def send(client, config):
+        from google.genai import types
+
+        if sessions is not None:
+            return sessions.generate_content(client, model, config, pdf_bytes, prompt, label)
+        return client.models.generate_content(
+            model=model,
+            config=config,
+            contents=[
+                types.Part.from_bytes(
+                    data=pdf_bytes,
+                    mime_type='application/pdf',
+                ),
+                prompt
+            ]
+        )
+
+    return _analyze(lambda: cache_key(pdf_bytes, prompt, model, temperature), send, client, temperature, cache,
+                    refresh, label, stats)
+
+
+def analyze_pdf_file(pdf_path, prompt=EXTRACTION_PROMPT, client=None, temperature=0.5, model=MODEL_NAME,
+                     cache=None, refresh=False, label="PDF", stats=None):
+    """
+    `analyze_pdf_bytes` for a PDF on disk that is never loaded into memory.
+
+    The cache key is computed from the file read in chunks (it equals the key of the same
+    bytes in memory), and on a miss the file is uploaded from its path with the Files API
+    (`document_sessions.GeminiFileStore`), passed by reference and deleted after the call.
+    """
+    def send(client, config):
+        from google.genai import types
+
+        from document_sessions import GeminiFileStore
+
+        store = GeminiFileStore(client)
+        handle = store.upload(pdf_path, label)
+        try:
+            return client.models.generate_content(
+                model=model, config=config,
+                contents=[types.Part.from_uri(file_uri=handle["uri"], mime_type=handle["mime_type"]), prompt])
+        finally:
+            store.delete(handle["name"])
+
+    return _analyze(lambda: file_cache_key(pdf_path, prompt, model, temperature), send, client, temperature, cache,
+                    refresh, label, stats)
+
+
+def _analyze(make_key, send, client, temperature, cache, refresh, label, stats):
+    """Cache lookup, `send(client, config)` on a miss, parsing and caching shared by the analyze functions."""
+    if stats is None:
+        stats = {}
+    stats.update(cache="off" if cache is None else "miss", gemini_seconds=0.0, parse_seconds=0.0)
+    try:
+        key = make_key()
+        if cache is not None and not refresh:
+            cached = cache.get(key)
+            if cached is not None:
+                print(f"Cache hit: {label}")
+                print(cached["usage_metadata"])
+                stats.update(cache="hit", usage_metadata=cached["usage_metadata"])
+                return cached["json_data"]
+
+        from google.genai import types  # only after a cache miss: the genai import takes about a second
+
+        if client is None:
+            client = get_client()
+
+        # Generate content using Gemini AI
+        start = time.perf_counter()
+        config = types.GenerateContentConfig(
+            temperature=temperature  # Low temperature for consistent outputs, low randomness
+        )
+        response = send(client, config)
+
+        stats["gemini_seconds"] = time.perf_counter() - start
+        print(response.usage_metadata)
+
+        start = time.perf_counter()
+        json_data = parse_json_response(response.text)
+        stats.update(parse_seconds=time.perf_counter() - start, usage_metadata=usage_to_dict(response.usage_metadata),
+                     response_bytes=len((response.text or "").encode("utf-8")))
+
+        if cache is not None and isinstance(json_data, dict) and json_data:  # a failed parse is not cached
+            cache.put(key, response.text, json_data, response.usage_metadata)
+        return json_data
+
+    except Exception as e:
+        print(f"ERROR: Gemini processing failed: {e}")
+        return {}
+
+
+def calculate_percentage(structured_data):
+
+    # Calculate percentage for segments
+    geographical_segments = structured_data.get('geographical_segments', []) 
+    if geographical_segments:
+        total_revenue = sum(segment['total_revenue'] for segment in geographical_segments if segment.get('total_revenue') is not None)
+        for segment in geographical_segments:
+            if segment.get('total_revenue') is not None:
+                segment['percentage'] = (segment['total_revenue'] / total_revenue * 100) if total_revenue > 0 else 0
+            else:
+                segment['percentage'] = 0  # Handle NoneType
+
+    # Calculate percentage for business segments
+    business_segments = structured_data.get('business_segments', [])
+    if business_segments:
+        total_business_revenue = sum(business['total_revenue'] for business in business_segments if business.get('total_revenue') is not None)
+        for business in business_segments:
+            if business.get('total_revenue') is not None:
+                business['percentage'] = (business['total_revenue'] / total_business_revenue * 100) if total_business_revenue > 0 else 0
+            else:
+                business['percentage'] = 0  # Handle NoneType
+
+    # Calculate percentage for major customers
+    major_customers = structured_data.get('major_customers', [])
+    if major_customers:
+        total_customer_revenue = sum(customer['total_revenue'] for customer in major_customers if customer.get('total_revenue') is not None)
+        for customer in major_customers:
+            if customer.get('total_revenue') is not None:
+                customer['percentage'] = (customer['total_revenue'] / total_customer_revenue * 100) if total_customer_revenue > 0 else 0
+            else:
+                customer['percentage'] = 0  # Handle NoneType
+
+    calc_data = structured_data
+    return calc_data
+
+
+def with_percentages(structured_data):
+    """`calculate_percentage` on a copy, leaving the raw extraction untouched."""
+    return calculate_percentage(copy.deepcopy(structured_data))
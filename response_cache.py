@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+
+DEFAULT_CACHE_DIR = os.path.join(".cache", "gemini")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # Size cap of the cache directory before LRU eviction
+
+
+def cache_key(pdf_bytes, prompt, model, temperature):
+    """Content address of one Gemini request: PDF bytes, prompt text, model name and temperature."""
+    return _request_key(hashlib.sha256(pdf_bytes).digest(), prompt, model, temperature)
+
+
+def file_cache_key(pdf_path, prompt, model, temperature):
+    """`cache_key` of the PDF in a file, read in chunks instead of loaded whole."""
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return _request_key(digest.digest(), prompt, model, temperature)
+
+
+def _request_key(pdf_digest, prompt, model, temperature):
+    key = hashlib.sha256()
+    key.update(pdf_digest)
+    key.update(prompt.encode("utf-8"))
+    key.update(model.encode("utf-8"))
+    key.update(repr(float(temperature)).encode("utf-8"))
+    return key.hexdigest()
+
+
+def usage_to_dict(usage_metadata):
+    """Convert `response.usage_metadata` into plain JSON-serialisable data."""
+    if usage_metadata is None:
+        return None
+    if hasattr(usage_metadata, "model_dump"):
+        return usage_metadata.model_dump(mode="json", exclude_none=True)
+    return dict(usage_metadata)
+
+
+class ResponseCache:
+    """
+    On-disk cache of Gemini extraction results, one JSON file per request key.
+
+    Each entry stores the raw response text, the parsed JSON and the usage metadata.
+    Reading an entry refreshes its modification time; when the directory grows past
+    `max_bytes` the least recently used entries are deleted.
+
+    Args:
+        cache_dir (str): Directory holding the cache entries.
+        max_bytes (int): Size cap of the directory.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """Return the cached entry for `key`, or None on a miss (an entry without parsed data is a miss)."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        if not entry.get("json_data"):
+            self.misses += 1  # a failed parse stored by an earlier version
+            return None
+
+        os.utime(path)  # mark as recently used
+        self.hits += 1
+        return entry
+
+    def put(self, key, response_text, json_data, usage_metadata=None):
+        """Store one response and evict old entries if the cache is over its size cap."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = {
+            "key": key,
+            "response_text": response_text,
+            "json_data": json_data,
+            "usage_metadata": usage_to_dict(usage_metadata),
+        }
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)  # readers never see a half written entry
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in `max_bytes`."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, name))
+            total -= size
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
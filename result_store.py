@@ -0,0 +1,350 @@
+"""
+SQLite store of extraction results, normalised per entity.
+
+One row per document (keyed by the sha256 of the PDF, with company and year) holds the
+raw extraction JSON, so `export_json` gives back exactly what `save_json` writes today.
+The entities are also split into indexed tables, so cross-report questions are one query:
+
+    documents     doc_hash, name, company, year, source, shareholdings date / total / treasury shares,
+                  guessed ("company", "year" or "company,year" when they were not given but guessed)
+    directors     title, name, age, salary, director_fees, meeting_allowance, other_emoluments,
+                  total_remuneration, currency
+    segments      kind ("geographical" or "business"), segment, total_revenue, currency_unit, percentage
+    customers     name, segment, year, total_revenue, currency_unit, percentage
+    entities      relation ("subsidiary", "associate" or "unknown"), name, principal_activities,
+                  ownership_percentage
+    land          land, area, unit
+    shareholders  nominee, represented, shares, percentage
+
+Percentages in `segments` and `customers` are those of `calculate_percentage`. Saving a
+document again replaces all of its rows (upsert), so results can be stored as reports finish.
+
+Usage:
+    python result_store.py import json/ [--db results.db] [--pdf-dir pdf] [--company NAME] [--year 2023]
+    python result_store.py export <doc_hash or name> [--calc] [--db results.db]
+    python result_store.py subsidiaries [--min-ownership 50] [--year 2023] [--db results.db]
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+from bulk_percentages import invalid_reason
+from report_extraction import with_percentages
+
+DEFAULT_DB_PATH = "results.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_hash TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    company TEXT,
+    year INTEGER,
+    source TEXT,
+    shareholdings_update_date TEXT,
+    total_shares REAL,
+    treasury_shares REAL,
+    stored_at REAL NOT NULL,
+    raw_json TEXT NOT NULL,
+    guessed TEXT
+);
+CREATE INDEX IF NOT EXISTS documents_company_year ON documents (company, year);
+CREATE INDEX IF NOT EXISTS documents_year ON documents (year);
+CREATE INDEX IF NOT EXISTS documents_name ON documents (name);
+
+CREATE TABLE IF NOT EXISTS directors (
+    doc_hash TEXT NOT NULL REFERENCES documents (doc_hash) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    title TEXT, name TEXT, age INTEGER,
+    salary REAL, director_fees REAL, meeting_allowance REAL, other_emoluments REAL,
+    total_remuneration REAL, currency TEXT
+);
+CREATE INDEX IF NOT EXISTS directors_doc ON directors (doc_hash);
+CREATE INDEX IF NOT EXISTS directors_name ON directors (name);
+
+CREATE TABLE IF NOT EXISTS segments (
+    doc_hash TEXT NOT NULL REFERENCES documents (doc_hash) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    kind TEXT NOT NULL, segment TEXT, total_revenue REAL, currency_unit TEXT, percentage REAL
+);
+CREATE INDEX IF NOT EXISTS segments_doc ON segments (doc_hash);
+CREATE INDEX IF NOT EXISTS segments_kind_segment ON segments (kind, segment);
+
+CREATE TABLE IF NOT EXISTS customers (
+    doc_hash TEXT NOT NULL REFERENCES documents (doc_hash) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT, segment TEXT, year TEXT, total_revenue REAL, currency_unit TEXT, percentage REAL
+);
+CREATE INDEX IF NOT EXISTS customers_doc ON customers (doc_hash);
+CREATE INDEX IF NOT EXISTS customers_name ON customers (name);
+
+CREATE TABLE IF NOT EXISTS entities (
+    doc_hash TEXT NOT NULL REFERENCES documents (doc_hash) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    relation TEXT NOT NULL, name TEXT, principal_activities TEXT, ownership_percentage REAL
+);
+CREATE INDEX IF NOT EXISTS entities_doc ON entities (doc_hash);
+CREATE INDEX IF NOT EXISTS entities_relation_ownership ON entities (relation, ownership_percentage);
+CREATE INDEX IF NOT EXISTS entities_name ON entities (name);
+
+CREATE TABLE IF NOT EXISTS land (
+    doc_hash TEXT NOT NULL REFERENCES documents (doc_hash) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    land TEXT, area REAL, unit TEXT
+);
+CREATE INDEX IF NOT EXISTS land_doc ON land (doc_hash);
+
+CREATE TABLE IF NOT EXISTS shareholders (
+    doc_hash TEXT NOT NULL REFERENCES documents (doc_hash) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    nominee TEXT, represented TEXT, shares REAL, percentage REAL
+);
+CREATE INDEX IF NOT EXISTS shareholders_doc ON shareholders (doc_hash);
+CREATE INDEX IF NOT EXISTS shareholders_represented ON shareholders (represented);
+"""
+
+CHILD_TABLES = ["directors", "segments", "customers", "entities", "land", "shareholders"]
+RELATIONS = {"subsidiaries": "subsidiary", "associates": "associate", "unknown_ownership": "unknown"}
+
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def to_number(value):
+    """
+    Numbers as float; strings like "45,730,000", "6.20%" or "RM 1.2" parsed, and accounting
+    negatives like "(1,234)" or "RM (1.2)" made negative; anything else None.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        sign = -1.0 if re.fullmatch(r"[^\d()]*\(.*\)\s*", value) else 1.0
+        cleaned = re.sub(r"[^0-9.\-]", "", value)
+        try:
+            return sign * float(cleaned)
+        except ValueError:
+            return None
+    return None
+
+
+def to_text(value):
+    return None if value is None else str(value)
+
+
+def _items(value):
+    """List items that are objects; anything else in the extraction is ignored."""
+    return [item for item in value if isinstance(item, dict)] if isinstance(value, list) else []
+
+
+def guess_year(name, data):
+    """Filing year from the shareholdings date, else from a 4-digit year in the document name."""
+    shareholdings = data.get("top_30_shareholders") if isinstance(data, dict) else None
+    date = shareholdings.get("shareholdings_update_date") if isinstance(shareholdings, dict) else None
+    for text in (to_text(date), name):
+        match = re.search(r"(?<!\d)(19|20)\d\d(?!\d)", text or "")
+        if match:
+            return int(match.group(0))
+    return None
+
+
+def normalise(data):
+    """Splits one calculated extraction into {table: [row tuples without doc_hash]}."""
+    rows = {table: [] for table in CHILD_TABLES}
+    for i, director in enumerate(_items(data.get("executive_directors"))):
+        remuneration = director.get("remuneration") if isinstance(director.get("remuneration"), dict) else {}
+        total = director.get("total_remuneration", director.get("total remuneration"))
+        age = to_number(director.get("age"))
+        rows["directors"].append((
+            i, to_text(director.get("title")), to_text(director.get("name")), int(age) if age is not None else None,
+            to_number(remuneration.get("salary")), to_number(remuneration.get("directorFees")),
+            to_number(remuneration.get("meetingAllowance")), to_number(remuneration.get("otherEmoluments")),
+            to_number(total), to_text(director.get("remuneration_currency_unit"))))
+    for kind in ("geographical", "business"):
+        for i, segment in enumerate(_items(data.get(f"{kind}_segments"))):
+            rows["segments"].append((i, kind, to_text(segment.get("segment")), to_number(segment.get("total_revenue")),
+                                     to_text(segment.get("currency_unit")), to_number(segment.get("percentage"))))
+    for i, customer in enumerate(_items(data.get("major_customers"))):
+        rows["customers"].append((i, to_text(customer.get("customer name", customer.get("name"))),
+                                  to_text(customer.get("segment")), to_text(customer.get("year")),
+                                  to_number(customer.get("total_revenue")), to_text(customer.get("currency_unit")),
+                                  to_number(customer.get("percentage"))))
+    structure = data.get("corporate_structure") if isinstance(data.get("corporate_structure"), dict) else {}
+    for key, relation in RELATIONS.items():
+        for i, entity in enumerate(_items(structure.get(key))):
+            rows["entities"].append((i, relation, to_text(entity.get("name")),
+                                     to_text(entity.get("principal_activities")),
+                                     to_number(entity.get("ownership_percentage"))))
+    for i, land in enumerate(_items(data.get("land_areas"))):
+        rows["land"].append((i, to_text(land.get("land")), to_number(land.get("area")), to_text(land.get("unit"))))
+    shareholdings = data.get("top_30_shareholders") if isinstance(data.get("top_30_shareholders"), dict) else {}
+    for i, holder in enumerate(_items(shareholdings.get("shareholders"))):
+        rows["shareholders"].append((i, to_text(holder.get("nominee/trustee")),
+                                     to_text(holder.get("represented shareholder")),
+                                     to_number(holder.get("shares")), to_number(holder.get("percentage"))))
+    return rows
+
+
+class ResultStore:
+    """
+    SQLite result store (see the module docstring for the tables).
+
+    Args:
+        db_path (str): Database file, created on first use. ":memory:" for a throwaway store.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(SCHEMA)
+        if "guessed" not in [row[1] for row in self.conn.execute("PRAGMA table_info(documents)")]:
+            self.conn.execute("ALTER TABLE documents ADD COLUMN guessed TEXT")  # stores created before the column
+
+    def upsert_report(self, doc_hash, name, data, company=None, year=None, source=None):
+        """
+        Stores (or replaces) the extraction of one document in a single transaction.
+
+        Args:
+            doc_hash (str): sha256 of the PDF.
+            name (str): Document name, as used for the JSON file names.
+            data (dict): The raw extraction (the `_pdf.json` content); percentages are computed here.
+            company (str): Defaults to `name`.
+            year (int): Defaults to the year of the shareholdings date or the name, see `guess_year`.
+            source (str): Path or URL of the PDF.
+
+        A defaulted company or year is listed in the `guessed` column. An extraction that
+        `calculate_percentage` cannot handle (see `bulk_percentages.invalid_reason`) raises ValueError.
+        """
+        reason = invalid_reason(data)
+        if reason:
+            raise ValueError(f"{name}: {reason}")
+        calc_data = with_percentages(data)
+        guessed = ",".join(field for field, value in (("company", company), ("year", year)) if value is None)
+        shareholdings = data.get("top_30_shareholders") if isinstance(data.get("top_30_shareholders"), dict) else {}
+        with self.conn:
+            # deleting the document cascades to its entity rows
+            self.conn.execute("DELETE FROM documents WHERE doc_hash = ?", (doc_hash,))
+            self.conn.execute(
+                "INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (doc_hash, name, company or name, year if year is not None else guess_year(name, data), source,
+                 to_text(shareholdings.get("shareholdings_update_date")), to_number(shareholdings.get("total_shares")),
+                 to_number(shareholdings.get("treasury_shares")), time.time(), json.dumps(data, ensure_ascii=False),
+                 guessed or None))
+            for table, rows in normalise(calc_data).items():
+                if rows:
+                    placeholders = ", ".join("?" * (len(rows[0]) + 1))
+                    self.conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})",
+                                          [(doc_hash,) + row for row in rows])
+
+    def find(self, key):
+        """doc_hash of a document given its hash (or a unique prefix of it) or its name; None if not found."""
+        row = self.conn.execute("SELECT doc_hash FROM documents WHERE doc_hash = ? OR name = ? "
+                                "ORDER BY stored_at DESC LIMIT 1", (key, key)).fetchone()
+        if row is None and len(key) >= 8:
+            rows = self.conn.execute("SELECT doc_hash FROM documents WHERE doc_hash LIKE ?", (key + "%",)).fetchall()
+            row = rows[0] if len(rows) == 1 else None
+        return row[0] if row else None
+
+    def export_json(self, doc_hash, calc=False):
+        """The stored extraction in today's `_pdf.json` shape, or the `_calc.json` shape with `calc=True`."""
+        row = self.conn.execute("SELECT raw_json FROM documents WHERE doc_hash = ?", (doc_hash,)).fetchone()
+        if row is None:
+            return None
+        data = json.loads(row[0])
+        return with_percentages(data) if calc else data
+
+    def subsidiaries(self, min_ownership=50.0, year=None):
+        """(company, year, subsidiary, ownership %) of every subsidiary owned more than `min_ownership`%."""
+        query = ("SELECT d.company, d.year, e.name, e.ownership_percentage FROM entities e "
+                 "JOIN documents d ON d.doc_hash = e.doc_hash "
+                 "WHERE e.relation = 'subsidiary' AND e.ownership_percentage > ?")
+        params = [min_ownership]
+        if year is not None:
+            query += " AND d.year = ?"
+            params.append(year)
+        return self.conn.execute(query + " ORDER BY d.company, e.ownership_percentage DESC", params).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def import_json_dir(store, json_dir, pdf_dir=None, company=None, year=None):
+    """
+    Loads existing `<name>_pdf.json` files into the store.
+
+    The document hash is that of `<pdf_dir>/<name>.pdf` when it exists, otherwise of the JSON file.
+    Without `company` / `year` they are guessed per file and marked as such (see `upsert_report`).
+    A file that cannot be stored is reported and skipped.
+    """
+    count = 0
+    for path in sorted(glob.glob(os.path.join(json_dir, "*_pdf.json"))):
+        name = os.path.basename(path)[:-len("_pdf.json")]
+        with open(path, "rb") as f:
+            raw = f.read()
+        pdf_path = os.path.join(pdf_dir, name + ".pdf") if pdf_dir else None
+        if pdf_path and os.path.exists(pdf_path):
+            with open(pdf_path, "rb") as f:
+                doc_hash = sha256_bytes(f.read())
+        else:
+            doc_hash, pdf_path = sha256_bytes(raw), None
+        try:
+            store.upsert_report(doc_hash, name, json.loads(raw), company, year, source=pdf_path)
+            count += 1
+        except ValueError as e:  # includes json.JSONDecodeError
+            print(f"ERROR: Skipping {path}: {e}")
+    if count and (company is None or year is None):
+        print("WARNING: company/year of the imported reports guessed from their names and shareholdings dates "
+              "(marked in documents.guessed); pass --company / --year to set them")
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query and maintain the SQLite result store.")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="load existing *_pdf.json files")
+    import_parser.add_argument("json_dir", nargs="?", default="json")
+    import_parser.add_argument("--pdf-dir", default="pdf", help="PDFs to hash, matched by name")
+    import_parser.add_argument("--company", help="company of every imported report; guessed per file if unset")
+    import_parser.add_argument("--year", type=int, help="year of every imported report; guessed per file if unset")
+    export_parser = commands.add_parser("export", help="print a stored extraction as JSON")
+    export_parser.add_argument("key", help="document hash, hash prefix or name")
+    export_parser.add_argument("--calc", action="store_true", help="with percentages (the _calc.json shape)")
+    subsidiaries_parser = commands.add_parser("subsidiaries", help="subsidiaries above an ownership threshold")
+    subsidiaries_parser.add_argument("--min-ownership", type=float, default=50.0)
+    subsidiaries_parser.add_argument("--year", type=int)
+    args = parser.parse_args(argv)
+
+    with ResultStore(args.db) as store:
+        if args.command == "import":
+            count = import_json_dir(store, args.json_dir, args.pdf_dir, args.company, args.year)
+            print(f"Imported {count} reports into {args.db}")
+        elif args.command == "export":
+            doc_hash = store.find(args.key)
+            if doc_hash is None:
+                print(f"Error: no document {args.key!r} in {args.db}")
+                return 1
+            print(json.dumps(store.export_json(doc_hash, calc=args.calc), indent=4, ensure_ascii=False))
+        else:
+            for company, year, name, ownership in store.subsidiaries(args.min_ownership, args.year):
+                print(f"{company}\t{year}\t{name}\t{ownership}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
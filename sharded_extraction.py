@@ -0,0 +1,233 @@
+"""
+Section-sharded extraction: one small Gemini request per group of sections.
+
+Instead of one call that extracts all seven blocks over the whole abridged PDF, the
+prompt is split into per-section sub-prompts (see `structured_extraction.section_instructions`)
+and each one gets only the pages routed to it. Routing starts from the pages
+`split_into_sections`/`check_segments` keep; a page goes to a shard when the heading of its
+section matches the keywords of the shard's sections or, for notes to the financial statements,
+when its text matches the shard's text keywords. The sub-requests run concurrently and
+are merged into the usual JSON shape.
+"""
+import asyncio
+import json
+import time
+
+import fitz  # pymupdf is imported as fitz
+
+import make_abridged_pdf_v2 as abridge
+from batch_extract import RateLimiter, generate_with_backoff
+from document_sessions import STALE_FILE_CODES
+from gemini_common import MODEL_NAME, get_client
+from keyword_matcher import KeywordMatcher
+from page_cache import PageTextCache, title_from_text
+from report_extraction import EXTRACTION_PROMPT
+from response_cache import cache_key, usage_to_dict
+from structured_extraction import SECTION_KEYWORDS, SECTIONS, response_schema, salvage_sections, section_instructions
+
+HEADING_LINES = 2  # Lines of a page matched against the shard heading keywords (heading and note heading)
+
+# shard -> (sections, text keywords for notes pages). Headings are matched against the
+# SECTION_KEYWORDS of the shard's sections.
+SHARDS = {
+    "directors": (["executive_directors"], ["directors' remuneration", "remuneration of directors", "salary", "salaries"]),
+    "segments": (["geographical_segments", "business_segments"], ["segment", "geographical"]),
+    "major_customers": (["major_customers"], ["major customer", "single customer", "one customer", "segment"]),
+    "corporate_structure": (["corporate_structure"], ["subsidiary", "subsidiaries", "associate", "associates",
+                                                      "joint venture"]),
+    "land": (["land_areas"], ["land", "hectare", "acre", "sq ft", "square feet"]),
+    "shareholders": (["top_30_shareholders"], []),
+}
+
+
+def build_router():
+    categories = {}
+    for shard, (sections, text_keywords) in SHARDS.items():
+        categories[f"{shard}:heading"] = [keyword for section in sections for keyword in SECTION_KEYWORDS[section]]
+        categories[f"{shard}:text"] = text_keywords
+    return KeywordMatcher(categories)
+
+
+def route_pages(doc):
+    """
+    Assigns the pages the abridger would keep to the shards that need them.
+
+    Returns:
+        dict: shard -> sorted page numbers. A shard nothing was routed to gets every kept
+        page, so it is never answered from an empty PDF.
+    """
+    matcher = abridge.build_matcher()
+    router = build_router()
+    cache = PageTextCache(doc=doc)
+    titles = abridge.extract_titles_from_pdf(None, cache)
+    kept = abridge.split_into_sections(titles, None, cache, matcher) or list(range(len(doc)))
+
+    routes = {shard: [] for shard in SHARDS}
+    heading = ""
+    for page_num in kept:
+        if titles[page_num]:
+            # the full title also holds body lines, so only the heading decides; untitled pages keep the previous one
+            heading = title_from_text(cache.text(page_num), HEADING_LINES)
+        hits = {hit[:-len(":heading")] for hit in router.match(heading) if hit.endswith(":heading")}
+        if "statement" in matcher.match(heading):
+            hits |= {hit[:-len(":text")] for hit in router.match(cache.text(page_num)) if hit.endswith(":text")}
+        for shard in hits:
+            routes[shard].append(page_num)
+    return {shard: pages or kept for shard, pages in routes.items()}
+
+
+def shard_prompt(prompt, sections):
+    return ("You are an expert in financial analysis and annual reports. Extract ONLY the following from the "
+            f"provided pages of an annual report: {', '.join(sections)}. "
+            "If information is not found, set the value to null. DO NOT MAKE UP INFORMATION.\n\n"
+            + section_instructions(prompt, sections))
+
+
+async def _generate_by_reference(client, shard, pdf_bytes, prompt, config, limiter, model, sessions):
+    """`generate_with_backoff` with the shard PDF uploaded once; a stale upload is replaced once."""
+    for attempt in range(2):
+        part = await asyncio.to_thread(sessions.part, pdf_bytes, f"{shard}.pdf")
+        try:
+            return await generate_with_backoff(client, [part, prompt], config, limiter, model)
+        except Exception as e:
+            if getattr(e, "code", None) not in STALE_FILE_CODES or attempt:
+                raise
+            sessions.expire(pdf_bytes)
+
+
+async def extract_shard(client, shard, pdf_bytes, prompt, limiter, model, temperature, cache, refresh, sessions=None,
+                        sections=None):
+    """
+    Runs one sub-request for `sections` (default: all the shard's sections). Always returns a
+    result dict; failures are reported in `error`.
+    """
+    from google.genai import types
+
+    sections = sections or SHARDS[shard][0]
+    result = {"shard": shard, "sections": sections, "data": {}, "usage_metadata": None,
+              "cache": "off" if cache is None else "miss", "seconds": 0.0, "bytes_in": len(pdf_bytes), "attempts": 0, "error": None}
+    start = time.perf_counter()
+    try:
+        sub_prompt = shard_prompt(prompt, sections)
+        schema = response_schema(sections)
+        key = cache_key(pdf_bytes, sub_prompt + json.dumps(schema, sort_keys=True), model, temperature)
+        cached = cache.get(key) if cache is not None and not refresh else None
+        if cached is not None:
+            result.update(data=cached["json_data"], usage_metadata=cached["usage_metadata"], cache="hit")
+            return result
+
+        config = types.GenerateContentConfig(temperature=temperature, response_mime_type="application/json",
+                                             response_schema=schema)
+        if sessions is None:
+            contents = [types.Part.from_bytes(data=pdf_bytes, mime_type='application/pdf'), sub_prompt]
+            response, result["attempts"] = await generate_with_backoff(client, contents, config, limiter, model)
+        else:
+            response, result["attempts"] = await _generate_by_reference(client, shard, pdf_bytes, sub_prompt, config,
+                                                                        limiter, model, sessions)
+        data = salvage_sections(response.text)
+        result.update(data=data, usage_metadata=usage_to_dict(response.usage_metadata))
+        if cache is not None and all(section in data for section in sections):
+            cache.put(key, response.text, data, response.usage_metadata)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def shard_pdfs(pdf_bytes, routes=None):
+    """
+    Routes the pages of a PDF and returns shard -> (PDF bytes of its pages, page count).
+
+    `routes` (shard -> page numbers, from `route_pages`) skips the routing; shards missing
+    from it get no PDF.
+    """
+    pdfs = {}
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for shard, pages in (route_pages(doc) if routes is None else routes).items():
+            if len(pages) == len(doc):
+                pdfs[shard] = (pdf_bytes, len(pages))
+                continue
+            with fitz.open() as shard_doc:
+                for page_num in pages:
+                    shard_doc.insert_pdf(doc, from_page=page_num, to_page=page_num)
+                pdfs[shard] = (shard_doc.tobytes(garbage=3, deflate=True, no_new_id=True), len(pages))
+    return pdfs
+
+
+async def extract_shards(pdfs, prompt=EXTRACTION_PROMPT, client=None, temperature=0.5, model=MODEL_NAME,
+                         cache=None, refresh=False, requests_per_minute=None, tokens_per_minute=None,
+                         sessions=None, sections=None):
+    """
+    Runs the sub-requests of all shards concurrently.
+
+    Args:
+        pdfs (dict): shard -> (PDF bytes, page count), from `shard_pdfs`.
+        sections (dict): shard -> the sections to ask for, when not all of the shard's.
+
+    Returns:
+        list: One result dict per shard (see `extract_shard`), with the routed page count in `pages_in`.
+    """
+    if client is None:
+        client = get_client()
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    results = await asyncio.gather(*(
+        extract_shard(client, shard, shard_bytes, prompt, limiter, model, temperature, cache, refresh, sessions,
+                      (sections or {}).get(shard))
+        for shard, (shard_bytes, _) in pdfs.items()))
+    for result in results:
+        result["pages_in"] = pdfs[result["shard"]][1]
+    return results
+
+
+def merge_shards(results):
+    """Merges shard results into one extraction dict; sections a shard did not return are null."""
+    data = {section: None for section in SECTIONS}
+    for result in results:
+        for section in result["sections"]:
+            data[section] = result["data"].get(section)
+    return data
+
+
+def analyze_pdf_sharded(pdf_bytes, prompt=EXTRACTION_PROMPT, client=None, temperature=0.5, model=MODEL_NAME,
+                        cache=None, refresh=False, label="PDF", stats=None, sessions=None):
+    """
+    Sharded version of `report_extraction.analyze_pdf_bytes`, with the same arguments.
+
+    `stats` gets the totals of the monolithic call (gemini_seconds is the wall time of the
+    concurrent sub-requests, usage_metadata the summed token counts), the page routing time
+    in `routing_seconds` and `shards`: the per-shard pages, bytes, seconds, token usage,
+    cache status and errors.
+    """
+    if stats is None:
+        stats = {}
+    stats.update(cache="off" if cache is None else "miss", gemini_seconds=0.0, parse_seconds=0.0)
+    try:
+        start = time.perf_counter()
+        pdfs = shard_pdfs(pdf_bytes)
+        stats["routing_seconds"] = time.perf_counter() - start
+        start = time.perf_counter()
+        results = asyncio.run(extract_shards(pdfs, prompt, client, temperature, model, cache, refresh,
+                                             sessions=sessions))
+        stats["gemini_seconds"] = time.perf_counter() - start
+    except Exception as e:
+        print(f"ERROR: Gemini processing failed: {e}")
+        return {}
+
+    collect_results(results, stats, label)
+    return merge_shards(results)
+
+
+def collect_results(results, stats, label="PDF"):
+    """Reports failed shards and puts the summed token usage, cache status and `shards` into `stats`."""
+    usage = {}
+    for result in results:
+        if result["error"]:
+            print(f"ERROR: {label}: shard {result['shard']} failed: {result['error']}")
+        for key, value in (result["usage_metadata"] or {}).items():
+            if isinstance(value, int):
+                usage[key] = usage.get(key, 0) + value
+    if results and all(result["cache"] == "hit" for result in results):
+        stats["cache"] = "hit"
+    stats.update(usage_metadata=usage, shards=results)
+    print(usage)
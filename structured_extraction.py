@@ -0,0 +1,340 @@
+"""
+Schema-constrained extraction with targeted repair.
+
+Gemini is asked for `application/json` output against RESPONSE_SCHEMA, built from the
+structure documented in EXTRACTION_PROMPT. The result is validated locally per top-level
+section. When the output is malformed or truncated, the sections that parsed are kept and
+only the invalid ones are requested again, with the pages that are relevant to them,
+instead of re-sending the full PDF with the full prompt.
+
+Counters (module level, for the whole run): structured calls, repair calls, repaired and
+unrepaired sections, and full retries (output with no usable section at all).
+"""
+import collections
+import json
+import re
+import time
+
+import fitz  # pymupdf is imported as fitz
+
+from gemini_common import MODEL_NAME, get_client
+from keyword_matcher import KeywordMatcher
+from page_cache import clipped_text, title_from_text
+from report_extraction import EXTRACTION_PROMPT
+from response_cache import cache_key, usage_to_dict
+
+NUM_TITLE_LINES = 4
+MAX_REPAIR_ROUNDS = 2
+MAX_FULL_RETRIES = 1
+
+counters = collections.Counter()
+
+_SEPARATOR = re.compile(r"\s*,?\s*")
+_COLON = re.compile(r"\s*:\s*")
+
+
+def _number(nullable=True):
+    return {"type": "NUMBER", "nullable": nullable}
+
+
+def _string(nullable=True):
+    return {"type": "STRING", "nullable": nullable}
+
+
+def _array(properties, required):
+    return {"type": "ARRAY", "nullable": True,
+            "items": {"type": "OBJECT", "properties": properties, "required": required}}
+
+
+# One schema per top-level section, in the order of the prompt's numbered instructions
+SECTION_SCHEMAS = {
+    "executive_directors": _array({
+        "title": _string(),
+        "name": _string(False),
+        "age": {"type": "INTEGER", "nullable": True},
+        "remuneration": {"type": "OBJECT", "nullable": True, "properties": {
+            "salary": _number(), "directorFees": _number(), "meetingAllowance": _number(),
+            "otherEmoluments": _number()}},
+        "total_remuneration": _number(),
+        "remuneration_currency_unit": _string(),
+    }, ["name"]),
+    "geographical_segments": _array({
+        "segment": _string(False), "total_revenue": _number(), "percentage": _number(),
+    }, ["segment"]),
+    "business_segments": _array({
+        "segment": _string(False), "total_revenue": _number(), "currency_unit": _string(), "percentage": _number(),
+    }, ["segment"]),
+    "major_customers": _array({
+        "customer name": _string(False), "segment": _string(), "year": _string(), "total_revenue": _number(),
+        "currency_unit": _string(), "percentage": _number(),
+    }, ["customer name"]),
+    "corporate_structure": {"type": "OBJECT", "nullable": True, "properties": {
+        "subsidiaries": _array({"name": _string(False), "principal_activities": _string(),
+                                "ownership_percentage": _number()}, ["name"]),
+        "associates": _array({"name": _string(False), "principal_activities": _string(),
+                              "ownership_percentage": _number()}, ["name"]),
+        "unknown_ownership": _array({"name": _string(False), "principal_activities": _string()}, ["name"]),
+    }},
+    "land_areas": _array({"land": _string(), "area": _number(), "unit": _string()}, []),
+    "top_30_shareholders": {"type": "OBJECT", "nullable": True, "properties": {
+        "shareholdings_update_date": _string(),
+        "total_shares": _number(),
+        "treasury_shares": _number(),
+        "shareholders": _array({"nominee/trustee": _string(), "represented shareholder": _string(),
+                                "shares": _number(), "percentage": _number()}, []),
+    }},
+}
+SECTIONS = list(SECTION_SCHEMAS)
+
+# Page title keywords of the pages each section is extracted from, used to build repair PDFs
+SECTION_KEYWORDS = {
+    "executive_directors": ["directors' profile", "profile of directors", "board of directors", "key senior management",
+                            "directors' remuneration", "remuneration"],
+    "geographical_segments": ["segment", "geographical"],
+    "business_segments": ["segment"],
+    "major_customers": ["segment", "major customer"],
+    "corporate_structure": ["subsidiaries", "associates", "joint venture", "corporate structure"],
+    "land_areas": ["list of properties", "properties", "land"],
+    "top_30_shareholders": ["analysis of shareholdings", "shareholdings", "thirty largest", "30 largest"],
+}
+
+
+def response_schema(sections=SECTIONS):
+    """Gemini response schema (OpenAPI subset) for the given top-level sections."""
+    return {"type": "OBJECT", "properties": {section: SECTION_SCHEMAS[section] for section in sections},
+            "required": list(sections)}
+
+
+def validate(value, schema, path="$"):
+    """
+    Checks a parsed JSON value against a RESPONSE_SCHEMA-style schema.
+
+    Returns:
+        list: Error messages; empty when the value is valid. Unknown keys are allowed.
+    """
+    if value is None:
+        return [] if schema.get("nullable") else [f"{path}: null not allowed"]
+    kind = schema["type"]
+    if kind == "OBJECT":
+        if not isinstance(value, dict):
+            return [f"{path}: expected object"]
+        errors = [f"{path}.{key}: missing" for key in schema.get("required", []) if key not in value]
+        for key, child in schema.get("properties", {}).items():
+            if key in value:
+                errors += validate(value[key], child, f"{path}.{key}")
+        return errors
+    if kind == "ARRAY":
+        if not isinstance(value, list):
+            return [f"{path}: expected array"]
+        errors = []
+        for i, item in enumerate(value):
+            errors += validate(item, schema["items"], f"{path}[{i}]")
+        return errors
+    if kind == "STRING":
+        return [] if isinstance(value, str) else [f"{path}: expected string"]
+    if kind == "INTEGER":
+        return [] if isinstance(value, int) and not isinstance(value, bool) else [f"{path}: expected integer"]
+    if kind == "NUMBER":
+        return [] if isinstance(value, (int, float)) and not isinstance(value, bool) else [f"{path}: expected number"]
+    return [f"{path}: unknown schema type {kind}"]
+
+
+def invalid_sections(data, sections=SECTIONS):
+    """Returns {section: errors} for the sections of `data` that are missing or fail validation."""
+    invalid = {}
+    for section in sections:
+        if section not in data:
+            invalid[section] = [f"$.{section}: missing"]
+            continue
+        errors = validate(data[section], SECTION_SCHEMAS[section], f"$.{section}")
+        if errors:
+            invalid[section] = errors
+    return invalid
+
+
+def salvage_sections(text):
+    """
+    Parses the complete top-level members of a JSON object, even when the object is cut off.
+
+    Returns:
+        dict: Every `"key": value` pair that parsed before the first broken or truncated one.
+    """
+    decoder = json.JSONDecoder()
+    text = text or ""
+    start = text.find("{")
+    if start < 0:
+        return {}
+    data = {}
+    pos = start + 1
+    while True:
+        pos = _SEPARATOR.match(text, pos).end()
+        if pos >= len(text) or text[pos] == "}":
+            return data
+        try:
+            key, pos = decoder.raw_decode(text, pos)
+            colon = _COLON.match(text, pos)
+            if not isinstance(key, str) or colon is None:
+                return data
+            value, pos = decoder.raw_decode(text, colon.end())
+        except json.JSONDecodeError:
+            return data
+        data[key] = value
+
+
+def section_instructions(prompt, sections):
+    """
+    Cuts the numbered instruction blocks of `sections` out of the extraction prompt.
+
+    Returns the full prompt if it does not have one numbered block per section.
+    """
+    blocks = re.split(r"\n+(?=\s*\d\.\s+\*\*)", prompt.split("OUTPUT REQUIREMENTS")[0])[1:]
+    if len(blocks) != len(SECTIONS):
+        return prompt
+    return "\n".join(blocks[SECTIONS.index(section)].rstrip() for section in sorted(sections, key=SECTIONS.index))
+
+
+def repair_prompt(prompt, sections):
+    return ("You are an expert in financial analysis and annual reports. Extract ONLY the following sections "
+            f"from the provided pages of an annual report: {', '.join(sections)}. "
+            "If information is not found, set the value to null. DO NOT MAKE UP INFORMATION.\n\n"
+            + section_instructions(prompt, sections))
+
+
+def section_pages(doc, sections):
+    """Page numbers whose titles match the keywords of `sections`, plus the page after each (continuations)."""
+    matcher = KeywordMatcher({section: SECTION_KEYWORDS[section] for section in sections})
+    pages = set()
+    for page_num, page in enumerate(doc):
+        if matcher.match(title_from_text(clipped_text(page), NUM_TITLE_LINES)):
+            pages.update((page_num, page_num + 1))
+    return sorted(page for page in pages if page < len(doc))
+
+
+def repair_pdf_bytes(pdf_bytes, sections):
+    """The pages relevant to `sections` as a new PDF, or the whole PDF if no page matches."""
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        pages = section_pages(doc, sections)
+        if not pages or len(pages) == len(doc):
+            return pdf_bytes, len(doc)
+        doc.select(pages)
+        return doc.tobytes(garbage=3, deflate=True, no_new_id=True), len(pages)
+
+
+def _generate(client, model, temperature, pdf_bytes, prompt, schema, sessions=None, label="PDF"):
+    from google.genai import types
+
+    config = types.GenerateContentConfig(
+        temperature=temperature,
+        response_mime_type="application/json",
+        response_schema=schema,
+    )
+    if sessions is not None:
+        return sessions.generate_content(client, model, config, pdf_bytes, prompt, label)
+    return client.models.generate_content(
+        model=model,
+        config=config,
+        contents=[types.Part.from_bytes(data=pdf_bytes, mime_type='application/pdf'), prompt],
+    )
+
+
+def _add_usage(total, usage_metadata):
+    for key, value in usage_to_dict(usage_metadata).items():
+        if isinstance(value, int):
+            total[key] = total.get(key, 0) + value
+
+
+def analyze_pdf_structured(pdf_bytes, prompt=EXTRACTION_PROMPT, client=None, temperature=0.5, model=MODEL_NAME,
+                           cache=None, refresh=False, label="PDF", stats=None, sessions=None,
+                           max_repair_rounds=MAX_REPAIR_ROUNDS):
+    """
+    Schema-constrained version of `report_extraction.analyze_pdf_bytes`.
+
+    Sections that are still invalid after `max_repair_rounds` repair calls are set to null
+    and listed in `stats["invalid_sections"]`. Errors are printed and give {}.
+
+    Args:
+        See `analyze_pdf_bytes`. `stats` additionally gets the number of repair calls
+        ("repairs"), full retries ("full_retries") and the repaired section names, and
+        usage_metadata is summed over all calls.
+    """
+    if stats is None:
+        stats = {}
+    stats.update(cache="off" if cache is None else "miss", gemini_seconds=0.0, parse_seconds=0.0, repairs=0,
+                 full_retries=0, repaired_sections=[], invalid_sections=[])
+    try:
+        schema = response_schema()
+        key = cache_key(pdf_bytes, prompt + json.dumps(schema, sort_keys=True), model, temperature)
+        if cache is not None and not refresh:
+            cached = cache.get(key)
+            if cached is not None:
+                print(f"Cache hit: {label}")
+                stats.update(cache="hit", usage_metadata=cached["usage_metadata"])
+                return cached["json_data"]
+
+        if client is None:
+            client = get_client()
+        counters["structured_calls"] += 1
+        usage = {}
+        response_bytes = 0
+
+        data = {}
+        for attempt in range(1 + MAX_FULL_RETRIES):
+            if attempt:
+                print(f"No usable sections in the Gemini response for {label}, retrying the full request")
+                counters["full_retries"] += 1
+                stats["full_retries"] += 1
+            start = time.perf_counter()
+            response = _generate(client, model, temperature, pdf_bytes, prompt, schema, sessions, label)
+            stats["gemini_seconds"] += time.perf_counter() - start
+            _add_usage(usage, response.usage_metadata)
+            response_bytes += len((response.text or "").encode("utf-8"))
+
+            start = time.perf_counter()
+            data = salvage_sections(response.text)
+            stats["parse_seconds"] += time.perf_counter() - start
+            if set(data) & set(SECTIONS):
+                break
+
+        invalid = invalid_sections(data)
+        for _ in range(max_repair_rounds):
+            if not invalid:
+                break
+            sections = list(invalid)
+            counters["repairs"] += 1
+            stats["repairs"] += 1
+            repair_bytes, pages = repair_pdf_bytes(pdf_bytes, sections)
+            print(f"Repairing {label}: {', '.join(sections)} from {pages} pages")
+
+            start = time.perf_counter()
+            response = _generate(client, model, temperature, repair_bytes, repair_prompt(prompt, sections),
+                                 response_schema(sections), sessions, label)
+            stats["gemini_seconds"] += time.perf_counter() - start
+            _add_usage(usage, response.usage_metadata)
+            response_bytes += len((response.text or "").encode("utf-8"))
+
+            start = time.perf_counter()
+            repaired = salvage_sections(response.text)
+            stats["parse_seconds"] += time.perf_counter() - start
+            still_invalid = invalid_sections(repaired, sections)
+            for section in sections:
+                if section not in still_invalid:
+                    data[section] = repaired[section]
+                    stats["repaired_sections"].append(section)
+                    counters["repaired_sections"] += 1
+            invalid = {section: invalid[section] for section in still_invalid}
+
+        for section, errors in invalid.items():
+            print(f"ERROR: {label}: {section} is still invalid ({errors[0]}), set to null")
+            data[section] = None
+            counters["unrepaired_sections"] += 1
+        stats["invalid_sections"] = list(invalid)
+        stats.update(usage_metadata=usage, response_bytes=response_bytes)
+        print(usage)
+
+        if cache is not None and not invalid:
+            cache.put(key, json.dumps(data, ensure_ascii=False), data, usage)
+        return data
+
+    except Exception as e:
+        print(f"ERROR: Gemini processing failed: {e}")
+        return {}
@@ -0,0 +1,201 @@
+"""
+Synthetic annual report generator for benchmarks.
+
+Builds a PDF laid out like the Bursa annual reports the abridgers are tuned for: a running
+header above the 45pt crop line, section titles as the first lines below it, director
+profiles, segment and subsidiary tables in the notes, a top-30 shareholder list and an
+optional outline (bookmarks).
+
+Usage:
+    python synthetic_report.py out.pdf [--pages 300] [--seed 0] [--no-outline] [--images]
+"""
+import argparse
+import random
+
+import fitz  # pymupdf is imported as fitz
+
+PAGE_WIDTH, PAGE_HEIGHT = fitz.paper_size("a4")
+MARGIN = 50
+COMPANY = "SYNTHETIC HOLDINGS BERHAD"
+ISSUED_SHARES = 2_000_000_000  # The top-30 percentages are of this share count
+
+# (outline title, title printed on the page, share of the report, page body)
+SECTIONS = [
+    ("Corporate Information", "CORPORATE INFORMATION", 0.01, "text"),
+    ("Corporate Structure", "CORPORATE STRUCTURE", 0.01, "text"),
+    ("Chairman's Statement", "CHAIRMAN'S STATEMENT", 0.02, "text"),
+    ("Management Discussion and Analysis", "MANAGEMENT DISCUSSION AND ANALYSIS", 0.05, "text"),
+    ("Directors' Profile", "DIRECTORS' PROFILE", 0.03, "directors"),
+    ("Key Senior Management", "KEY SENIOR MANAGEMENT", 0.01, "directors"),
+    ("Sustainability Statement", "SUSTAINABILITY STATEMENT", 0.10, "text"),
+    ("Corporate Governance Overview Statement", "CORPORATE GOVERNANCE OVERVIEW STATEMENT", 0.07, "text"),
+    ("Audit Committee Report", "AUDIT COMMITTEE REPORT", 0.02, "text"),
+    ("Statement on Risk Management and Internal Control", "STATEMENT ON RISK MANAGEMENT AND INTERNAL CONTROL", 0.02, "text"),
+    ("Financial Statements", "STATEMENTS OF FINANCIAL POSITION", 0.05, "text"),
+    ("Notes to the Financial Statements", "NOTES TO THE FINANCIAL STATEMENTS", 0.55, "notes"),
+    ("Analysis of Shareholdings", "ANALYSIS OF SHAREHOLDINGS", 0.02, "shareholders"),
+    ("List of Properties", "LIST OF PROPERTIES", 0.01, "text"),
+    ("Notice of Annual General Meeting", "NOTICE OF ANNUAL GENERAL MEETING", 0.01, "text"),
+]
+
+# Notes sub-sections: (heading, page body). Segment and subsidiary notes carry tables.
+NOTES = [
+    ("Material Accounting Policies", "text"),
+    ("Property, Plant and Equipment", "text"),
+    ("Investment in Subsidiaries", "subsidiaries"),
+    ("Investment in Associates", "subsidiaries"),
+    ("Deferred Tax", "text"),
+    ("Revenue", "text"),
+    ("Directors' Remuneration", "remuneration"),
+    ("Segment Information", "segments"),
+    ("Financial Instruments", "text"),
+]
+
+WORDS = ("the group company financial year revenue profit performance board directors review "
+         "operations market growth strategy risk customers employees ringgit million period").split()
+
+
+def _sentence(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+FONT = fitz.Font("helv")
+
+
+def _text(writer, x, y, text, fontsize):
+    writer.append((x, y), text, font=FONT, fontsize=fontsize)
+
+
+def _table(writer, shape, y, header, rows, widths):
+    """Draw a ruled table and return the y position below it."""
+    x_positions = [MARGIN]
+    for width in widths[:-1]:
+        x_positions.append(x_positions[-1] + width)
+    right = MARGIN + sum(widths)
+    row_height = 16
+    for row_index, row in enumerate([header] + rows):
+        shape.draw_line((MARGIN, y), (right, y))
+        for x, cell in zip(x_positions, row):
+            _text(writer, x + 3, y + 12, str(cell), 8)
+        y += row_height
+        if y > PAGE_HEIGHT - MARGIN:
+            break
+    shape.draw_line((MARGIN, y), (right, y))
+    for x in x_positions + [right]:
+        shape.draw_line((x, y - row_height * (row_index + 1)), (x, y))
+    return y + 10
+
+
+def _body(writer, shape, kind, y, rng):
+    if kind == "directors":
+        for _ in range(3):
+            name = f"Dato' {rng.choice(['Ahmad', 'Lim', 'Tan', 'Siti', 'Raj'])} {rng.choice(['Hassan', 'Wei', 'Kumar', 'Aziz'])}"
+            _text(writer, MARGIN, y, f"{name}, Executive Director", 10)
+            _text(writer, MARGIN, y + 14, f"Age {rng.randint(40, 70)}, Malaysian", 9)
+            y += 40
+    elif kind == "segments":
+        segments = ["Manufacturing", "Trading", "Property", "Services"]
+        revenues = [rng.randint(1000, 900000) for _ in segments]
+        profits = [rng.randint(100, 90000) for _ in segments]
+        rows = [[s, f"{revenue:,}", f"{profit:,}"] for s, revenue, profit in zip(segments, revenues, profits)]
+        rows.append(["Total", f"{sum(revenues):,}", f"{sum(profits):,}"])
+        y = _table(writer, shape, y, ["Business segment", "Revenue RM'000", "Profit RM'000"], rows, [180, 120, 120])
+        regions = ["Malaysia", "Singapore", "China", "Others"]
+        revenues = [rng.randint(1000, 900000) for _ in regions]
+        rows = [[r, f"{revenue:,}"] for r, revenue in zip(regions, revenues)] + [["Total", f"{sum(revenues):,}"]]
+        y = _table(writer, shape, y, ["Geographical information", "Revenue RM'000"], rows, [180, 120])
+    elif kind == "subsidiaries":
+        rows = [[f"Synthetic {rng.choice(WORDS).title()} Sdn. Bhd.", "Malaysia", rng.choice(["Investment holding", "Manufacturing", "Trading"]),
+                 f"{rng.choice([100, 100, 70, 51, 30, 20])}"] for _ in range(12)]
+        y = _table(writer, shape, y, ["Name of company", "Country", "Principal activities", "Effective interest %"], rows,
+                   [170, 70, 140, 100])
+    elif kind == "remuneration":
+        rows = [[f"Director {i + 1}", f"{rng.randint(100, 2000):,}", f"{rng.randint(0, 500):,}", f"{rng.randint(10, 100):,}"]
+                for i in range(6)]
+        y = _table(writer, shape, y, ["Name", "Salary RM'000", "Bonus RM'000", "Fees RM'000"], rows, [150, 100, 100, 100])
+    elif kind == "shareholders":
+        _text(writer, MARGIN, y, f"Total number of issued shares: {ISSUED_SHARES:,} as at 31 March 2024", 9)
+        y += 20
+        holdings = sorted((rng.randint(100000, 50000000) for _ in range(30)), reverse=True)
+        rows = []
+        for i, shares in enumerate(holdings):
+            holder = rng.choice(["Citigroup Nominees (Tempatan) Sdn Bhd", "Maybank Nominees (Tempatan) Sdn Bhd",
+                                 "Amanah Raya Berhad", "Kenanga Nominees (Asing) Sdn Bhd"])
+            rows.append([str(i + 1), holder, f"{shares:,}", f"{shares / ISSUED_SHARES * 100:.2f}"])
+        y = _table(writer, shape, y, ["No.", "Name of shareholders", "No. of shares", "%"], rows, [30, 250, 110, 60])
+    while y < PAGE_HEIGHT - MARGIN:
+        _text(writer, MARGIN, y, _sentence(rng), 9)
+        y += 13
+
+
+def make_report(num_pages=300, seed=0, outline=True, images=False):
+    """
+    Builds a synthetic annual report.
+
+    Args:
+        num_pages (int): Page count (50-1000 is the intended range).
+        seed (int): Random seed; the same arguments always give the same document.
+        outline (bool): Add bookmarks for every section and every note.
+        images (bool): Put a full-width photo-like image on the narrative pages.
+
+    Returns:
+        fitz.Document: The report, in memory.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    toc = []
+    image = None
+    if images:
+        pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 600, 400), False)
+        pixmap.set_rect(pixmap.irect, (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)))
+        image = pixmap.tobytes("png")
+
+    counts = [max(1, round(num_pages * share)) for _, _, share, _ in SECTIONS]
+    counts[SECTIONS.index(next(s for s in SECTIONS if s[3] == "notes"))] += num_pages - sum(counts)
+
+    for (outline_title, page_title, _, kind), count in zip(SECTIONS, counts):
+        toc.append([1, outline_title, len(doc) + 1])
+        for i in range(count):
+            page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+            writer = fitz.TextWriter(page.rect)
+            shape = page.new_shape()
+            # running header, inside the 45pt band the abridgers crop off
+            _text(writer, MARGIN, 25, f"{COMPANY}  |  ANNUAL REPORT 2023", 8)
+            _text(writer, PAGE_WIDTH - MARGIN - 20, 25, str(len(doc)), 8)
+            body_kind = kind
+            y = 80
+            if kind == "notes":
+                note_title, body_kind = NOTES[(i * len(NOTES)) // count]
+                if i == 0 or NOTES[((i - 1) * len(NOTES)) // count][0] != note_title:
+                    toc.append([2, note_title, len(doc)])
+                _text(writer, MARGIN, y, page_title, 14)
+                _text(writer, MARGIN, y + 20, note_title, 11)
+                y += 45
+            elif i == 0 or kind != "text" or rng.random() < 0.5:
+                _text(writer, MARGIN, y, page_title, 16)
+                y += 30
+            # else: continuation page without a title, like most real reports
+            if image is not None and kind == "text" and rng.random() < 0.6:
+                page.insert_image(fitz.Rect(MARGIN, y, PAGE_WIDTH - MARGIN, y + 250), stream=image)
+                y += 260
+            _body(writer, shape, body_kind, y, rng)
+            shape.finish(width=0.5)
+            shape.commit()
+            writer.write_text(page)
+
+    if outline:
+        doc.set_toc(toc)
+    return doc
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic annual report PDF.")
+    parser.add_argument("output")
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-outline", action="store_true")
+    parser.add_argument("--images", action="store_true")
+    args = parser.parse_args()
+    report = make_report(args.pages, args.seed, outline=not args.no_outline, images=args.images)
+    report.save(args.output, garbage=3, deflate=True)
+    print(f"Wrote {args.output} ({len(report)} pages)")
@@ -0,0 +1,191 @@
+"""
+Structured per-document, per-stage performance and token telemetry.
+
+Every pipeline stage emits one JSON record per document to a JSONL file:
+    {"ts": ..., "document": "kgb-annual", "stage": "gemini_call", "seconds": 12.3,
+     "bytes_in": ..., "prompt_tokens": ..., "cache": "miss", ...}
+
+Usage:
+    python telemetry.py summary [telemetry.jsonl]
+"""
+import contextlib
+import json
+import sys
+import time
+
+from gemini_common import MODEL_NAME
+
+DEFAULT_TELEMETRY_PATH = "telemetry.jsonl"
+
+# USD per million tokens (input, output)
+PRICE_PER_MILLION_TOKENS = {
+    "gemini-2.0-flash": (0.10, 0.40),
+}
+
+
+class TelemetrySink:
+    """Appends telemetry records to a JSONL file."""
+
+    def __init__(self, path=DEFAULT_TELEMETRY_PATH):
+        self.path = path
+
+    def emit(self, document, stage, seconds, **fields):
+        record = {"ts": round(time.time(), 3), "document": document, "stage": stage, "seconds": round(seconds, 6)}
+        record.update({key: value for key, value in fields.items() if value is not None})
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    @contextlib.contextmanager
+    def stage(self, document, stage, **fields):
+        """
+        Times a block and emits one record for it. The yielded dict can be filled with more fields:
+
+            with sink.stage(name, "pdf_save", pages_in=n) as record:
+                pdf_bytes = doc.tobytes()
+                record["bytes_out"] = len(pdf_bytes)
+        """
+        record = dict(fields)
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.emit(document, stage, time.perf_counter() - start, **record)
+
+
+class NullSink(TelemetrySink):
+    """Sink that discards every record, for runs without telemetry."""
+
+    def __init__(self):
+        super().__init__(path=None)
+
+    def emit(self, document, stage, seconds, **fields):
+        pass
+
+
+def token_fields(usage_metadata):
+    """prompt/candidate/total token counts from a usage_metadata dict."""
+    usage = usage_metadata or {}
+    return {
+        "prompt_tokens": usage.get("prompt_token_count"),
+        "candidates_tokens": usage.get("candidates_token_count"),
+        "total_tokens": usage.get("total_token_count"),
+    }
+
+
+def read_records(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * q // 100))  # ceil
+    return ordered[int(rank) - 1]
+
+
+def summarize(records, model=MODEL_NAME):
+    """
+    Aggregates telemetry records.
+
+    Returns:
+        dict: per-stage count/p50/p95 seconds, tokens per page kept, cost per report
+              (cache hits cost nothing), per-section averages of sharded runs, repair counts,
+              the per-document peak RSS, the share of tabular sections resolved without the model and
+              the pages and tokens incremental runs did not send and the reports per packed request.
+    """
+    stages = {}
+    for record in records:
+        stages.setdefault(record["stage"], []).append(record["seconds"])
+    summary = {"stages": {stage: {"count": len(seconds), "p50": percentile(seconds, 50), "p95": percentile(seconds, 95)}
+                          for stage, seconds in stages.items()}}
+
+    # one gemini_call record per report run; pages_in is the page count after abridging
+    price_in, price_out = PRICE_PER_MILLION_TOKENS.get(model, (0.0, 0.0))
+    calls = [record for record in records if record["stage"] == "gemini_call"]
+    pages_kept = sum(record.get("pages_in", 0) for record in calls)
+    tokens = sum(record.get("total_tokens", 0) for record in calls)
+    cost = sum((record.get("prompt_tokens", 0) * price_in + record.get("candidates_tokens", 0) * price_out) / 1e6
+               for record in calls if record.get("cache") != "hit")
+
+    summary["documents"] = len({record["document"] for record in records})
+    summary["reports"] = len(calls)
+    summary["tokens_per_page_kept"] = tokens / pages_kept if pages_kept else None
+    summary["cost_per_report_usd"] = cost / len(calls) if calls else None
+    # sharded extraction only: one gemini_section record per sub-request
+    sections = {}
+    for record in records:
+        if record["stage"] == "gemini_section":
+            sections.setdefault(record["section"], []).append(record)
+    summary["sections"] = {section: {"count": len(rows),
+                                     "p50": percentile([row["seconds"] for row in rows], 50),
+                                     "pages_in": sum(row.get("pages_in", 0) for row in rows) / len(rows),
+                                     "total_tokens": sum(row.get("total_tokens", 0) for row in rows) / len(rows)}
+                           for section, rows in sections.items()}
+    peaks = [record["peak_rss_mb"] for record in records if record["stage"] == "memory"]
+    summary["peak_rss_mb"] = {"p50": percentile(peaks, 50), "max": max(peaks)} if peaks else None
+    local = [record for record in records if record["stage"] == "local_tables"]
+    tabular = sum(record.get("sections_tabular", 0) for record in local)
+    summary["local_tables"] = ({"resolved": sum(record.get("sections_local", 0) for record in local),
+                                "tabular": tabular} if tabular else None)
+    incremental = [record for record in records if record["stage"] == "incremental"]
+    summary["incremental"] = ({"reports": len(incremental),
+                               "reused": sum(1 for record in incremental if record.get("reused")),
+                               "pages_saved": sum(record.get("pages_saved", 0) for record in incremental),
+                               "tokens_saved": sum(record.get("tokens_saved", 0) for record in incremental)}
+                              if incremental else None)
+    # packed extraction only: one gemini_pack record per request of several reports
+    packs = [record for record in records if record["stage"] == "gemini_pack"]
+    summary["packs"] = ({"requests": len(packs), "reports": sum(record.get("reports", 0) for record in packs),
+                         "fallbacks": sum(record.get("fallbacks", 0) for record in packs),
+                         "prompt_tokens_saved": sum(record.get("prompt_tokens_saved", 0) for record in packs)}
+                        if packs else None)
+    # structured extraction only: targeted section repairs vs. full re-calls
+    summary["repairs"] = sum(record.get("repairs", 0) for record in calls)
+    summary["full_retries"] = sum(record.get("full_retries", 0) for record in calls)
+    return summary
+
+
+def print_summary(summary):
+    print(f"Documents: {summary['documents']}, report runs: {summary['reports']}")
+    print(f"{'stage':<20}{'count':>8}{'p50 s':>12}{'p95 s':>12}")
+    for stage, stats in summary["stages"].items():
+        print(f"{stage:<20}{stats['count']:>8}{stats['p50']:>12.3f}{stats['p95']:>12.3f}")
+    if summary["tokens_per_page_kept"] is not None:
+        print(f"Tokens per page kept: {summary['tokens_per_page_kept']:.0f}")
+    if summary["cost_per_report_usd"] is not None:
+        print(f"Cost per report: ${summary['cost_per_report_usd']:.4f}")
+    if summary["sections"]:
+        print(f"{'section':<20}{'count':>8}{'p50 s':>12}{'pages':>8}{'tokens':>10}")
+        for section, stats in summary["sections"].items():
+            print(f"{section:<20}{stats['count']:>8}{stats['p50']:>12.3f}{stats['pages_in']:>8.1f}"
+                  f"{stats['total_tokens']:>10.0f}")
+    if summary["peak_rss_mb"]:
+        peaks = summary["peak_rss_mb"]
+        print(f"Peak RSS per document: p50 {peaks['p50']:.0f} MB, max {peaks['max']:.0f} MB")
+    if summary["local_tables"]:
+        resolved, tabular = summary["local_tables"]["resolved"], summary["local_tables"]["tabular"]
+        print(f"Tabular sections resolved locally: {resolved}/{tabular} ({resolved / tabular:.0%})")
+    if summary["incremental"]:
+        incremental = summary["incremental"]
+        print(f"Incremental: {incremental['reused']}/{incremental['reports']} reports reused sections, "
+              f"{incremental['pages_saved']} pages and ~{incremental['tokens_saved']} tokens not sent")
+    if summary["packs"]:
+        packs = summary["packs"]
+        print(f"Packed: {packs['reports']} reports in {packs['requests']} requests "
+              f"({packs['reports'] / packs['requests']:.1f} per request), {packs['fallbacks']} extracted again alone, "
+              f"~{packs['prompt_tokens_saved']} prompt tokens not re-sent")
+    if summary["repairs"] or summary["full_retries"]:
+        print(f"Section repairs: {summary['repairs']}, full retries: {summary['full_retries']}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "summary":
+        print(__doc__)
+        sys.exit(1)
+    print_summary(summarize(read_records(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_TELEMETRY_PATH)))
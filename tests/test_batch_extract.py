@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+import json
+import time
+
+import pytest
+
+import batch_extract
+from batch_extract import RateLimiter, generate_with_backoff
+from fake_genai import FakeAPIError, FakeClient
+
+
+class ScriptedClient(FakeClient):
+    """FakeClient whose calls fail with the given codes, in order, before succeeding."""
+
+    def __init__(self, codes, **kwargs):
+        super().__init__(latency=0.0, **kwargs)
+        self.codes = list(codes)
+
+    def _next_outcome(self):
+        self.calls += 1
+        if self.codes:
+            self.errors += 1
+            return 0.0, FakeAPIError(self.codes.pop(0), "scripted error")
+        return 0.0, None
+
+
+def acquire_times(limiter, count, estimated_tokens=None):
+    async def run():
+        start = time.monotonic()
+        times = []
+        for _ in range(count):
+            await limiter.acquire(estimated_tokens)
+            times.append(time.monotonic() - start)
+        return times
+    return asyncio.run(run())
+
+
+def test_rate_limiter_paces_requests_per_window():
+    times = acquire_times(RateLimiter(requests_per_minute=2, window=0.3), 3)
+    assert times[1] < 0.1
+    assert times[2] >= 0.25
+
+
+def test_rate_limiter_paces_tokens_per_window():
+    times = acquire_times(RateLimiter(tokens_per_minute=100, window=0.3), 2, estimated_tokens=60)
+    assert times[1] >= 0.25
+
+
+def test_rate_limiter_admits_one_oversized_request():
+    times = acquire_times(RateLimiter(tokens_per_minute=100, window=0.3), 1, estimated_tokens=500)
+    assert times[0] < 0.1
+
+
+def test_rate_limiter_learns_token_estimate():
+    limiter = RateLimiter()
+    limiter.record(asyncio.run(limiter.acquire()), 1000)
+    limiter.record(asyncio.run(limiter.acquire()), 3000)
+    assert limiter.estimate_tokens() == 2000
+
+
+@pytest.mark.parametrize("codes", [(429,), (503,), (429, 503)])
+def test_backoff_retries_transient_errors(codes):
+    client = ScriptedClient(codes, response_text='{"ok": true}')
+    response, attempts = asyncio.run(generate_with_backoff(client, ["prompt"], None, RateLimiter(),
+                                                           base_delay=0.001))
+    assert response.text == '{"ok": true}'
+    assert attempts == len(codes) + 1
+    assert client.calls == len(codes) + 1
+
+
+@pytest.mark.parametrize("code", [400, 403, 404])
+def test_backoff_does_not_retry_permanent_errors(code):
+    client = ScriptedClient([code])
+    with pytest.raises(FakeAPIError) as raised:
+        asyncio.run(generate_with_backoff(client, ["prompt"], None, RateLimiter(), base_delay=0.001))
+    assert raised.value.code == code
+    assert client.calls == 1
+
+
+def test_backoff_gives_up_after_max_retries():
+    client = ScriptedClient([503] * 5)
+    with pytest.raises(FakeAPIError):
+        asyncio.run(generate_with_backoff(client, ["prompt"], None, RateLimiter(), max_retries=2,
+                                          base_delay=0.001))
+    assert client.calls == 3
+
+
+def test_sources_sharing_a_basename_get_distinct_outputs(tmp_path, monkeypatch):
+    sources = []
+    for folder, body in (("2022", b"short"), ("2023", b"a longer body")):
+        (tmp_path / folder).mkdir()
+        path = tmp_path / folder / "annual-report.pdf"
+        path.write_bytes(b"%PDF-1.4\n" + body + b"\n%%EOF\n")
+        sources.append(str(path))
+    prompt_file = tmp_path / "prompt.txt"
+    prompt_file.write_text("extract")
+    monkeypatch.setattr(batch_extract, "get_client",
+                        lambda: FakeClient(latency=0.0, response_text=lambda model, contents, config: json.dumps(
+                            {"size": len(contents[0].inline_data.data)})))
+    args = argparse.Namespace(sources=sources, prompt_file=str(prompt_file), output_dir=str(tmp_path),
+                              concurrency=2, rpm=None, tpm=None, temperature=0.3, no_cache=True)
+    assert asyncio.run(batch_extract.main(args)) == 0
+    outputs = {path.name: json.loads(path.read_text()) for path in tmp_path.glob("*_extracted.json")}
+    assert len(outputs) == 2
+    assert "annual-report_extracted.json" in outputs
+    assert len({data["size"] for data in outputs.values()}) == 2  # one output per document
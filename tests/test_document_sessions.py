@@ -0,0 +1,94 @@
+import datetime
+
+import pytest
+
+from document_sessions import DocumentSessions, FileStore, GeminiFileStore
+from fake_genai import FakeAPIError, FakeClient
+
+PDF = b"%PDF-1.4\nfake report\n%%EOF\n"
+
+
+class RejectingClient(FakeClient):
+    """FakeClient whose next generate_content calls fail with the given codes."""
+
+    def __init__(self, codes, **kwargs):
+        super().__init__(latency=0.0, **kwargs)
+        self.codes = list(codes)
+
+    def _next_outcome(self):
+        self.calls += 1
+        if self.codes:
+            return 0.0, FakeAPIError(self.codes.pop(0), "rejected")
+        return 0.0, None
+
+
+def sessions_for(client, tmp_path, **kwargs):
+    return DocumentSessions(GeminiFileStore(client), str(tmp_path / "files.json"), **kwargs)
+
+
+def test_uploads_once_and_reuses(tmp_path):
+    client = FakeClient(latency=0.0)
+    sessions = sessions_for(client, tmp_path)
+    first = sessions.handle(PDF)
+    assert sessions.handle(PDF) == first
+    assert client.files.uploads == 1
+    assert sessions.counters == {"uploads": 1, "reuses": 1}
+
+
+def test_registry_shared_between_runs(tmp_path):
+    client = FakeClient(latency=0.0)
+    handle = sessions_for(client, tmp_path).handle(PDF)
+    later = sessions_for(client, tmp_path)
+    assert later.handle(PDF)["name"] == handle["name"]
+    assert client.files.uploads == 1
+
+
+def test_expiring_upload_is_replaced(tmp_path):
+    client = FakeClient(latency=0.0, file_ttl=60)
+    sessions = sessions_for(client, tmp_path, expiry_margin=120)
+    first = sessions.handle(PDF)
+    second = sessions.handle(PDF)
+    assert second["name"] != first["name"]
+    assert sessions.counters["reuploads"] == 1
+    assert client.files.get(second["name"])
+    with pytest.raises(FakeAPIError):
+        client.files.get(first["name"])  # the old copy was deleted
+
+
+def test_generate_content_reuploads_a_deleted_file(tmp_path):
+    client = FakeClient(latency=0.0, response_text='{"ok": true}')
+    sessions = sessions_for(client, tmp_path)
+    client.files.delete(sessions.handle(PDF)["name"])  # gone remotely, still in the registry
+    response = sessions.generate_content(client, "model", None, PDF, "prompt")
+    assert response.text == '{"ok": true}'
+    assert client.files.uploads == 2
+
+
+def test_generate_content_does_not_reupload_on_bad_request(tmp_path):
+    client = RejectingClient([400])
+    sessions = sessions_for(client, tmp_path)
+    with pytest.raises(FakeAPIError):
+        sessions.generate_content(client, "model", None, PDF, "prompt")
+    assert client.calls == 1
+    assert client.files.uploads == 1
+
+
+def test_cleanup_deletes_every_upload(tmp_path):
+    client = FakeClient(latency=0.0)
+    sessions = sessions_for(client, tmp_path)
+    handles = [sessions.handle(PDF), sessions.handle(PDF + b"other")]
+    assert sessions.cleanup() == 2
+    assert not (tmp_path / "files.json").exists()
+    for handle in handles:
+        assert GeminiFileStore(client).get(handle["name"]) is None
+
+
+def test_file_store_is_abstract():
+    with pytest.raises(TypeError):
+        FileStore()
+
+
+def test_expiry_read_from_upload(tmp_path):
+    handle = sessions_for(FakeClient(latency=0.0, file_ttl=3600), tmp_path).handle(PDF)
+    expires_at = datetime.datetime.fromisoformat(handle["expires_at"])
+    assert 3500 < (expires_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds() <= 3600
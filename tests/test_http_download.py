@@ -0,0 +1,114 @@
+import http.server
+import json
+import os
+import threading
+
+import httpx
+import pytest
+
+import http_download
+from http_download import download_pdf
+
+PDF = b"%PDF-1.4\n" + b"0" * 5000 + b"\n%%EOF\n"
+ETAG = '"v1"'
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """Serves /report.pdf with an ETag, /truncated.pdf short of its Content-Length and /page.html."""
+
+    requests = []
+
+    def do_GET(self):
+        Handler.requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.path == "/report.pdf" and self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+        elif self.path == "/report.pdf":
+            self.send_body(PDF, {"ETag": ETAG})
+        elif self.path == "/truncated.pdf":
+            self.send_body(PDF[:1000], {"Content-Length": str(len(PDF))})
+            self.close_connection = True
+        elif self.path == "/no-eof.pdf":
+            self.send_body(PDF[:1000])
+        elif self.path == "/page.html":
+            self.send_body(b"<html>Not found</html>", {"Content-Type": "text/html"})
+        else:
+            self.send_error(404)
+
+    def send_body(self, body, headers=None):
+        headers = dict(headers or {})
+        self.send_response(200)
+        headers.setdefault("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def client():
+    with httpx.Client() as client:
+        yield client
+
+
+def test_download_streams_to_disk(server, client, tmp_path):
+    path, downloaded = download_pdf(server + "/report.pdf", str(tmp_path), client)
+    assert downloaded
+    with open(path, "rb") as f:
+        assert f.read() == PDF
+    with open(path + ".meta.json", "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    assert meta["etag"] == ETAG and meta["size"] == len(PDF)
+
+
+def test_not_modified_reuses_local_copy(server, client, tmp_path):
+    first, _ = download_pdf(server + "/report.pdf", str(tmp_path), client)
+    Handler.requests.clear()
+    path, downloaded = download_pdf(server + "/report.pdf", str(tmp_path), client)
+    assert not downloaded
+    assert path == first
+    assert Handler.requests == [("/report.pdf", ETAG)]
+    with open(path, "rb") as f:
+        assert f.read() == PDF
+
+
+def test_missing_meta_downloads_again(server, client, tmp_path):
+    path, _ = download_pdf(server + "/report.pdf", str(tmp_path), client)
+    os.remove(path + ".meta.json")
+    Handler.requests.clear()
+    _, downloaded = download_pdf(server + "/report.pdf", str(tmp_path), client)
+    assert downloaded
+    assert Handler.requests == [("/report.pdf", None)]
+
+
+@pytest.mark.parametrize("name", ["truncated.pdf", "no-eof.pdf", "page.html"])
+def test_incomplete_or_non_pdf_body_rejected(server, client, tmp_path, name):
+    with pytest.raises((ValueError, httpx.HTTPError)):
+        download_pdf(f"{server}/{name}", str(tmp_path), client)
+    assert os.listdir(tmp_path) == []
+
+
+def test_http_error_raised(server, client, tmp_path):
+    with pytest.raises(httpx.HTTPStatusError):
+        download_pdf(server + "/missing.pdf", str(tmp_path), client)
+
+
+def test_open_failure_is_not_masked(server, client, tmp_path, monkeypatch):
+    def refuse(path, mode="r", *args, **kwargs):
+        raise PermissionError(f"cannot open {path}")
+    monkeypatch.setattr(http_download, "open", refuse, raising=False)
+    with pytest.raises(PermissionError):
+        download_pdf(server + "/report.pdf", str(tmp_path), client)
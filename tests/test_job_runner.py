@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from job_runner import Ledger, run_job
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = Ledger(str(tmp_path / "jobs.db"))
+    yield ledger
+    ledger.close()
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_same_base_name_gets_distinct_output_names(ledger):
+    sources = ["https://a.example/annual-report.pdf", "https://b.example/annual-report.pdf", "local/annual-report.pdf"]
+    assert ledger.add(sources) == 3
+    assert ledger.add(sources[:1]) == 0
+    names = [row[0] for row in ledger.conn.execute("SELECT name FROM jobs ORDER BY rowid")]
+    assert names[0] == "annual-report"
+    assert len(set(names)) == 3
+
+
+def test_advance_requires_the_lease(ledger):
+    ledger.add(["report.pdf"])
+    job = ledger.claim("host:1", lease_seconds=-1)  # lease already ran out
+    other = ledger.claim("host:2")
+    assert other["source"] == job["source"]
+    assert not ledger.advance(job, "downloaded", "report.pdf")
+    assert ledger.advance(other, "downloaded", "report.pdf")
+    ledger.fail(job, "late failure")  # ignored, the job belongs to host:2
+    assert ledger.conn.execute("SELECT status, worker, attempts FROM jobs").fetchone() == ("running", "host:2", 0)
+
+
+def test_lost_lease_stops_the_job(ledger):
+    class Stages:
+        def downloaded(self, job):
+            ledger.conn.execute("UPDATE jobs SET worker = 'host:2'")  # claimed by another worker meanwhile
+            return "report.pdf"
+
+    ledger.add(["report.pdf"])
+    assert not run_job(ledger, Stages(), ledger.claim("host:1"))
+    assert ledger.conn.execute("SELECT stage FROM jobs").fetchone() == (None,)
+
+
+def test_reclaim_only_jobs_of_dead_workers(ledger):
+    workers = {"crashed.pdf": f"host:{dead_pid()}", "alive.pdf": f"host:{os.getpid()}",
+               "elsewhere.pdf": f"other:{dead_pid()}"}
+    ledger.add(list(workers))
+    for _ in workers:
+        ledger.claim("placeholder")
+    for source, worker in workers.items():
+        ledger.conn.execute("UPDATE jobs SET worker = ? WHERE source = ?", (worker, source))
+    assert ledger.reclaim("host") == 1
+    rows = dict(ledger.conn.execute("SELECT source, status FROM jobs").fetchall())
+    assert rows == {"crashed.pdf": "failed", "alive.pdf": "running", "elsewhere.pdf": "running"}
+    assert ledger.claim("host:3")["source"] == "crashed.pdf"
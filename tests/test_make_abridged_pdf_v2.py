@@ -0,0 +1,62 @@
+import fitz
+import pytest
+
+import make_abridged_pdf_v2
+import synthetic_report
+from make_abridged_pdf_v2 import MIN_ABRIDGED_PAGES, abridge_document, extract_titles_from_pdf
+from page_cache import PageTextCache, clipped_text
+from page_scoring import estimate_tokens
+
+
+@pytest.fixture(scope="module")
+def report_bytes():
+    with synthetic_report.make_report(num_pages=200, outline=False) as doc:
+        return doc.tobytes()
+
+
+@pytest.fixture
+def report(report_bytes):
+    with fitz.open(stream=report_bytes, filetype="pdf") as doc:
+        yield doc  # abridged in place by the tests
+
+
+def test_token_budget_below_min_pages_is_kept(report):
+    max_tokens = 5000
+    page_numbers, selection, fallback = abridge_document(report, max_tokens=max_tokens)
+    assert selection == "scored"
+    assert not fallback
+    assert 0 < len(page_numbers) < MIN_ABRIDGED_PAGES
+    assert len(report) == len(page_numbers)
+    assert sum(estimate_tokens(clipped_text(page)) for page in report) <= max_tokens
+
+
+def test_page_budget_below_min_pages_is_kept(report):
+    page_numbers, _, fallback = abridge_document(report, max_pages=2)
+    assert not fallback
+    assert len(page_numbers) == 2
+
+
+def test_keyword_selection_keeps_min_pages_fallback(report):
+    page_numbers, selection, fallback = abridge_document(report, min_pages=len(report))
+    assert fallback
+    assert page_numbers == list(range(200))
+    assert len(report) == 200
+
+
+def test_failed_title_scan_closes_its_document(report_bytes, tmp_path, monkeypatch):
+    path = tmp_path / "report.pdf"
+    path.write_bytes(report_bytes)
+    opened = []
+
+    class RecordingCache(PageTextCache):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            opened.append(self)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("worker died")
+
+    monkeypatch.setattr(make_abridged_pdf_v2, "PageTextCache", RecordingCache)
+    monkeypatch.setattr(make_abridged_pdf_v2, "page_texts", fail)
+    assert extract_titles_from_pdf(str(path), workers=2) == []
+    assert opened and opened[0].doc.is_closed
@@ -0,0 +1,88 @@
+import json
+
+from fake_genai import FakeClient
+from page_fingerprints import FingerprintIndex, analyze_pdf_incremental
+from synthetic_report import make_report
+
+
+def full_response(model, contents, config):
+    return json.dumps({section: {} for section in config.response_schema["properties"]})
+
+
+def null_response(model, contents, config):
+    return json.dumps({section: None for section in config.response_schema["properties"]})
+
+
+def report_bytes(title=""):
+    with make_report(num_pages=60) as doc:
+        doc.set_metadata({"title": title})  # same pages, different file
+        return doc.tobytes()
+
+
+def add(index, doc_hash, year, data=None):
+    index.add_report(doc_hash, "Acme", year, f"acme-{year}", {}, data or {"income_statement": {}})
+
+
+def test_previous_report_returns_the_latest_earlier_year(tmp_path):
+    with FingerprintIndex(str(tmp_path / "fp.db")) as index:
+        add(index, "a", 2021)
+        add(index, "b", 2023)
+        add(index, "c", None)
+        assert index.previous_report("Acme", 2024, "d")["doc_hash"] == "b"
+        assert index.previous_report("Acme", 2022, "d")["doc_hash"] == "a"
+        assert index.previous_report("Acme", 2021, "d") is None
+        assert index.previous_report("Acme", None, "d")["doc_hash"] == "c"  # stored last
+
+
+def test_unknown_year_reuses_the_report_stored_last(tmp_path):
+    client = FakeClient(latency=0.0, response_text=full_response)
+    with FingerprintIndex(str(tmp_path / "fp.db")) as index:
+        analyze_pdf_incremental(report_bytes("a"), client=client, label="acme-annual", index=index, company="Acme")
+        stats = {}
+        analyze_pdf_incremental(report_bytes("b"), client=client, label="acme-annual-new", index=index,
+                                company="Acme", stats=stats)
+        assert stats["reused_from"] == "acme-annual"
+        assert stats["reused_sections"]
+        assert {row[1] for row in index.reports()} == {None}  # never the year of the extracted data
+
+
+def test_explicit_year_is_used_for_lookup_and_storage(tmp_path):
+    client = FakeClient(latency=0.0, response_text=full_response)
+    with FingerprintIndex(str(tmp_path / "fp.db")) as index:
+        analyze_pdf_incremental(report_bytes("a"), client=client, label="acme-annual", index=index, company="Acme",
+                                year=2022)
+        stats = {}
+        analyze_pdf_incremental(report_bytes("b"), client=client, label="acme-annual-new", index=index,
+                                company="Acme", year=2023, stats=stats)
+        assert stats["reused_from"] == "acme-annual"
+        assert sorted(row[1] for row in index.reports()) == [2022, 2023]
+
+
+def test_unparsed_response_is_not_indexed(tmp_path):
+    pdf_bytes = report_bytes()
+    with FingerprintIndex(str(tmp_path / "fp.db")) as index:
+        analyze_pdf_incremental(pdf_bytes, client=FakeClient(latency=0.0, response_text="not json"),
+                                label="acme-2023", index=index, company="Acme")
+        assert index.reports() == []
+        analyze_pdf_incremental(pdf_bytes, client=FakeClient(latency=0.0, response_text=full_response),
+                                label="acme-2023", index=index, company="Acme")
+        assert [row[:3] for row in index.reports()] == [("Acme", 2023, "acme-2023")]
+
+
+def test_null_sections_are_not_reused(tmp_path):
+    client = FakeClient(latency=0.0, response_text=null_response)
+    with FingerprintIndex(str(tmp_path / "fp.db")) as index:
+        analyze_pdf_incremental(report_bytes("2021"), client=client, label="acme-2021", index=index, company="Acme")
+        stats = {}
+        analyze_pdf_incremental(report_bytes("2022"), client=client, label="acme-2022", index=index, company="Acme",
+                                stats=stats)
+        assert stats["reused_from"] == "acme-2021"
+        assert stats["reused_sections"] == []
+
+        client.response_text = full_response
+        analyze_pdf_incremental(report_bytes("2023"), client=client, label="acme-2023", index=index, company="Acme")
+        stats = {}
+        analyze_pdf_incremental(report_bytes("2024"), client=client, label="acme-2024", index=index, company="Acme",
+                                stats=stats)
+        assert stats["reused_from"] == "acme-2023"
+        assert stats["reused_sections"]
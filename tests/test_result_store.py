@@ -0,0 +1,20 @@
+import pytest
+
+from result_store import to_number
+
+
+@pytest.mark.parametrize("value, expected", [
+    (1234, 1234.0),
+    ("45,730,000", 45730000.0),
+    ("6.20%", 6.2),
+    ("RM 1.2", 1.2),
+    ("-12.5", -12.5),
+    ("(1,234)", -1234.0),
+    ("RM (1.2)", -1.2),
+    (" (6.20%) ", -6.2),
+    ("n/a", None),
+    (True, None),
+    (None, None),
+])
+def test_to_number(value, expected):
+    assert to_number(value) == expected
@@ -0,0 +1,49 @@
+import pytest
+
+import synthetic_report
+from make_abridged_pdf_v2 import abridge_pdf_bytes, build_matcher
+from toc_selection import select_pages_from_toc, toc_page_ranges
+
+
+@pytest.fixture(scope="module")
+def report():
+    doc = synthetic_report.make_report(num_pages=200, outline=True)
+    yield doc
+    doc.close()
+
+
+def test_toc_page_ranges_end_before_next_sibling():
+    toc = [[1, "A", 1], [2, "A.1", 2], [2, "A.2", 4], [1, "B", 6]]
+    assert toc_page_ranges(toc, 8) == [(1, "A", 0, 5, 0), (2, "A.1", 1, 3, 1), (2, "A.2", 3, 5, 2),
+                                       (1, "B", 5, 8, 3)]
+
+
+def test_short_childless_container_is_taken_whole(report):
+    toc = report.get_toc()
+    statements = next(entry for entry in toc_page_ranges(toc, len(report)) if entry[1] == "Financial Statements")
+    pages = select_pages_from_toc(toc, len(report), build_matcher())
+    assert pages is not None
+    assert set(range(statements[2], statements[3])) <= set(pages)
+
+
+def test_long_childless_container_falls_back(report):
+    toc = [entry for entry in report.get_toc() if entry[0] == 1]
+    assert select_pages_from_toc(toc, len(report), build_matcher()) is None
+
+
+def test_level_one_outline_uses_title_scan():
+    with synthetic_report.make_report(num_pages=300, outline=True) as doc:
+        doc.set_toc([entry for entry in doc.get_toc() if entry[0] == 1])
+        _, stats = abridge_pdf_bytes(doc.tobytes())
+    assert stats["selection"] == "scan"
+
+
+def test_sparse_outline_falls_back():
+    assert select_pages_from_toc([[1, "Financial Statements", 1]], 10, build_matcher()) is None
+
+
+def test_synthetic_report_uses_toc_selection(report):
+    _, stats = abridge_pdf_bytes(report.tobytes())
+    assert stats["selection"] == "toc"
+    assert not stats["fallback"]
+    assert stats["pages_after"] < stats["pages_before"]
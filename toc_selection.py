@@ -0,0 +1,83 @@
+MIN_TOC_ENTRIES = 8  # Outlines with fewer entries are too sparse to select from
+MIN_TOC_MATCHES = 2  # Fewer matching entries than this means the outline does not name our sections
+MAX_TOC_SECTION_PAGES = 30  # Longer matching entries are only used through their nested entries
+
+
+def toc_page_ranges(toc, num_pages):
+    """
+    Turns `doc.get_toc()` entries into page ranges.
+
+    Each entry runs from its own page up to the page before the next entry of the same
+    or a higher level (or the end of the document).
+
+    Returns:
+        list: (level, title, first_page, stop_page, entry_index) tuples with 0-based pages.
+    """
+    ranges = []
+    for i, entry in enumerate(toc):
+        level, title, page = entry[0], entry[1], entry[2]
+        if page < 1 or page > num_pages:
+            continue  # bookmark pointing outside the document
+        stop = num_pages
+        for later in toc[i + 1:]:
+            if later[0] <= level and later[2] >= page:
+                stop = max(later[2] - 1, page)
+                break
+        ranges.append((level, title, page - 1, stop, i))
+    return ranges
+
+
+def select_pages_from_toc(toc, num_pages, matcher, min_entries=MIN_TOC_ENTRIES, min_matches=MIN_TOC_MATCHES):
+    """
+    Selects pages from the PDF outline alone, without reading any page text.
+
+    An entry is taken when its title hits "possible" and not "exclude" in `matcher`.
+    Matching entries that are too long to take whole - the financial statements / notes
+    ("statement" hit) or anything over MAX_TOC_SECTION_PAGES - are containers: only the
+    entries nested in them that match, or that hit "finance" (segments, subsidiaries,
+    remuneration ...), are taken. A container with nothing selected inside it is taken as
+    its own page range when it is at most MAX_TOC_SECTION_PAGES long; a longer one means
+    the outline is too coarse, and None is returned.
+
+    Returns:
+        list: Sorted 0-based page numbers, or None when the outline is missing or too sparse
+              and the caller should fall back to the per-page title scan.
+    """
+    if not toc or len(toc) < min_entries:
+        return None
+
+    ranges = toc_page_ranges(toc, num_pages)
+    hits = {r[4]: matcher.match(r[1]) for r in ranges}
+
+    def wanted(r):
+        return "possible" in hits[r[4]] and "exclude" not in hits[r[4]]
+
+    def inside(r, container):
+        return r[0] > container[0] and container[2] <= r[2] < container[3] and r[4] > container[4]
+
+    containers = [r for r in ranges
+                  if wanted(r) and ("statement" in hits[r[4]] or r[3] - r[2] > MAX_TOC_SECTION_PAGES)]
+    filled = set()
+    pages = set()
+    matches = 0
+    for r in ranges:
+        if r in containers:
+            continue
+        parents = [c for c in containers if inside(r, c)]
+        if not (wanted(r) or (parents and "finance" in hits[r[4]])):
+            continue
+        pages.update(range(r[2], r[3]))
+        filled.update(c[4] for c in parents)
+        matches += 1
+
+    for c in containers:
+        if c[4] in filled:
+            continue
+        if c[3] - c[2] > MAX_TOC_SECTION_PAGES:
+            return None
+        pages.update(range(c[2], c[3]))
+        matches += 1
+
+    if matches < min_matches:
+        return None
+    return sorted(pages)